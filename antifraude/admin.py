@@ -5,7 +5,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.db.models import Count, Q
 from datetime import datetime, timedelta
-from .models import TransacaoRisco, RegraAntifraude, DecisaoAntifraude, BlacklistAntifraude, WhitelistAntifraude
+from .models import TransacaoRisco, RegraAntifraude, DecisaoAntifraude, BlacklistAntifraude, WhitelistAntifraude, BinCartao, CheckpointDetector, VinculoCpfEntidade, DetectorDeclarativo, RollupTransacao, AgregadoDecisaoHora, RegraAcionada
 
 
 @admin.register(TransacaoRisco)
@@ -184,3 +184,95 @@ class WhitelistAntifraudeAdmin(admin.ModelAdmin):
         updated = queryset.update(transacoes_aprovadas=0)
         self.message_user(request, f'{updated} contador(es) resetado(s).')
     resetar_contador.short_description = '🔄 Resetar contador de transações'
+
+
+
+@admin.register(BinCartao)
+class BinCartaoAdmin(admin.ModelAdmin):
+    list_display = ('bin', 'emissor', 'pais', 'bandeira', 'tipo_cartao', 'versao_3ds', 'updated_at')
+    list_filter = ('pais', 'tipo_cartao', 'versao_3ds')
+    search_fields = ('bin', 'emissor')
+    readonly_fields = ('created_at', 'updated_at')
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Processos recarregam a tabela em memória
+        from .services_3ds import TabelaBin
+        TabelaBin.publicar_versao()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        from .services_3ds import TabelaBin
+        TabelaBin.publicar_versao()
+
+
+@admin.register(CheckpointDetector)
+class CheckpointDetectorAdmin(admin.ModelAdmin):
+    list_display = ('detector', 'ultimo_id', 'ultima_execucao', 'linhas_processadas', 'deteccoes',
+                    'taxa_linhas_segundo', 'atraso_linhas', 'atraso_segundos')
+    readonly_fields = ('ultima_execucao', 'linhas_processadas', 'deteccoes', 'duracao_ms',
+                       'taxa_linhas_segundo', 'atraso_linhas', 'atraso_segundos', 'created_at', 'updated_at')
+
+
+@admin.register(VinculoCpfEntidade)
+class VinculoCpfEntidadeAdmin(admin.ModelAdmin):
+    list_display = ('cpf', 'tipo_entidade', 'hash_entidade', 'primeiro_uso', 'ultimo_uso', 'total')
+    list_filter = ('tipo_entidade',)
+    search_fields = ('cpf', 'hash_entidade')
+    readonly_fields = ('cpf', 'tipo_entidade', 'hash_entidade', 'primeiro_uso', 'ultimo_uso', 'total',
+                       'primeira_transacao_id')
+
+
+@admin.register(DetectorDeclarativo)
+class DetectorDeclarativoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'origem', 'agrupar_por', 'metrica', 'limite', 'janela_minutos', 'severidade', 'is_active')
+    list_filter = ('origem', 'metrica', 'is_active')
+    search_fields = ('nome', 'descricao')
+    readonly_fields = ('created_at', 'updated_at')
+    fieldsets = (
+        ('Identificação', {
+            'fields': ('nome', 'descricao', 'is_active')
+        }),
+        ('Consulta', {
+            'fields': ('origem', 'agrupar_por', 'metrica', 'limite', 'janela_minutos')
+        }),
+        ('Filtros', {
+            'fields': ('decisao', 'hora_inicio', 'hora_fim')
+        }),
+        ('Atividade', {
+            'fields': ('severidade', 'portal', 'rotulo_metrica')
+        }),
+        ('Auditoria', {
+            'fields': ('created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+
+@admin.register(RollupTransacao)
+class RollupTransacaoAdmin(admin.ModelAdmin):
+    list_display = ('granularidade', 'bucket', 'dimensao', 'valor_dimensao', 'transacoes', 'valor_total', 'reprovadas')
+    list_filter = ('granularidade', 'dimensao')
+    search_fields = ('valor_dimensao',)
+    date_hierarchy = 'bucket'
+    readonly_fields = ('granularidade', 'bucket', 'dimensao', 'valor_dimensao', 'transacoes', 'valor_total',
+                       'reprovadas', 'sketch_cpfs', 'sketch_ips')
+
+
+@admin.register(AgregadoDecisaoHora)
+class AgregadoDecisaoHoraAdmin(admin.ModelAdmin):
+    list_display = ('hora', 'aprovadas', 'reprovadas', 'revisao', 'pendentes', 'bloqueios_blacklist', 'tempo_max_ms', 'atualizado_em')
+    date_hierarchy = 'hora'
+    readonly_fields = ('hora', 'aprovadas', 'reprovadas', 'revisao', 'pendentes', 'bloqueios_blacklist',
+                       'score_soma', 'score_min', 'score_max', 'tempo_soma_ms', 'tempo_max_ms',
+                       'histograma_tempo', 'regras', 'atualizado_em')
+
+
+@admin.register(RegraAcionada)
+class RegraAcionadaAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'nome', 'tipo', 'acao', 'ajuste_score', 'decisao')
+    list_filter = ('tipo', 'acao')
+    search_fields = ('nome',)
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('decisao', 'regra')
+    readonly_fields = ('decisao', 'regra', 'nome', 'tipo', 'acao', 'ajuste_score', 'created_at')
@@ -8,3 +8,6 @@ class Antifraude(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'antifraude'
     verbose_name = 'Sistema Antifraude'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,441 @@
+"""
+Detectores declarativos: definição -> consulta agrupada
+
+Uma definição descreve o detector (agrupamento, métrica, janela, limite,
+severidade, portal) e DetectorCompilado a transforma em uma consulta
+agrupada por lote de linhas novas, usada como pré-filtro:
+
+    SELECT chave, métrica
+    FROM origem
+    WHERE chave IN (chaves do lote) AND data ENTRE (janela antes do lote, fim do lote)
+    GROUP BY chave HAVING métrica >= limite
+
+Esse intervalo pode chegar a duas janelas (lote de até uma janela + janela
+anterior), então só os grupos que passam no pré-filtro são avaliados
+exatamente: a métrica é recalculada na janela que termina em cada linha nova
+do grupo. Como as métricas só crescem com mais linhas, nenhum grupo que
+dispararia numa janela exata é descartado pelo pré-filtro.
+
+Detectores com filtro de decisão (ex: tentativas_falhas, REPROVADO) usam
+updated_at como data: a decisão pode ir a REPROVADO depois de criada
+(validação 3DS, revisão manual), quando o id já passou do checkpoint. A cada
+ciclo essas linhas são reavaliadas por consulta_alteradas().
+
+Os detectores padrão (login múltiplo, tentativas falhas, horário suspeito,
+velocidade) estão em DEFINICOES_PADRAO; linhas de DetectorDeclarativo com o
+mesmo nome substituem os parâmetros, e nomes novos viram detectores novos
+sem deploy. Campos, métricas e filtros vêm de listas fechadas, a janela é
+limitada e o lote já é limitado pelo checkpoint (DETECTOR_LOTE), então o
+custo de cada consulta é previsível.
+"""
+import logging
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Min, Q, Subquery, Sum
+
+logger = logging.getLogger('antifraude.detector')
+
+
+# Origem -> (modelo, campo de data, campos lógicos)
+ORIGENS = {
+    'TRANSACAO': ('TransacaoRisco', 'data_transacao', {
+        'cpf': 'cpf',
+        'ip': 'ip_address',
+        'dispositivo': 'device_fingerprint',
+        'valor': 'valor',
+    }),
+    'DECISAO': ('DecisaoAntifraude', 'created_at', {
+        'cpf': 'transacao__cpf',
+        'ip': 'transacao__ip_address',
+        'dispositivo': 'transacao__device_fingerprint',
+        'valor': 'transacao__valor',
+    }),
+}
+
+METRICAS = {
+    'CONTAGEM': lambda campos: Count('id'),
+    'IPS_DISTINTOS': lambda campos: Count(campos['ip'], distinct=True),
+    'CPFS_DISTINTOS': lambda campos: Count(campos['cpf'], distinct=True),
+    'DISPOSITIVOS_DISTINTOS': lambda campos: Count(campos['dispositivo'], distinct=True),
+    'VALOR_TOTAL': lambda campos: Sum(campos['valor']),
+}
+
+# Mesmas métricas sobre as linhas de uma janela (avaliação exata em Python)
+METRICAS_JANELA = {
+    'CONTAGEM': lambda linhas: len(linhas),
+    'IPS_DISTINTOS': lambda linhas: len({linha['ip'] for linha in linhas} - {None}),
+    'CPFS_DISTINTOS': lambda linhas: len({linha['cpf'] for linha in linhas} - {None}),
+    'DISPOSITIVOS_DISTINTOS': lambda linhas: len({linha['dispositivo'] for linha in linhas} - {None}),
+    'VALOR_TOTAL': lambda linhas: sum(linha['valor'] or 0 for linha in linhas),
+}
+
+DECISOES = ('APROVADO', 'REPROVADO', 'REVISAO', 'PENDENTE')
+
+# Detectores com lógica própria em tasks.py (não podem ser redefinidos)
+NOMES_RESERVADOS = {'ip_novo'}
+
+DEFINICOES_PADRAO = [
+    {
+        'nome': 'login_multiplo',
+        'origem': 'TRANSACAO',
+        'agrupar_por': 'cpf',
+        'metrica': 'IPS_DISTINTOS',
+        'limite': 3,
+        'janela_minutos': 10,
+        'severidade': 4,
+        'portal': 'app',
+        'rotulo_metrica': 'total_ips',
+    },
+    {
+        'nome': 'tentativas_falhas',
+        'origem': 'DECISAO',
+        'decisao': 'REPROVADO',
+        'agrupar_por': 'ip',
+        'metrica': 'CONTAGEM',
+        'limite': 5,
+        'janela_minutos': 5,
+        'severidade': 5,
+        'portal': 'web',
+        'rotulo_metrica': 'total_reprovadas',
+    },
+    {
+        'nome': 'horario_suspeito',
+        'origem': 'TRANSACAO',
+        'agrupar_por': 'cpf',
+        'metrica': 'CONTAGEM',
+        'limite': 1,
+        'janela_minutos': 5,
+        'hora_inicio': 2,
+        'hora_fim': 5,
+        'severidade': 2,
+        'portal': 'app',
+        'rotulo_metrica': 'total_transacoes',
+    },
+    {
+        'nome': 'velocidade_transacao',
+        'origem': 'TRANSACAO',
+        'agrupar_por': 'cpf',
+        'metrica': 'CONTAGEM',
+        'limite': 10,
+        'janela_minutos': 5,
+        'severidade': 4,
+        'portal': 'app',
+        'rotulo_metrica': 'total_transacoes',
+    },
+]
+
+
+class DetectorCompilado:
+    """
+    Definição validada e pronta para rodar como processar_lote(de_id, ate_id)
+
+    Raises:
+        ValueError: Definição inválida (campo, métrica ou filtro fora das listas)
+    """
+
+    def __init__(self, definicao: dict):
+        from . import models
+        from .models_config import ConfiguracaoAntifraude
+
+        self.definicao = definicao
+        self.nome = definicao.get('nome') or ''
+        if not re.fullmatch(r'[a-z0-9_]{1,30}', self.nome):
+            raise ValueError(f"Nome inválido: '{self.nome}' (use a-z, 0-9 e _, até 30 caracteres)")
+        if self.nome in NOMES_RESERVADOS:
+            raise ValueError(f"Nome reservado: {self.nome}")
+
+        origem = definicao.get('origem', 'TRANSACAO')
+        if origem not in ORIGENS:
+            raise ValueError(f"Origem inválida: {origem}")
+        nome_modelo, self.campo_data, self.campos = ORIGENS[origem]
+        self.modelo = getattr(models, nome_modelo)
+
+        self.agrupar_por = definicao.get('agrupar_por', 'cpf')
+        if self.agrupar_por not in ('cpf', 'ip', 'dispositivo'):
+            raise ValueError(f"Agrupamento inválido: {self.agrupar_por}")
+        self.chave = self.campos[self.agrupar_por]
+
+        self.metrica = definicao.get('metrica', 'CONTAGEM')
+        if self.metrica not in METRICAS:
+            raise ValueError(f"Métrica inválida: {self.metrica}")
+
+        try:
+            self.limite = Decimal(str(definicao['limite']))
+        except Exception:
+            raise ValueError(f"Limite inválido: {definicao.get('limite')}")
+        if self.limite <= 0:
+            raise ValueError("Limite deve ser maior que zero")
+
+        janela_maxima = ConfiguracaoAntifraude.get_config('DETECTOR_JANELA_MAXIMA_MINUTOS', 1440)
+        self.janela_minutos = int(definicao.get('janela_minutos') or 0)
+        if not 1 <= self.janela_minutos <= janela_maxima:
+            raise ValueError(f"Janela deve estar entre 1 e {janela_maxima} minutos")
+
+        self.decisao = definicao.get('decisao')
+        if self.decisao and (origem != 'DECISAO' or self.decisao not in DECISOES):
+            raise ValueError(f"Filtro de decisão inválido: {self.decisao}")
+        if self.decisao:
+            # Decisões mudam de estado depois de criadas (3DS, revisão): a janela
+            # conta de quando entraram no estado (ver consulta_alteradas)
+            self.campo_data = 'updated_at'
+
+        self.hora_inicio = definicao.get('hora_inicio')
+        self.hora_fim = definicao.get('hora_fim')
+        if (self.hora_inicio is None) != (self.hora_fim is None):
+            raise ValueError("Informe hora_inicio e hora_fim juntos")
+        if self.hora_inicio is not None and not 0 <= self.hora_inicio < self.hora_fim <= 24:
+            raise ValueError("Faixa de horas inválida (0 <= hora_inicio < hora_fim <= 24)")
+
+        self.severidade = int(definicao.get('severidade', 3))
+        if not 1 <= self.severidade <= 5:
+            raise ValueError("Severidade deve estar entre 1 e 5")
+
+        self.portal = definicao.get('portal') or 'app'
+        self.rotulo_metrica = definicao.get('rotulo_metrica')
+        self.descricao = definicao.get('descricao') or ''
+
+    @property
+    def rastreia_alteracoes(self):
+        """Filtra por estado da decisão: precisa rever linhas abaixo do checkpoint (alteradas)"""
+        return bool(self.decisao)
+
+    @property
+    def deduplicacao(self):
+        """(campos, janela) de registrar_atividades: atividade por chave agrupada"""
+        campos = {'cpf': ('cpf',), 'ip': ('ip',), 'dispositivo': ('cpf', 'ip')}[self.agrupar_por]
+        return campos, self.janela_minutos
+
+    def _filtros(self):
+        filtros = {f'{self.chave}__isnull': False}
+        if self.decisao:
+            filtros['decisao'] = self.decisao
+        if self.hora_inicio is not None:
+            filtros[f'{self.campo_data}__hour__gte'] = self.hora_inicio
+            filtros[f'{self.campo_data}__hour__lt'] = self.hora_fim
+        return filtros
+
+    def consulta(self, de_id, ate_id):
+        """
+        Grupos do lote (de_id, ate_id] que atingem o limite em alguma janela
+
+        Cada grupo é avaliado na janela [data - janela_minutos, data] de cada
+        linha nova (contando linhas até ate_id) e reportado pela janela de
+        maior métrica (empate: a mais antiga).
+
+        Returns:
+            list: dicts com chave, valor_metrica, ips, cpfs, valor_total e
+            primeira_ocorrencia da janela; None se o lote não tem linhas do detector
+        """
+        novas = self.modelo.objects.filter(id__gt=de_id, id__lte=ate_id, **self._filtros())
+        return self._avaliar(novas, ate_id, lambda linha: linha['id'] > de_id)
+
+    def consulta_alteradas(self, desde, ate, ate_id, margem_segundos=0):
+        """
+        Como consulta(), para linhas já processadas (id <= ate_id) que entraram
+        no filtro de decisão depois de criadas: updated_at em (desde, ate] e
+        mais de margem_segundos após created_at (as criadas já no estado
+        foram vistas pelo lote de id)
+        """
+        novas = self.modelo.objects.filter(
+            Q(updated_at__gt=desde) & Q(updated_at__gt=F('created_at') + timedelta(seconds=margem_segundos)),
+            id__lte=ate_id,
+            updated_at__lte=ate,
+            **self._filtros()
+        )
+        ids = set(novas.values_list('id', flat=True))
+        return self._avaliar(novas, ate_id, lambda linha: linha['id'] in ids)
+
+    def _avaliar(self, novas, ate_id, eh_nova):
+        from .models_config import ConfiguracaoAntifraude
+
+        limites = novas.aggregate(inicio=Min(self.campo_data), fim=Max(self.campo_data))
+        if limites['inicio'] is None:
+            return None
+
+        janela = timedelta(minutes=self.janela_minutos)
+        na_intervalo = self.modelo.objects.filter(
+            id__lte=ate_id,
+            **self._filtros(),
+            **{
+                f'{self.campo_data}__gte': limites['inicio'] - janela,
+                f'{self.campo_data}__lte': limites['fim'],
+            }
+        )
+
+        # Pré-filtro: limite atingido no intervalo inteiro (até duas janelas).
+        # Paginado por chave em DETECTOR_MAX_GRUPOS grupos: o checkpoint avança o
+        # lote inteiro, então nenhum grupo pode ficar de fora
+        pre_filtro = na_intervalo.filter(
+            **{f'{self.chave}__in': Subquery(novas.values(self.chave))}
+        ).values(self.chave).annotate(
+            valor_metrica=METRICAS[self.metrica](self.campos)
+        ).filter(valor_metrica__gte=self.limite).order_by(self.chave).values_list(self.chave, flat=True)
+        por_pagina = max(1, int(ConfiguracaoAntifraude.get_config('DETECTOR_MAX_GRUPOS', 1000)))
+
+        grupos = []
+        paginas = 0
+        ultima_chave = None
+        while True:
+            pagina = pre_filtro if ultima_chave is None else pre_filtro.filter(**{f'{self.chave}__gt': ultima_chave})
+            chaves = list(pagina[:por_pagina])
+            if not chaves:
+                break
+            paginas += 1
+            grupos.extend(self._avaliar_chaves(na_intervalo, chaves, janela, eh_nova))
+            if len(chaves) < por_pagina:
+                break
+            ultima_chave = chaves[-1]
+
+        if paginas > 1:
+            logger.warning(
+                f"⚠️ Detector {self.nome}: lote com mais de {por_pagina} grupos (DETECTOR_MAX_GRUPOS), "
+                f"avaliado em {paginas} páginas"
+            )
+
+        return grupos
+
+    def _avaliar_chaves(self, na_intervalo, chaves, janela, eh_nova):
+        """Avaliação exata, janela a janela, só das linhas dos grupos pré-filtrados"""
+        linhas_por_chave = {}
+        for linha in na_intervalo.filter(**{f'{self.chave}__in': chaves}).order_by(self.campo_data, 'id').values(
+            'id', self.campo_data, *self.campos.values()
+        ):
+            logica = {campo: linha[coluna] for campo, coluna in self.campos.items()}
+            logica['id'], logica['data'] = linha['id'], linha[self.campo_data]
+            linhas_por_chave.setdefault(logica[self.agrupar_por], []).append(logica)
+
+        grupos = []
+        for chave, linhas in linhas_por_chave.items():
+            melhor = None
+            inicio_janela = 0
+            for fim_janela, linha in enumerate(linhas):
+                while linhas[inicio_janela]['data'] < linha['data'] - janela:
+                    inicio_janela += 1
+                if not eh_nova(linha):
+                    continue  # Janelas que terminam em linhas antigas já foram avaliadas
+                na_janela = linhas[inicio_janela:fim_janela + 1]
+                valor_metrica = METRICAS_JANELA[self.metrica](na_janela)
+                if valor_metrica >= self.limite and (melhor is None or valor_metrica > melhor[0]):
+                    melhor = (valor_metrica, na_janela)
+
+            if melhor:
+                valor_metrica, na_janela = melhor
+                grupos.append({
+                    self.chave: chave,
+                    'valor_metrica': valor_metrica,
+                    'ips': list(dict.fromkeys(l['ip'] for l in na_janela if l['ip'] is not None)),
+                    'cpfs': list(dict.fromkeys(l['cpf'] for l in na_janela if l['cpf'] is not None)),
+                    'valor_total': sum(l['valor'] or 0 for l in na_janela),
+                    'primeira_ocorrencia': na_janela[0]['data']
+                })
+
+        return grupos
+
+    def __call__(self, de_id, ate_id):
+        """processar_lote: lista de AtividadeSuspeita candidatas do lote"""
+        return self._atividades(self.consulta(de_id, ate_id))
+
+    def alteradas(self, desde, ate, ate_id, margem_segundos=0):
+        """AtividadeSuspeita candidatas das linhas que entraram no estado depois de criadas"""
+        return self._atividades(self.consulta_alteradas(desde, ate, ate_id, margem_segundos))
+
+    def _atividades(self, grupos):
+        from .models import AtividadeSuspeita
+
+        if grupos is None:
+            return []
+
+        atividades = []
+        for grupo in grupos:
+            ips = grupo['ips']
+            cpfs = grupo['cpfs']
+            valor = grupo['valor_metrica']
+            valor = int(valor) if valor == int(valor) else str(valor)
+
+            detalhes = {
+                'detector': self.nome,
+                'metrica': self.metrica,
+                'valor_metrica': valor,
+                'limite': int(self.limite) if self.limite == int(self.limite) else str(self.limite),
+                'valor_total': str(grupo['valor_total']),
+                'primeira_ocorrencia': grupo['primeira_ocorrencia'].isoformat(),
+                'janela_tempo_minutos': self.janela_minutos
+            }
+            if self.rotulo_metrica:
+                detalhes[self.rotulo_metrica] = valor
+            if self.agrupar_por != 'ip':
+                detalhes['ips_usados'] = ips
+            if self.agrupar_por != 'cpf':
+                detalhes['cpfs_tentados'] = cpfs[:10]
+            if self.agrupar_por == 'dispositivo':
+                detalhes['dispositivo'] = grupo[self.chave]
+            if self.hora_inicio is not None:
+                detalhes['horario'] = grupo['primeira_ocorrencia'].strftime('%H:%M:%S')
+
+            atividades.append(AtividadeSuspeita(
+                tipo=self.nome,
+                cpf=grupo[self.chave] if self.agrupar_por == 'cpf' else (cpfs[0] if cpfs else 'desconhecido'),
+                ip=grupo[self.chave] if self.agrupar_por == 'ip' else (ips[0] if ips else 'desconhecido'),
+                portal=self.portal,
+                detalhes=detalhes,
+                severidade=self.severidade,
+                status='pendente'
+            ))
+
+        return atividades
+
+
+# Snapshot por processo dos detectores compilados (recarregado a cada SNAPSHOT_TTL_SEGUNDOS)
+SNAPSHOT_TTL_SEGUNDOS = 30
+_snapshot = None
+_snapshot_em = 0.0
+
+
+def carregar_definicoes():
+    """
+    Definições ativas por nome: DEFINICOES_PADRAO sobrescritas por DetectorDeclarativo
+
+    Returns:
+        dict: {nome: definição}
+    """
+    from .models import DetectorDeclarativo
+
+    definicoes = {definicao['nome']: definicao for definicao in DEFINICOES_PADRAO}
+    try:
+        for detector in DetectorDeclarativo.objects.all():
+            if detector.is_active:
+                definicoes[detector.nome] = detector.como_definicao()
+            else:
+                definicoes.pop(detector.nome, None)
+    except Exception as e:
+        logger.error(f"Erro ao carregar detectores declarativos, usando os padrão: {str(e)}")
+    return definicoes
+
+
+def detectores_compilados():
+    """
+    Detectores declarativos ativos e válidos
+
+    Returns:
+        dict: {nome: DetectorCompilado}
+    """
+    global _snapshot, _snapshot_em
+
+    agora = time.monotonic()
+    if _snapshot is None or agora - _snapshot_em > SNAPSHOT_TTL_SEGUNDOS:
+        compilados = {}
+        for nome, definicao in carregar_definicoes().items():
+            try:
+                compilados[nome] = DetectorCompilado(definicao)
+            except ValueError as e:
+                logger.error(f"❌ Detector declarativo {nome} inválido, ignorado: {str(e)}")
+        _snapshot, _snapshot_em = compilados, agora
+    return _snapshot
+
+
+def invalidar_definicoes():
+    global _snapshot
+    _snapshot = None
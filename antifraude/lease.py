@@ -0,0 +1,222 @@
+"""
+Lease distribuído: execução única de tasks periódicas entre workers
+
+Com vários workers Celery (ou uma execução que passa do intervalo do beat),
+a mesma task periódica pode rodar duas vezes ao mesmo tempo, duplicando
+detecções e carga no banco.
+
+Lease(nome) é um lock no Redis (SET NX EX) com TTL curto e renovado por uma
+thread enquanto o trabalho roda:
+- Quem não obtém o lease pula a execução (já existe uma em andamento).
+- Worker que morre libera o lease sozinho quando o TTL expira.
+- Renovação e liberação comparam o dono e agem no mesmo script Lua (atômico):
+  um lease que expirou e foi pego por outro worker nunca é estendido nem
+  apagado por quem o perdeu. Renovação que encontra outro dono marca o lease
+  como perdido, e os laços em lote (tasks.py) param no lote seguinte.
+- Redis fora: segue sem coordenação (fail-open), como o resto do sistema.
+
+Métricas por lease (executadas, puladas, renovacoes, perdidas, sem_redis)
+ficam em contadores no cache, visíveis para todos os workers.
+"""
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger('antifraude.lease')
+
+METRICAS = ('executadas', 'puladas', 'renovacoes', 'perdidas', 'sem_redis')
+
+# Estende o TTL só se o valor ainda for o nosso (compare-and-expire)
+LUA_RENOVAR = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Apaga só se o valor ainda for o nosso (compare-and-delete)
+LUA_LIBERAR = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _conexao():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+class Lease:
+    """
+    Lease renovável por nome
+
+    Uso:
+        with Lease('deteccao:ip_novo') as lease:
+            if not lease.adquirido:
+                return  # outra execução em andamento
+            ...
+
+    Args:
+        nome: Identifica o trabalho protegido (ex: 'bloquear_automatico_critico')
+        duracao_segundos: TTL do lease; sem renovação, expira nesse tempo
+        intervalo_renovacao_segundos: Padrão: um terço da duração
+    """
+
+    PREFIXO = 'lease'
+
+    def __init__(self, nome: str, duracao_segundos: int = 60, intervalo_renovacao_segundos: Optional[float] = None):
+        self.nome = nome
+        self.duracao_segundos = duracao_segundos
+        self.intervalo_renovacao_segundos = intervalo_renovacao_segundos or duracao_segundos / 3
+        self.dono = uuid.uuid4().hex
+        self._valor = None
+        self.adquirido = False
+        self.perdido = False
+        self._coordenado = True
+        self._parar = threading.Event()
+        self._renovador = None
+
+    @property
+    def chave(self) -> str:
+        # Mesmo namespace (prefixo/versão) das chaves do cache
+        return cache.make_key(f"{self.PREFIXO}:{self.nome}")
+
+    def adquirir(self) -> bool:
+        """Tenta obter o lease; True também quando o Redis está indisponível"""
+        # JSON com o dono: o valor inteiro é o que os scripts Lua comparam
+        self._valor = json.dumps({
+            'dono': self.dono,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'desde': datetime.now().isoformat()
+        })
+        try:
+            self.adquirido = bool(_conexao().set(self.chave, self._valor, nx=True, ex=self.duracao_segundos))
+        except Exception as e:
+            logger.warning(f"[{self.nome}] Lease indisponível, executando sem coordenação: {str(e)}")
+            self.adquirido = True
+            self._coordenado = False
+            registrar_metrica(self.nome, 'sem_redis')
+            return True
+
+        if self.adquirido:
+            self._iniciar_renovacao()
+        return self.adquirido
+
+    def titular(self) -> Optional[dict]:
+        """Quem detém o lease agora (host, pid, desde), ou None"""
+        try:
+            valor = _conexao().get(self.chave)
+            return json.loads(valor) if valor else None
+        except Exception:
+            return None
+
+    def renovar(self) -> bool:
+        """Estende o TTL se o lease ainda for nosso; False = perdido"""
+        try:
+            renovado = _conexao().eval(LUA_RENOVAR, 1, self.chave, self._valor, self.duracao_segundos)
+            if not renovado:
+                if not self.perdido:
+                    self.perdido = True
+                    registrar_metrica(self.nome, 'perdidas')
+                    logger.error(f"[{self.nome}] Lease perdido durante a execução (titular: {self.titular()})")
+                return False
+            registrar_metrica(self.nome, 'renovacoes')
+            return True
+        except Exception as e:
+            # Falha transitória do Redis: tenta de novo no próximo ciclo
+            logger.warning(f"[{self.nome}] Erro ao renovar lease: {str(e)}")
+            return True
+
+    def liberar(self):
+        self._parar.set()
+        if self._renovador is not None:
+            self._renovador.join(timeout=1)
+
+        if not self.adquirido or not self._coordenado:
+            return
+        try:
+            _conexao().eval(LUA_LIBERAR, 1, self.chave, self._valor)
+        except Exception:
+            pass  # Expira sozinho
+
+    def _iniciar_renovacao(self):
+        def renovar_periodicamente():
+            while not self._parar.wait(self.intervalo_renovacao_segundos):
+                if not self.renovar():
+                    return
+
+        self._renovador = threading.Thread(
+            target=renovar_periodicamente, name=f'lease-{self.nome}', daemon=True
+        )
+        self._renovador.start()
+
+    def __enter__(self):
+        self.adquirir()
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+        return False
+
+
+def registrar_metrica(nome: str, evento: str):
+    """Incrementa o contador compartilhado do lease (fail-open)"""
+    chave = f"{Lease.PREFIXO}:metricas:{nome}:{evento}"
+    try:
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
+    except Exception:
+        pass
+
+
+def metricas(nome: str) -> dict:
+    """Contadores do lease e titular atual"""
+    chaves = {evento: f"{Lease.PREFIXO}:metricas:{nome}:{evento}" for evento in METRICAS}
+    try:
+        valores = cache.get_many(list(chaves.values()))
+    except Exception:
+        valores = {}
+    resultado = {evento: valores.get(chave, 0) for evento, chave in chaves.items()}
+    resultado['titular'] = Lease(nome).titular()
+    return resultado
+
+
+def tarefa_unica(nome: Optional[str] = None, duracao_segundos: int = 60):
+    """
+    Decorator para tasks periódicas: pula a execução se outra estiver em andamento
+
+    Aplicar abaixo do @shared_task (o nome da task continua o da função).
+
+    Args:
+        nome: Nome do lease (padrão: nome da função)
+        duracao_segundos: TTL do lease (renovado enquanto a task roda)
+    """
+    def decorator(funcao):
+        nome_lease = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            with Lease(nome_lease, duracao_segundos) as lease:
+                if not lease.adquirido:
+                    titular = lease.titular()
+                    registrar_metrica(nome_lease, 'puladas')
+                    logger.info(f"⏭️ {nome_lease} já em execução ({titular}), pulando")
+                    return {'success': True, 'pulada': True, 'motivo': 'em_execucao', 'titular': titular}
+
+                registrar_metrica(nome_lease, 'executadas')
+                return funcao(*args, **kwargs)
+
+        return executar
+
+    return decorator
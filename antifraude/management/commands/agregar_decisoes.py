@@ -0,0 +1,50 @@
+"""
+Recalcula os agregados por hora das decisões (AgregadoDecisaoHora) do histórico
+
+A task agregar_decisoes_hora mantém as últimas horas e as horas de decisões
+alteradas (updated_at) desde a execução anterior; use este comando no deploy
+para os períodos do dashboard, ou após alterações que não passam por save()
+(queryset.update, SQL direto). Cada hora é recalculada do zero, então pode
+ser repetido.
+
+Uso:
+    python manage.py agregar_decisoes --dias 30
+    python manage.py agregar_decisoes --dias 90 --pausa-ms 100
+"""
+from datetime import datetime, timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from antifraude.services_dashboard import DashboardService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os agregados por hora das decisões usados pelo dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30, help='Dias de histórico a recalcular')
+        parser.add_argument('--pausa-ms', type=int, default=0, help='Pausa entre horas (alivia o banco)')
+
+    def handle(self, *args, **options):
+        fim = DashboardService.inicio_hora(datetime.now())
+        hora = fim - timedelta(days=options['dias'])
+        self.stdout.write(f"▶️ Agregando decisões de {hora:%Y-%m-%d %H}h a {fim:%Y-%m-%d %H}h")
+
+        inicio = time.perf_counter()
+        horas = 0
+        decisoes = 0
+
+        while hora <= fim:
+            agregado = DashboardService.agregar_hora(hora)
+            horas += 1
+            decisoes += agregado.total
+
+            if hora.hour == 0:
+                self.stdout.write(f"   {hora:%Y-%m-%d}: {decisoes} decisões até aqui ({time.perf_counter() - inicio:.0f}s)")
+
+            if options['pausa_ms']:
+                time.sleep(options['pausa_ms'] / 1000)
+            hora += timedelta(hours=1)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {horas} horas agregadas ({decisoes} decisões)"))
@@ -0,0 +1,91 @@
+"""
+Atualiza a tabela local de BINs (antifraude_bin_cartao) a partir de um CSV
+
+Colunas esperadas (cabeçalho obrigatório):
+    bin,emissor,pais,bandeira,tipo_cartao,versao_3ds
+
+versao_3ds vazio = BIN sem suporte a 3DS.
+
+Uso:
+    python manage.py atualizar_tabela_bin --arquivo bins.csv
+    python manage.py atualizar_tabela_bin --arquivo bins.csv --substituir
+"""
+import csv
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from antifraude.models import BinCartao
+from antifraude.services_3ds import Auth3DSService, TabelaBin
+
+
+CAMPOS = ('emissor', 'pais', 'bandeira', 'tipo_cartao', 'versao_3ds')
+
+
+class Command(BaseCommand):
+    help = 'Atualiza tabela local de BINs (emissor, país, tipo, versão 3DS) a partir de CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', required=True, help='Caminho do CSV')
+        parser.add_argument('--substituir', action='store_true', help='Remove BINs ausentes no arquivo')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas mostra o que seria alterado')
+
+    def handle(self, *args, **options):
+        novos = self._ler_csv(options['arquivo'])
+        existentes = {b.bin: b for b in BinCartao.objects.all()}
+
+        criar = []
+        atualizar = []
+        for bin_cartao, dados in novos.items():
+            atual = existentes.get(bin_cartao)
+            if atual is None:
+                criar.append(BinCartao(bin=bin_cartao, **dados))
+            elif any(getattr(atual, campo) != dados[campo] for campo in CAMPOS):
+                for campo in CAMPOS:
+                    setattr(atual, campo, dados[campo])
+                atualizar.append(atual)
+
+        remover = [b for b in existentes if b not in novos] if options['substituir'] else []
+
+        self.stdout.write(
+            f"📄 {len(novos)} BINs no arquivo: {len(criar)} novos, {len(atualizar)} alterados, {len(remover)} removidos"
+        )
+
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            BinCartao.objects.bulk_create(criar, batch_size=1000)
+            BinCartao.objects.bulk_update(atualizar, CAMPOS, batch_size=1000)
+            if remover:
+                BinCartao.objects.filter(bin__in=remover).delete()
+
+        # Elegibilidade cacheada de BINs alterados/removidos deixa de valer
+        alterados = [b.bin for b in atualizar] + remover
+        if alterados:
+            cache.delete_many([f"{Auth3DSService.CACHE_PREFIXO}:{b}" for b in alterados])
+
+        TabelaBin.publicar_versao()
+        self.stdout.write(self.style.SUCCESS('✅ Tabela BIN atualizada (processos recarregam em até 1 min)'))
+
+    def _ler_csv(self, caminho):
+        try:
+            with open(caminho, newline='', encoding='utf-8') as arquivo:
+                leitor = csv.DictReader(arquivo)
+                if 'bin' not in (leitor.fieldnames or []):
+                    raise CommandError('CSV sem coluna "bin"')
+
+                bins = {}
+                for numero, linha in enumerate(leitor, start=2):
+                    bin_cartao = (linha.get('bin') or '').strip()
+                    if not bin_cartao.isdigit() or len(bin_cartao) not in (6, 8):
+                        self.stderr.write(f"⚠️ Linha {numero} ignorada: BIN inválido '{bin_cartao}'")
+                        continue
+                    bins[bin_cartao] = {
+                        campo: (linha.get(campo) or '').strip() or None
+                        for campo in CAMPOS
+                    }
+                return bins
+        except OSError as e:
+            raise CommandError(f'Erro ao ler {caminho}: {e}')
@@ -0,0 +1,84 @@
+"""
+Preenche RegraAcionada a partir do regras_acionadas (JSON) das decisões existentes
+
+Processa por faixas de id de DecisaoAntifraude; em cada faixa apaga as linhas
+das decisões e grava de novo com bulk_create, então reprocessar uma faixa (ou
+cruzar com decisões já gravadas pelo signal) não duplica acionamentos. O
+progresso fica em CheckpointDetector('backfill_regras_acionadas'), então o
+comando pode ser interrompido e retomado.
+
+Entradas antigas não têm regra_id: a regra interna é resolvida pelo nome
+(RegraAntifraude.nome é único); regras renomeadas ou apagadas ficam sem regra.
+
+Uso:
+    python manage.py backfill_regras_acionadas
+    python manage.py backfill_regras_acionadas --lote 5000 --pausa-ms 200
+    python manage.py backfill_regras_acionadas --reiniciar --ate-id 123456
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from antifraude.models import CheckpointDetector, DecisaoAntifraude, RegraAcionada, RegraAntifraude
+
+
+CHECKPOINT = 'backfill_regras_acionadas'
+
+
+class Command(BaseCommand):
+    help = 'Preenche a tabela de regras acionadas a partir do JSON das decisões'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Ids de decisão por faixa')
+        parser.add_argument('--ate-id', type=int, help='Último id a processar (padrão: maior id atual)')
+        parser.add_argument('--pausa-ms', type=int, default=0, help='Pausa entre faixas (alivia o banco)')
+        parser.add_argument('--reiniciar', action='store_true', help='Recomeça do primeiro id')
+
+    def handle(self, *args, **options):
+        checkpoint, _ = CheckpointDetector.objects.get_or_create(detector=CHECKPOINT, defaults={'ultimo_id': 0})
+
+        if options['reiniciar']:
+            checkpoint.ultimo_id = 0
+            checkpoint.save(update_fields=['ultimo_id', 'updated_at'])
+
+        regras_por_nome = dict(RegraAntifraude.objects.values_list('nome', 'id'))
+        ate_id = options['ate_id'] or DecisaoAntifraude.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        self.stdout.write(f"▶️ Backfill de regras acionadas: ids {checkpoint.ultimo_id + 1} a {ate_id} (lote {options['lote']})")
+
+        inicio = time.perf_counter()
+        total_decisoes = 0
+        total_linhas = 0
+
+        while checkpoint.ultimo_id < ate_id:
+            de_id = checkpoint.ultimo_id
+            fim_faixa = min(de_id + options['lote'], ate_id)
+
+            decisoes = list(DecisaoAntifraude.objects.filter(
+                id__gt=de_id, id__lte=fim_faixa
+            ).only('id', 'decisao', 'regras_acionadas', 'created_at').order_by())
+
+            linhas = []
+            for decisao in decisoes:
+                linhas.extend(RegraAcionada.linhas_da_decisao(decisao, regras_por_nome))
+
+            with transaction.atomic():
+                RegraAcionada.objects.filter(decisao_id__gt=de_id, decisao_id__lte=fim_faixa).delete()
+                RegraAcionada.objects.bulk_create(linhas, batch_size=1000)
+                checkpoint.avancar(fim_faixa)
+
+            total_decisoes += len(decisoes)
+            total_linhas += len(linhas)
+            decorrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f"   até id {fim_faixa}: {len(decisoes)} decisões, {len(linhas)} acionamentos "
+                f"({total_decisoes} decisões no total, {decorrido:.0f}s)"
+            )
+
+            if options['pausa_ms']:
+                time.sleep(options['pausa_ms'] / 1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Backfill concluído até id {checkpoint.ultimo_id}: {total_linhas} acionamentos gravados"
+        ))
@@ -0,0 +1,105 @@
+"""
+Preenche RollupTransacao (agregados por minuto/hora) a partir do histórico de TransacaoRisco
+
+Processa por faixas de id, soma as linhas de cada faixa em memória e grava
+com upsert; o progresso fica em CheckpointDetector('backfill_rollups'), então
+o comando pode ser interrompido e retomado.
+
+Transações e reprovações inseridas depois do deploy já são registradas pelos
+signals: use --ate-id com o último id anterior ao deploy para não somá-las
+duas vezes. --reiniciar apaga a tabela inteira e reconstrói até o maior id
+atual (não aceita --ate-id). --desde limita o histórico (rollups por minuto
+só servem para as janelas curtas das regras; os por hora, para o dashboard).
+
+Uso:
+    python manage.py backfill_rollups --ate-id 123456 --desde 2025-07-01
+    python manage.py backfill_rollups --lote 20000 --pausa-ms 200
+    python manage.py backfill_rollups --reiniciar --desde 2025-07-01
+"""
+from collections import Counter
+from datetime import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from antifraude.models import CheckpointDetector, DecisaoAntifraude, RollupTransacao, TransacaoRisco
+from antifraude.services_rollup import RollupService
+
+
+CHECKPOINT = 'backfill_rollups'
+
+
+class Command(BaseCommand):
+    help = 'Preenche os rollups por minuto/hora a partir do histórico de transações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=10000, help='Ids de transação por faixa')
+        parser.add_argument('--ate-id', type=int, help='Último id a processar (padrão: maior id atual)')
+        parser.add_argument('--desde', help='Ignora transações anteriores a esta data (AAAA-MM-DD)')
+        parser.add_argument('--pausa-ms', type=int, default=0, help='Pausa entre faixas (alivia o banco)')
+        parser.add_argument('--reiniciar', action='store_true', help='Apaga os rollups e recomeça do zero')
+
+    def handle(self, *args, **options):
+        checkpoint, _ = CheckpointDetector.objects.get_or_create(detector=CHECKPOINT, defaults={'ultimo_id': 0})
+
+        if options['reiniciar']:
+            # A tabela inteira é apagada, inclusive o que os signals gravaram desde o
+            # deploy: a reconstrução precisa ir até o maior id atual
+            if options['ate_id']:
+                raise CommandError('--reiniciar reconstrói até o maior id atual; não use com --ate-id')
+            RollupTransacao.objects.all().delete()
+            checkpoint.ultimo_id = 0
+            checkpoint.save(update_fields=['ultimo_id', 'updated_at'])
+
+        desde = datetime.strptime(options['desde'], '%Y-%m-%d') if options['desde'] else None
+        ate_id = options['ate_id'] or TransacaoRisco.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        self.stdout.write(f"▶️ Backfill de rollups: ids {checkpoint.ultimo_id + 1} a {ate_id} (lote {options['lote']})")
+
+        inicio = time.perf_counter()
+        total_transacoes = 0
+
+        while checkpoint.ultimo_id < ate_id:
+            de_id = checkpoint.ultimo_id
+            fim_faixa = min(de_id + options['lote'], ate_id)
+
+            transacoes = TransacaoRisco.objects.filter(id__gt=de_id, id__lte=fim_faixa)
+            if desde:
+                transacoes = transacoes.filter(data_transacao__gte=desde)
+            transacoes = list(transacoes.only(
+                'id', 'cpf', 'ip_address', 'device_fingerprint', 'bin_cartao', 'loja_id', 'origem',
+                'valor', 'data_transacao'
+            ))
+
+            # Reprovações das transações da faixa (uma linha por decisão, como no signal)
+            reprovadas = Counter(DecisaoAntifraude.objects.filter(
+                transacao_id__in=[t.id for t in transacoes],
+                decisao='REPROVADO'
+            ).values_list('transacao_id', flat=True))
+
+            linhas = []
+            for transacao_risco in transacoes:
+                linhas.extend(RollupService.linhas_da_transacao(
+                    transacao_risco, reprovadas=reprovadas.get(transacao_risco.id, 0)
+                ))
+            linhas = RollupService.combinar(linhas)
+
+            with transaction.atomic():
+                for i in range(0, len(linhas), 1000):
+                    RollupTransacao.registrar(linhas[i:i + 1000])
+                checkpoint.avancar(fim_faixa)
+
+            total_transacoes += len(transacoes)
+            decorrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f"   até id {fim_faixa}: {len(transacoes)} transações, {len(linhas)} rollups "
+                f"({total_transacoes} transações no total, {decorrido:.0f}s)"
+            )
+
+            if options['pausa_ms']:
+                time.sleep(options['pausa_ms'] / 1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Backfill concluído até id {checkpoint.ultimo_id}: {RollupTransacao.objects.count()} rollups na tabela"
+        ))
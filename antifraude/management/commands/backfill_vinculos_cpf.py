@@ -0,0 +1,114 @@
+"""
+Preenche VinculoCpfEntidade (CPF x IP/dispositivo) a partir do histórico de TransacaoRisco
+
+Processa por faixas de id, agregando cada faixa numa consulta e gravando com
+upsert; o progresso fica em CheckpointDetector('backfill_vinculos'), então o
+comando pode ser interrompido e retomado.
+
+Transações inseridas depois do deploy já são registradas pelo signal: use
+--ate-id com o último id anterior ao deploy para não somar essas transações
+duas vezes em `total` (datas e primeira_transacao_id não são afetadas).
+--reiniciar apaga a tabela inteira e reconstrói até o maior id atual (não
+aceita --ate-id).
+
+Uso:
+    python manage.py backfill_vinculos_cpf --ate-id 123456
+    python manage.py backfill_vinculos_cpf --lote 50000 --pausa-ms 200
+    python manage.py backfill_vinculos_cpf --reiniciar
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from antifraude.models import CheckpointDetector, TransacaoRisco, VinculoCpfEntidade
+
+
+CHECKPOINT = 'backfill_vinculos'
+
+# Tipo do vínculo -> campo de TransacaoRisco
+ENTIDADES = {
+    VinculoCpfEntidade.TIPO_IP: 'ip_address',
+    VinculoCpfEntidade.TIPO_DISPOSITIVO: 'device_fingerprint',
+}
+
+
+class Command(BaseCommand):
+    help = 'Preenche a tabela de vínculos CPF-IP/dispositivo a partir do histórico de transações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=20000, help='Ids de transação por faixa')
+        parser.add_argument('--ate-id', type=int, help='Último id a processar (padrão: maior id atual)')
+        parser.add_argument('--pausa-ms', type=int, default=0, help='Pausa entre faixas (alivia o banco)')
+        parser.add_argument('--reiniciar', action='store_true', help='Apaga os vínculos e recomeça do zero')
+
+    def handle(self, *args, **options):
+        checkpoint, _ = CheckpointDetector.objects.get_or_create(detector=CHECKPOINT, defaults={'ultimo_id': 0})
+
+        if options['reiniciar']:
+            # A tabela inteira é apagada, inclusive o que os signals gravaram desde o
+            # deploy: a reconstrução precisa ir até o maior id atual
+            if options['ate_id']:
+                raise CommandError('--reiniciar reconstrói até o maior id atual; não use com --ate-id')
+            VinculoCpfEntidade.objects.all().delete()
+            checkpoint.ultimo_id = 0
+            checkpoint.save(update_fields=['ultimo_id', 'updated_at'])
+
+        ate_id = options['ate_id'] or TransacaoRisco.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        self.stdout.write(f"▶️ Backfill de vínculos: ids {checkpoint.ultimo_id + 1} a {ate_id} (lote {options['lote']})")
+
+        inicio = time.perf_counter()
+        total_vinculos = 0
+
+        while checkpoint.ultimo_id < ate_id:
+            de_id = checkpoint.ultimo_id
+            fim_faixa = min(de_id + options['lote'], ate_id)
+
+            linhas = self._agregar_faixa(de_id, fim_faixa)
+            with transaction.atomic():
+                for i in range(0, len(linhas), 1000):
+                    VinculoCpfEntidade.registrar(linhas[i:i + 1000])
+                checkpoint.avancar(fim_faixa)
+
+            total_vinculos += len(linhas)
+            decorrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f"   até id {fim_faixa}: {len(linhas)} vínculos ({total_vinculos} no total, {decorrido:.0f}s)"
+            )
+
+            if options['pausa_ms']:
+                time.sleep(options['pausa_ms'] / 1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Backfill concluído até id {checkpoint.ultimo_id}: {VinculoCpfEntidade.objects.count()} vínculos na tabela"
+        ))
+
+    def _agregar_faixa(self, de_id, ate_id):
+        """Um upsert por (cpf, entidade) da faixa, já somado"""
+        linhas = []
+        for tipo, campo in ENTIDADES.items():
+            grupos = TransacaoRisco.objects.filter(
+                id__gt=de_id,
+                id__lte=ate_id,
+                **{f'{campo}__isnull': False}
+            ).values('cpf', campo).annotate(
+                primeiro_uso=Min('data_transacao'),
+                ultimo_uso=Max('data_transacao'),
+                total=Count('id'),
+                primeira_transacao_id=Min('id')
+            ).order_by()
+
+            for grupo in grupos:
+                if not grupo[campo]:
+                    continue
+                linhas.append({
+                    'cpf': grupo['cpf'],
+                    'tipo_entidade': tipo,
+                    'hash_entidade': VinculoCpfEntidade.hash(grupo[campo]),
+                    'primeiro_uso': grupo['primeiro_uso'],
+                    'ultimo_uso': grupo['ultimo_uso'],
+                    'total': grupo['total'],
+                    'primeira_transacao_id': grupo['primeira_transacao_id'],
+                })
+        return linhas
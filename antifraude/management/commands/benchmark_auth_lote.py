@@ -0,0 +1,86 @@
+"""
+Benchmark offline da consulta de histórico de autenticação: individual x lote
+
+Sobe o simulador local do wallclub_django e compara as duas formas de consulta.
+
+Uso:
+    python manage.py benchmark_auth_lote --cpfs 2000 --lote 200 --latencia-ms 15
+"""
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from antifraude.services_cliente_auth import ClienteAutenticacaoService
+from antifraude.simuladores import SimuladorAutenticacao, PerfilFalha
+
+
+class Command(BaseCommand):
+    help = 'Compara consulta de histórico de autenticação individual x lote contra simulador local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cpfs', type=int, default=1000, help='Quantidade de CPFs sintéticos')
+        parser.add_argument('--lote', type=int, default=ClienteAutenticacaoService.TAMANHO_LOTE, help='CPFs por requisição em lote')
+        parser.add_argument('--latencia-ms', type=int, default=10, help='Latência simulada por requisição')
+        parser.add_argument('--latencia-cpf-ms', type=float, default=0.1, help='Latência simulada por CPF processado')
+        parser.add_argument('--perfil', help="Perfil de falha do simulador (ex: instavel, 'latencia=10,parcial=0.2')")
+        parser.add_argument('--sem-individual', action='store_true', help='Pula a rodada individual (lenta com muitos CPFs)')
+
+    def handle(self, *args, **options):
+        cpfs = [f"{i:011d}" for i in range(1, options['cpfs'] + 1)]
+
+        simulador = SimuladorAutenticacao(
+            latencia_ms=options['latencia_ms'],
+            latencia_por_cpf_ms=options['latencia_cpf_ms'],
+            perfil=PerfilFalha.de_texto(options['perfil']) if options['perfil'] else None
+        )
+
+        base_url_original = ClienteAutenticacaoService.DJANGO_BASE_URL
+        token_original = (ClienteAutenticacaoService._token, ClienteAutenticacaoService._token_expira_em)
+
+        with simulador as url:
+            ClienteAutenticacaoService.DJANGO_BASE_URL = url
+            # Token fixo: o simulador só exige Bearer, sem passar pelo OAuth real
+            ClienteAutenticacaoService._token = 'benchmark'
+            ClienteAutenticacaoService._token_expira_em = time.monotonic() + 3600
+
+            try:
+                if not options['sem_individual']:
+                    self._limpar_cache(cpfs)
+                    self._rodar('individual', simulador, lambda: [
+                        ClienteAutenticacaoService.consultar_historico_autenticacao(cpf) for cpf in cpfs
+                    ])
+
+                self._limpar_cache(cpfs)
+                self._rodar('lote', simulador, lambda: list(
+                    ClienteAutenticacaoService.consultar_historico_autenticacao_lote(cpfs, tamanho_lote=options['lote'])
+                ))
+
+                # Segunda rodada: tudo em cache
+                self._rodar('lote (cache)', simulador, lambda: list(
+                    ClienteAutenticacaoService.consultar_historico_autenticacao_lote(cpfs, tamanho_lote=options['lote'])
+                ))
+            finally:
+                ClienteAutenticacaoService.DJANGO_BASE_URL = base_url_original
+                ClienteAutenticacaoService._token, ClienteAutenticacaoService._token_expira_em = token_original
+
+    def _limpar_cache(self, cpfs):
+        cache.delete_many([ClienteAutenticacaoService._chave_cache_historico(cpf) for cpf in cpfs])
+
+    def _rodar(self, nome, simulador, funcao):
+        requisicoes_antes = simulador.requisicoes
+        inicio = time.perf_counter()
+        resultados = funcao()
+        tempo = time.perf_counter() - inicio
+
+        fallbacks = sum(1 for r in resultados if self._eh_fallback(r))
+        self.stdout.write(
+            f"{nome:<14} {len(resultados):>6} CPFs  {tempo * 1000:>9.0f}ms  "
+            f"{len(resultados) / tempo if tempo else 0:>9.0f} CPFs/s  "
+            f"{simulador.requisicoes - requisicoes_antes:>5} requisições  {fallbacks} fallbacks"
+        )
+
+    @staticmethod
+    def _eh_fallback(resultado):
+        dados = resultado[1] if isinstance(resultado, tuple) else resultado
+        return dados.get('falha_consulta', False)
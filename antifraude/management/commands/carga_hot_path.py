@@ -0,0 +1,139 @@
+"""
+Harness de carga do hot path (AnaliseRiscoService.analisar_transacao) com upstreams simulados
+
+Roda N análises concorrentes para cada cenário de falha (antifraude/simuladores.py:
+CENARIOS) e mostra latência (p50/p95/p99/máx), decisões e fonte do score MaxMind.
+Cria transações CARGA-* e remove ao final, mas os dados derivados (rollups,
+vínculos CPF, eventos do stream, contadores e último score MaxMind no Redis)
+ficam: só roda em banco de teste (nome começando com test_).
+
+Uso:
+    python manage.py carga_hot_path --cenario normal --cenario maxmind_travado --transacoes 200 --concorrencia 4
+    python manage.py carga_hot_path --cenario todos
+"""
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from antifraude.models import TransacaoRisco
+from antifraude.services import AnaliseRiscoService
+from antifraude.simuladores import AmbienteSimulado, CENARIOS
+from antifraude.management.commands.simular_upstreams import parse_perfis
+
+
+RE_FONTE_MAXMIND = re.compile(r'Score MaxMind: \d+ \((\w+)\)')
+
+
+class Command(BaseCommand):
+    help = 'Mede o hot path de análise sob cenários de falha dos upstreams (sem rede)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cenario', action='append', default=[], help=f"Cenário ({', '.join(CENARIOS)}) ou 'todos'")
+        parser.add_argument('--perfil', action='append', default=[], help='Cenário ad hoc: upstream=perfil (ver simular_upstreams)')
+        parser.add_argument('--transacoes', type=int, default=100, help='Análises por cenário')
+        parser.add_argument('--concorrencia', type=int, default=2, help='Análises simultâneas (threads)')
+        parser.add_argument('--origem', default='WEB', choices=['POS', 'APP', 'WEB'])
+        parser.add_argument('--manter', action='store_true', help='Não remove transações CARGA-* ao final')
+
+    def handle(self, *args, **options):
+        nome_banco = str(connections['default'].settings_dict['NAME'])
+        if not nome_banco.startswith('test_'):
+            raise CommandError(
+                f"Banco '{nome_banco}' não é de teste: a carga deixa rollups, vínculos e contadores "
+                f"que não são removidos (aponte DATABASES para um banco test_*)"
+            )
+
+        cenarios = options['cenario'] or (['normal'] if not options['perfil'] else [])
+        if 'todos' in cenarios:
+            cenarios = list(CENARIOS)
+        desconhecidos = [c for c in cenarios if c not in CENARIOS]
+        if desconhecidos:
+            raise CommandError(f"Cenário desconhecido: {', '.join(desconhecidos)}")
+
+        execucoes = [(cenario, lambda c=cenario: AmbienteSimulado.de_cenario(c)) for cenario in cenarios]
+        if options['perfil']:
+            perfis = parse_perfis(options['perfil'])
+            execucoes.append(('ad_hoc', lambda: AmbienteSimulado(perfis)))
+
+        prefixo = f"CARGA-{uuid.uuid4().hex[:8]}"
+
+        try:
+            for nome, criar_ambiente in execucoes:
+                with criar_ambiente() as ambiente:
+                    resultado = self._rodar(nome, prefixo, options)
+                    self._imprimir(nome, resultado, ambiente.estatisticas())
+        finally:
+            if not options['manter']:
+                removidas, _ = TransacaoRisco.objects.filter(transacao_id__startswith=prefixo).delete()
+                self.stdout.write(f"🧹 {removidas} registros de carga removidos")
+
+    def _rodar(self, cenario, prefixo, options):
+        def analisar(indice):
+            try:
+                transacao = TransacaoRisco.objects.create(
+                    transacao_id=f"{prefixo}-{cenario}-{indice}",
+                    origem=options['origem'],
+                    # CPF único por transação: não aciona whitelist automática nem velocidade
+                    cpf=f"9{random.randint(0, 10 ** 10 - 1):010d}",
+                    cliente_id=random.randint(1, 10 ** 6),
+                    valor=Decimal(random.choice(['35.90', '120.00', '480.00', '1500.00'])),
+                    modalidade='CREDITO',
+                    parcelas=1,
+                    ip_address=f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}",
+                    device_fingerprint=uuid.uuid4().hex,
+                    bin_cartao='411111',
+                    data_transacao=datetime.now()
+                )
+                inicio = time.perf_counter()
+                decisao = AnaliseRiscoService.analisar_transacao(transacao)
+                tempo_ms = (time.perf_counter() - inicio) * 1000
+                fonte = RE_FONTE_MAXMIND.search(decisao.motivo or '')
+                return tempo_ms, decisao.decisao, fonte.group(1) if fonte else None, None
+            except Exception as e:
+                return None, None, None, type(e).__name__
+            finally:
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concorrencia']) as executor:
+            resultados = list(executor.map(analisar, range(options['transacoes'])))
+        duracao = time.perf_counter() - inicio
+
+        return {
+            'duracao_s': duracao,
+            'tempos': sorted(r[0] for r in resultados if r[0] is not None),
+            'decisoes': Counter(r[1] for r in resultados if r[1]),
+            'fontes': Counter(r[2] or '-' for r in resultados if r[1]),
+            'erros': Counter(r[3] for r in resultados if r[3]),
+        }
+
+    def _imprimir(self, cenario, resultado, estatisticas):
+        tempos = resultado['tempos']
+
+        def percentil(p):
+            if not tempos:
+                return 0
+            return tempos[min(len(tempos) - 1, int(len(tempos) * p))]
+
+        vazao = len(tempos) / resultado['duracao_s'] if resultado['duracao_s'] else 0
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n▶ {cenario}"))
+        self.stdout.write(
+            f"   {len(tempos)} análises em {resultado['duracao_s']:.1f}s ({vazao:.1f}/s) | "
+            f"p50 {percentil(0.50):.0f}ms  p95 {percentil(0.95):.0f}ms  p99 {percentil(0.99):.0f}ms  "
+            f"máx {tempos[-1] if tempos else 0:.0f}ms"
+        )
+        self.stdout.write(f"   Decisões: {dict(resultado['decisoes'])}")
+        self.stdout.write(f"   Fonte MaxMind: {dict(resultado['fontes'])}")
+        if resultado['erros']:
+            self.stdout.write(self.style.ERROR(f"   Exceções: {dict(resultado['erros'])}"))
+        for upstream, dados in estatisticas.items():
+            if dados['requisicoes']:
+                self.stdout.write(f"   {upstream:<13} {dados['requisicoes']} req  falhas {dados['falhas_injetadas']}")
@@ -0,0 +1,66 @@
+"""
+Consumidor da detecção em tempo real (Redis Streams)
+
+Cada processo consome um conjunto disjunto de partições; para escalar,
+suba mais processos dividindo as partições entre eles. Ao iniciar, as
+janelas em memória são reconstruídas com os eventos recentes do stream.
+
+Uso:
+    python manage.py consumir_stream                      # todas as partições
+    python manage.py consumir_stream --particoes 0,1      # parte das partições
+"""
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from antifraude import streaming
+
+
+class Command(BaseCommand):
+    help = 'Consome o stream de transações/decisões e registra atividades suspeitas em tempo real'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--particoes', help='Partições separadas por vírgula (padrão: todas)')
+        parser.add_argument('--nome', help='Nome do consumidor no grupo (padrão: host-pid)')
+        parser.add_argument('--lote', type=int, default=200, help='Mensagens por leitura')
+        parser.add_argument('--ocioso-ms', type=int, default=60000, help='Reivindica pendentes ociosos há mais que isso')
+
+    def handle(self, *args, **options):
+        if not streaming.ativo():
+            raise CommandError('DETECCAO_STREAM_ATIVA=False: nada é publicado no stream')
+
+        particoes = parse_particoes(options['particoes'])
+        consumidor = streaming.ConsumidorStream(
+            particoes,
+            nome=options['nome'],
+            lote=options['lote'],
+            ocioso_reivindicar_ms=options['ocioso_ms']
+        )
+
+        encerrar = []
+        signal.signal(signal.SIGTERM, lambda *_: encerrar.append(True))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Consumidor {consumidor.nome} nas partições {particoes} (grupo {streaming.GRUPO})"
+        ))
+
+        try:
+            consumidor.executar(parar=lambda: bool(encerrar))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f"{consumidor.nome}: {consumidor.estatisticas}")
+
+
+def parse_particoes(valor):
+    """'0,2' -> [0, 2]; vazio = todas"""
+    total = streaming.total_particoes()
+    if not valor:
+        return list(range(total))
+    try:
+        particoes = sorted({int(p) for p in valor.split(',') if p.strip()})
+    except ValueError:
+        raise CommandError(f"Partições inválidas: '{valor}'")
+    if not particoes or any(p < 0 or p >= total for p in particoes):
+        raise CommandError(f"Partições devem estar entre 0 e {total - 1}")
+    return particoes
@@ -0,0 +1,62 @@
+"""
+Exporta decisões (com a transação e as regras acionadas) em NDJSON ou CSV
+
+Mesma saída do endpoint /api/antifraude/exportar/decisoes/, sem limite de
+período: lê em lotes por faixa de id e grava em streaming, com memória
+constante (ver ExportacaoService).
+
+Uso:
+    python manage.py exportar_decisoes --inicio 2025-01-01 --fim 2025-06-30 --formato csv --gzip --saida decisoes.csv.gz
+    python manage.py exportar_decisoes --inicio 2025-10-01 --decisao REPROVADO > reprovadas.ndjson
+"""
+from datetime import datetime, timedelta
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from antifraude.services_exportacao import ExportacaoService
+
+
+class Command(BaseCommand):
+    help = 'Exporta decisões e transações em NDJSON ou CSV (streaming)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', required=True, help='Data inicial (AAAA-MM-DD)')
+        parser.add_argument('--fim', help='Data final, inclusiva (AAAA-MM-DD, padrão: hoje)')
+        parser.add_argument('--formato', choices=ExportacaoService.FORMATOS, default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='Compacta a saída')
+        parser.add_argument('--decisao', help='Filtra por decisão (APROVADO, REPROVADO, REVISAO, PENDENTE)')
+        parser.add_argument('--origem', help='Filtra por origem (POS, APP, WEB)')
+        parser.add_argument('--lote', type=int, help='Decisões por consulta (padrão: EXPORTACAO_LOTE)')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = datetime.strptime(options['inicio'], '%Y-%m-%d')
+            fim = datetime.strptime(options['fim'], '%Y-%m-%d') if options['fim'] else datetime.now()
+        except ValueError:
+            raise CommandError('Datas devem estar no formato AAAA-MM-DD')
+        fim = fim.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+        decisoes = ExportacaoService.filtrar(inicio, fim, decisao=options['decisao'], origem=options['origem'])
+        blocos = ExportacaoService.exportar(decisoes, options['formato'], options['gzip'], options['lote'])
+
+        inicio_execucao = time.perf_counter()
+        total_bytes = 0
+        arquivo = open(options['saida'], 'wb') if options['saida'] else sys.stdout.buffer
+        try:
+            for bloco in blocos:
+                arquivo.write(bloco)
+                total_bytes += len(bloco)
+        finally:
+            if options['saida']:
+                arquivo.close()
+            else:
+                arquivo.flush()
+
+        # Mensagem em stderr: stdout pode ser a própria exportação
+        self.stderr.write(self.style.SUCCESS(
+            f"✅ Exportação {inicio:%Y-%m-%d} a {fim - timedelta(days=1):%Y-%m-%d}: "
+            f"{total_bytes} bytes em {time.perf_counter() - inicio_execucao:.1f}s"
+        ))
@@ -0,0 +1,59 @@
+"""
+Replay da detecção em tempo real a partir do banco
+
+- --republicar: reescreve no stream as transações/decisões dos últimos N minutos
+  (Redis perdido/limpo; os consumidores reconstroem as janelas ao reiniciar)
+- padrão: reconstrói as janelas localmente e mostra as atividades que seriam
+  emitidas; com --emitir grava (deduplicadas) em AtividadeSuspeita
+
+Uso:
+    python manage.py replay_stream --minutos 15
+    python manage.py replay_stream --minutos 15 --emitir
+    python manage.py replay_stream --minutos 15 --republicar
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from antifraude import streaming
+from antifraude.tasks import registrar_atividades
+
+
+class Command(BaseCommand):
+    help = 'Reprocessa transações/decisões recentes do banco pela detecção em tempo real'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutos', type=int, default=15, help='Janela de replay')
+        parser.add_argument('--emitir', action='store_true', help='Grava as atividades detectadas')
+        parser.add_argument('--republicar', action='store_true', help='Republica os eventos no stream')
+
+    def handle(self, *args, **options):
+        eventos = streaming.eventos_do_banco(options['minutos'])
+
+        if options['republicar']:
+            conexao = streaming._conexao()
+            publicados = falhas = 0
+            for evento, chave in eventos:
+                if streaming.publicar(evento, chave, conexao):
+                    publicados += 1
+                else:
+                    falhas += 1
+            self.stdout.write(self.style.SUCCESS(f"📤 {publicados} eventos republicados ({falhas} falhas)"))
+            return
+
+        estado = streaming.EstadoJanelas()
+        candidatas = []
+        total = 0
+        for evento, _ in eventos:
+            candidatas.extend(estado.aplicar(evento))
+            total += 1
+
+        por_tipo = {}
+        for atividade in candidatas:
+            por_tipo[atividade.tipo] = por_tipo.get(atividade.tipo, 0) + 1
+
+        self.stdout.write(f"♻️ {total} eventos | janelas: {estado.tamanho()} | candidatas: {por_tipo}")
+
+        if options['emitir']:
+            with transaction.atomic():
+                criadas = registrar_atividades(candidatas)
+            self.stdout.write(self.style.SUCCESS(f"✅ Atividades criadas: {criadas}"))
@@ -0,0 +1,66 @@
+"""
+Sobe todos os upstreams simulados em portas fixas (modo standalone)
+
+Útil para apontar runserver/worker Celery para upstreams falsos via variáveis
+de ambiente e observar o comportamento sob falha sem rede.
+
+Uso:
+    python manage.py simular_upstreams --porta-base 9100 --perfil maxmind=travado --perfil autenticacao=lento
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from antifraude.simuladores import AmbienteSimulado, PerfilFalha
+
+
+class Command(BaseCommand):
+    help = 'Sobe upstreams simulados (MaxMind, autenticação, 3DS, Slack, callback) com injeção de falhas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--porta-base', type=int, default=9100, help='Porta do primeiro simulador (demais em sequência)')
+        parser.add_argument(
+            '--perfil', action='append', default=[],
+            help="upstream=perfil (ex: maxmind=travado, threeds='latencia=50,p99=900,erro=0.1')"
+        )
+        parser.add_argument('--perfil-padrao', default='normal', help='Perfil dos upstreams não informados')
+
+    def handle(self, *args, **options):
+        perfis = parse_perfis(options['perfil'])
+        portas = {nome: options['porta_base'] + i for i, nome in enumerate(AmbienteSimulado.CLASSES)}
+
+        ambiente = AmbienteSimulado(perfis, perfil_padrao=options['perfil_padrao'], portas=portas)
+        ambiente.iniciar()
+
+        try:
+            self.stdout.write(self.style.SUCCESS('✅ Upstreams simulados no ar'))
+            for nome, simulador in ambiente.simuladores.items():
+                self.stdout.write(f"   {nome:<13} {simulador.url}  {simulador.perfil}")
+
+            self.stdout.write('\nExporte no processo do Risk Engine:')
+            for chave, valor in ambiente.variaveis_ambiente().items():
+                self.stdout.write(f"export {chave}={valor}")
+
+            self.stdout.write('\nCtrl+C para encerrar')
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ambiente.parar()
+            for nome, estatisticas in ambiente.estatisticas().items():
+                self.stdout.write(f"{nome:<13} {estatisticas}")
+
+
+def parse_perfis(valores):
+    """Converte ['maxmind=travado', ...] em {upstream: PerfilFalha}"""
+    perfis = {}
+    for valor in valores:
+        upstream, _, perfil = valor.partition('=')
+        if upstream not in AmbienteSimulado.CLASSES or not perfil:
+            raise CommandError(f"Perfil inválido '{valor}' (upstreams: {', '.join(AmbienteSimulado.CLASSES)})")
+        try:
+            perfis[upstream] = PerfilFalha.de_texto(perfil)
+        except (ValueError, TypeError) as e:
+            raise CommandError(str(e))
+    return perfis
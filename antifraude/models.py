@@ -4,6 +4,7 @@ Fase 2 - Semana 7: Estrutura base de análise de risco
 """
 from django.db import models
 from datetime import datetime
+import time
 
 
 class TransacaoRisco(models.Model):
@@ -55,6 +56,7 @@ class TransacaoRisco(models.Model):
         ordering = ['-data_transacao']
         indexes = [
             models.Index(fields=['cpf', 'data_transacao']),
+            models.Index(fields=['cliente_id', 'data_transacao']),
             models.Index(fields=['ip_address', 'data_transacao']),
             models.Index(fields=['device_fingerprint', 'data_transacao']),
             models.Index(fields=['bin_cartao', 'data_transacao']),
@@ -100,6 +102,11 @@ class RegraAntifraude(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Snapshot por processo das regras ativas (evita query por análise)
+    SNAPSHOT_TTL_SEGUNDOS = 30
+    _snapshot_ativas = None
+    _snapshot_em = 0.0
+    
     class Meta:
         db_table = 'antifraude_regra'
         verbose_name = 'Regra Antifraude'
@@ -109,6 +116,33 @@ class RegraAntifraude(models.Model):
     def __str__(self):
         status = "🟢" if self.is_active else "🔴"
         return f"{status} {self.nome} ({self.tipo}) - Peso: {self.peso}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        RegraAntifraude.invalidar_snapshot()
+    
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        RegraAntifraude.invalidar_snapshot()
+        return resultado
+    
+    @classmethod
+    def regras_ativas(cls):
+        """
+        Regras ativas ordenadas por prioridade
+        
+        Snapshot em memória com TTL curto: alterações feitas em outro
+        processo (admin, outro worker) valem em até SNAPSHOT_TTL_SEGUNDOS.
+        """
+        agora = time.monotonic()
+        if cls._snapshot_ativas is None or agora - cls._snapshot_em > cls.SNAPSHOT_TTL_SEGUNDOS:
+            cls._snapshot_ativas = list(cls.objects.filter(is_active=True).order_by('prioridade'))
+            cls._snapshot_em = agora
+        return cls._snapshot_ativas
+    
+    @classmethod
+    def invalidar_snapshot(cls):
+        cls._snapshot_ativas = None
 
 
 class DecisaoAntifraude(models.Model):
@@ -140,6 +174,7 @@ class DecisaoAntifraude(models.Model):
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, help_text="Última alteração (ex: 3DS, revisão)")
     
     class Meta:
         db_table = 'antifraude_decisao'
@@ -149,6 +184,7 @@ class DecisaoAntifraude(models.Model):
         indexes = [
             models.Index(fields=['decisao', 'created_at']),
             models.Index(fields=['score_risco', 'created_at']),
+            models.Index(fields=['revisado_em']),
         ]
     
     def __str__(self):
@@ -159,6 +195,26 @@ class DecisaoAntifraude(models.Model):
             'PENDENTE': '⏳'
         }.get(self.decisao, '❓')
         return f"{emoji} {self.transacao.transacao_id} - Score: {self.score_risco}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado gravado: save() guarda em decisao_anterior para os signals
+        if 'decisao' in instancia.__dict__:
+            instancia._decisao_gravada = instancia.decisao
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        self.decisao_anterior = None if self._state.adding else getattr(self, '_decisao_gravada', self.decisao)
+        super().save(*args, **kwargs)
+        self._decisao_gravada = self.decisao
+    
+    def entrou_em(self, decisao):
+        """
+        True se este save() levou a decisão ao estado (na criação ou depois,
+        ex: 3DS ou revisão -> REPROVADO). Para uso nos post_save.
+        """
+        return self.decisao == decisao and getattr(self, 'decisao_anterior', None) != decisao
 
 
 class BlacklistAntifraude(models.Model):
@@ -328,8 +384,19 @@ class AtividadeSuspeita(models.Model):
             'falso_positivo': '✅',
             'ignorado': '⚪',
         }.get(self.status, '❓')
-        tipo_label = dict(self.TIPO_CHOICES).get(self.tipo, self.tipo)
-        return f"{status_emoji} {tipo_label} - CPF: {self.cpf[:3]}***"
+        return f"{status_emoji} {self.tipo_label()} - CPF: {self.cpf[:3]}***"
+    
+    def tipo_label(self):
+        """
+        Rótulo do tipo; tipos de detectores declarativos (fora de TIPO_CHOICES)
+        usam a descrição do detector ou o próprio nome
+        """
+        rotulo = dict(self.TIPO_CHOICES).get(self.tipo)
+        if rotulo:
+            return rotulo
+        from .detectores import detectores_compilados
+        detector = detectores_compilados().get(self.tipo)
+        return (detector.descricao if detector else '') or self.tipo
 
 
 class WhitelistAntifraude(models.Model):
@@ -388,5 +455,589 @@ class WhitelistAntifraude(models.Model):
         return f"{status}{origem_emoji} {self.tipo}: {self.valor}"
 
 
+
+class BinCartao(models.Model):
+    """
+    Tabela local de BINs (6 ou 8 dígitos)
+    Carregada em memória pelo Auth3DSService (TabelaBin) para evitar consultas ao gateway
+    Atualizada via: python manage.py atualizar_tabela_bin --arquivo bins.csv
+    """
+    
+    bin = models.CharField(max_length=8, unique=True, help_text="6 ou 8 primeiros dígitos")
+    
+    # Emissor
+    emissor = models.CharField(max_length=100, null=True, blank=True)
+    pais = models.CharField(max_length=2, null=True, blank=True, help_text="ISO 3166 alpha-2")
+    bandeira = models.CharField(max_length=30, null=True, blank=True)
+    tipo_cartao = models.CharField(max_length=20, choices=[
+        ('CREDITO', 'Crédito'),
+        ('DEBITO', 'Débito'),
+        ('PRE_PAGO', 'Pré-pago'),
+        ('MULTIPLO', 'Múltiplo')
+    ], null=True, blank=True)
+    
+    # 3DS (vazio = BIN sem suporte a 3DS)
+    versao_3ds = models.CharField(max_length=10, null=True, blank=True, help_text="Ex: 2.2.0, 2.1.0")
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'antifraude_bin_cartao'
+        verbose_name = 'BIN de Cartão'
+        verbose_name_plural = 'BINs de Cartão'
+    
+    def __str__(self):
+        return f"{self.bin} - {self.emissor or '?'} ({self.pais or '?'}) 3DS: {self.versao_3ds or 'não'}"
+
+
+class CheckpointDetector(models.Model):
+    """
+    Marca d'água (último id processado da tabela de origem) por detector
+    Os detectores periódicos (tasks.py) processam apenas linhas com id acima
+    da marca, em lotes, e recuperam o atraso após paradas do beat/worker.
+    Também guarda a telemetria da última execução (atraso e taxa).
+    """
+    
+    detector = models.CharField(max_length=50, unique=True, help_text="Nome do detector (ex: ip_novo)")
+    ultimo_id = models.BigIntegerField(default=0, help_text="Último id processado da tabela de origem")
+    
+    # Telemetria da última execução
+    ultima_execucao = models.DateTimeField(null=True, blank=True)
+    linhas_processadas = models.IntegerField(default=0, help_text="Linhas processadas na última execução")
+    deteccoes = models.IntegerField(default=0, help_text="Atividades criadas na última execução")
+    duracao_ms = models.IntegerField(default=0)
+    taxa_linhas_segundo = models.FloatField(default=0)
+    atraso_linhas = models.IntegerField(default=0, help_text="Linhas pendentes ao fim da execução")
+    atraso_segundos = models.IntegerField(default=0, help_text="Idade da linha pendente mais antiga")
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'antifraude_checkpoint_detector'
+        verbose_name = 'Checkpoint de Detector'
+        verbose_name_plural = 'Checkpoints de Detectores'
+    
+    def __str__(self):
+        return f"{self.detector} - id {self.ultimo_id} (atraso: {self.atraso_linhas} linhas / {self.atraso_segundos}s)"
+    
+    @classmethod
+    def obter(cls, detector, inicio_janela, modelo=None, campo_data='data_transacao'):
+        """
+        Retorna o checkpoint do detector, criando-o na primeira execução
+        
+        Na criação a marca começa na última linha de `modelo` anterior a
+        inicio_janela, para que a primeira execução cubra a mesma janela do
+        modelo antigo (now - N minutos).
+        """
+        checkpoint = cls.objects.filter(detector=detector).first()
+        if checkpoint is None:
+            modelo = modelo or TransacaoRisco
+            ultimo_id = modelo.objects.filter(
+                **{f'{campo_data}__lt': inicio_janela}
+            ).aggregate(ultimo=models.Max('id'))['ultimo'] or 0
+            checkpoint, _ = cls.objects.get_or_create(
+                detector=detector,
+                defaults={'ultimo_id': ultimo_id}
+            )
+        return checkpoint
+    
+    def avancar(self, ultimo_id):
+        """Move a marca para ultimo_id (nunca para trás)"""
+        if ultimo_id > self.ultimo_id:
+            self.ultimo_id = ultimo_id
+            self.save(update_fields=['ultimo_id', 'updated_at'])
+    
+    def registrar_execucao(self, linhas, deteccoes, duracao_ms, atraso_linhas, atraso_segundos, iniciada_em=None):
+        """Grava a telemetria da execução (ultima_execucao = início, marca de consulta_alteradas)"""
+        self.ultima_execucao = iniciada_em or datetime.now()
+        self.linhas_processadas = linhas
+        self.deteccoes = deteccoes
+        self.duracao_ms = duracao_ms
+        self.taxa_linhas_segundo = round(linhas / (duracao_ms / 1000), 1) if duracao_ms else float(linhas)
+        self.atraso_linhas = atraso_linhas
+        self.atraso_segundos = atraso_segundos
+        self.save(update_fields=[
+            'ultima_execucao', 'linhas_processadas', 'deteccoes', 'duracao_ms',
+            'taxa_linhas_segundo', 'atraso_linhas', 'atraso_segundos', 'updated_at'
+        ])
+    
+    def telemetria(self):
+        return {
+            'ultimo_id': self.ultimo_id,
+            'ultima_execucao': self.ultima_execucao.isoformat() if self.ultima_execucao else None,
+            'linhas_processadas': self.linhas_processadas,
+            'deteccoes': self.deteccoes,
+            'duracao_ms': self.duracao_ms,
+            'taxa_linhas_segundo': self.taxa_linhas_segundo,
+            'atraso_linhas': self.atraso_linhas,
+            'atraso_segundos': self.atraso_segundos,
+        }
+
+
+class VinculoCpfEntidade(models.Model):
+    """
+    Primeiro/último uso de cada IP e dispositivo por CPF
+    Mantida a cada TransacaoRisco inserida (signals.py) e preenchida para o
+    histórico via: python manage.py backfill_vinculos_cpf
+    
+    "Este CPF já usou este IP/dispositivo?" vira uma busca pela chave única
+    (cpf, tipo_entidade, hash_entidade) em vez de exists() no histórico de
+    transações; a entidade é nova para a transação cuja id é primeira_transacao_id.
+    """
+    
+    TIPO_IP = 'IP'
+    TIPO_DISPOSITIVO = 'DEVICE'
+    
+    cpf = models.CharField(max_length=11)
+    tipo_entidade = models.CharField(max_length=10, choices=[
+        (TIPO_IP, 'IP'),
+        (TIPO_DISPOSITIVO, 'Dispositivo')
+    ])
+    hash_entidade = models.CharField(max_length=32, help_text="SHA-256 (32 hex) do IP/device fingerprint")
+    
+    primeiro_uso = models.DateTimeField()
+    ultimo_uso = models.DateTimeField()
+    total = models.IntegerField(default=1, help_text="Transações do CPF com esta entidade")
+    primeira_transacao_id = models.BigIntegerField(help_text="Id da primeira TransacaoRisco com esta entidade")
+    
+    class Meta:
+        db_table = 'antifraude_vinculo_cpf_entidade'
+        verbose_name = 'Vínculo CPF-Entidade'
+        verbose_name_plural = 'Vínculos CPF-Entidade'
+        unique_together = [['cpf', 'tipo_entidade', 'hash_entidade']]
+        indexes = [
+            models.Index(fields=['primeira_transacao_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.cpf[:3]}*** {self.tipo_entidade} {self.hash_entidade[:8]} ({self.total}x)"
+    
+    @staticmethod
+    def hash(valor) -> str:
+        import hashlib
+        return hashlib.sha256(str(valor).encode()).hexdigest()[:32]
+    
+    @classmethod
+    def linhas_da_transacao(cls, transacao):
+        """Vínculos (IP e dispositivo) de uma transação, no formato de registrar()"""
+        entidades = [
+            (cls.TIPO_IP, transacao.ip_address),
+            (cls.TIPO_DISPOSITIVO, transacao.device_fingerprint),
+        ]
+        return [
+            {
+                'cpf': transacao.cpf,
+                'tipo_entidade': tipo,
+                'hash_entidade': cls.hash(valor),
+                'primeiro_uso': transacao.data_transacao,
+                'ultimo_uso': transacao.data_transacao,
+                'total': 1,
+                'primeira_transacao_id': transacao.id,
+            }
+            for tipo, valor in entidades if valor
+        ]
+    
+    @classmethod
+    def registrar(cls, linhas):
+        """
+        Upsert em um único INSERT: soma total, mantém o menor primeiro_uso /
+        primeira_transacao_id e o maior ultimo_uso (reprocessar não recua datas)
+        
+        Args:
+            linhas: dicts com cpf, tipo_entidade, hash_entidade, primeiro_uso,
+                    ultimo_uso, total, primeira_transacao_id
+        """
+        from django.db import connection
+        
+        if not linhas:
+            return
+        
+        colunas = ['cpf', 'tipo_entidade', 'hash_entidade', 'primeiro_uso', 'ultimo_uso', 'total', 'primeira_transacao_id']
+        tabela = connection.ops.quote_name(cls._meta.db_table)
+        valores = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(linhas))
+        
+        if connection.vendor == 'mysql':
+            conflito = (
+                "ON DUPLICATE KEY UPDATE "
+                "primeiro_uso = LEAST(primeiro_uso, VALUES(primeiro_uso)), "
+                "ultimo_uso = GREATEST(ultimo_uso, VALUES(ultimo_uso)), "
+                "total = total + VALUES(total), "
+                "primeira_transacao_id = LEAST(primeira_transacao_id, VALUES(primeira_transacao_id))"
+            )
+        else:
+            minimo = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+            maximo = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+            conflito = (
+                f"ON CONFLICT (cpf, tipo_entidade, hash_entidade) DO UPDATE SET "
+                f"primeiro_uso = {minimo}({tabela}.primeiro_uso, excluded.primeiro_uso), "
+                f"ultimo_uso = {maximo}({tabela}.ultimo_uso, excluded.ultimo_uso), "
+                f"total = {tabela}.total + excluded.total, "
+                f"primeira_transacao_id = {minimo}({tabela}.primeira_transacao_id, excluded.primeira_transacao_id)"
+            )
+        
+        campo_data = cls._meta.get_field('primeiro_uso')
+        parametros = []
+        for linha in linhas:
+            for coluna in colunas:
+                valor = linha[coluna]
+                if coluna in ('primeiro_uso', 'ultimo_uso'):
+                    valor = campo_data.get_db_prep_value(valor, connection)
+                parametros.append(valor)
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {valores} {conflito}",
+                parametros
+            )
+    
+    @classmethod
+    def entidade_nova(cls, transacao, tipo_entidade, valor) -> bool:
+        """True se a transação é a primeira do CPF com esta entidade"""
+        primeira = cls.objects.filter(
+            cpf=transacao.cpf,
+            tipo_entidade=tipo_entidade,
+            hash_entidade=cls.hash(valor)
+        ).values_list('primeira_transacao_id', flat=True).first()
+        return primeira is None or primeira >= transacao.id
+
+
+
+class RollupTransacao(models.Model):
+    """
+    Agregados de transações por janela de tempo (minuto e hora) e dimensão
+    Mantida a cada TransacaoRisco / DecisaoAntifraude REPROVADO inserida
+    (signals.py) e preenchida para o histórico via: python manage.py backfill_rollups
+    
+    Perguntas agregadas (transações do CPF nos últimos N minutos, CPFs
+    distintos no IP em 24h, transações por origem no período) somam poucas
+    linhas daqui em vez de varrer TransacaoRisco. Distintos são estimados por
+    sketches de 63 bits (contagem linear, ver services_rollup.py), combináveis
+    entre janelas com OR.
+    """
+    
+    GRANULARIDADE_MINUTO = 'MINUTO'
+    GRANULARIDADE_HORA = 'HORA'
+    
+    DIMENSAO_CHOICES = [
+        ('cpf', 'CPF'),
+        ('ip', 'IP'),
+        ('dispositivo', 'Dispositivo'),
+        ('bin', 'BIN'),
+        ('loja', 'Loja'),
+        ('origem', 'Origem'),
+    ]
+    
+    granularidade = models.CharField(max_length=10, choices=[
+        (GRANULARIDADE_MINUTO, 'Minuto'),
+        (GRANULARIDADE_HORA, 'Hora')
+    ])
+    bucket = models.DateTimeField(help_text="Início da janela (minuto ou hora)")
+    dimensao = models.CharField(max_length=20, choices=DIMENSAO_CHOICES)
+    valor_dimensao = models.CharField(max_length=255)
+    
+    transacoes = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    reprovadas = models.IntegerField(default=0, help_text="Decisões REPROVADO das transações da janela")
+    sketch_cpfs = models.BigIntegerField(default=0, help_text="Sketch de CPFs distintos")
+    sketch_ips = models.BigIntegerField(default=0, help_text="Sketch de IPs distintos")
+    
+    class Meta:
+        db_table = 'antifraude_rollup_transacao'
+        verbose_name = 'Rollup de Transações'
+        verbose_name_plural = 'Rollups de Transações'
+        unique_together = [['granularidade', 'dimensao', 'valor_dimensao', 'bucket']]
+        indexes = [
+            models.Index(fields=['granularidade', 'bucket']),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularidade} {self.bucket:%Y-%m-%d %H:%M} {self.dimensao}={self.valor_dimensao}: {self.transacoes}"
+    
+    @classmethod
+    def registrar(cls, linhas):
+        """
+        Upsert em um único INSERT: soma contadores e combina sketches com OR
+        
+        Args:
+            linhas: dicts com granularidade, bucket, dimensao, valor_dimensao,
+                    transacoes, valor_total, reprovadas, sketch_cpfs, sketch_ips
+        """
+        from django.db import connection
+        
+        if not linhas:
+            return
+        
+        colunas = ['granularidade', 'bucket', 'dimensao', 'valor_dimensao', 'transacoes',
+                   'valor_total', 'reprovadas', 'sketch_cpfs', 'sketch_ips']
+        somas = ['transacoes', 'valor_total', 'reprovadas']
+        sketches = ['sketch_cpfs', 'sketch_ips']
+        tabela = connection.ops.quote_name(cls._meta.db_table)
+        valores = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(linhas))
+        
+        if connection.vendor == 'mysql':
+            conflito = "ON DUPLICATE KEY UPDATE " + ', '.join(
+                [f"{coluna} = {coluna} + VALUES({coluna})" for coluna in somas] +
+                [f"{coluna} = {coluna} | VALUES({coluna})" for coluna in sketches]
+            )
+        else:
+            conflito = "ON CONFLICT (granularidade, dimensao, valor_dimensao, bucket) DO UPDATE SET " + ', '.join(
+                [f"{coluna} = {tabela}.{coluna} + excluded.{coluna}" for coluna in somas] +
+                [f"{coluna} = {tabela}.{coluna} | excluded.{coluna}" for coluna in sketches]
+            )
+        
+        campo_bucket = cls._meta.get_field('bucket')
+        campo_valor = cls._meta.get_field('valor_total')
+        parametros = []
+        for linha in linhas:
+            for coluna in colunas:
+                valor = linha[coluna]
+                if coluna == 'bucket':
+                    valor = campo_bucket.get_db_prep_value(valor, connection)
+                elif coluna == 'valor_total':
+                    valor = campo_valor.get_db_prep_value(valor, connection)
+                parametros.append(valor)
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {valores} {conflito}",
+                parametros
+            )
+
+
+class AgregadoDecisaoHora(models.Model):
+    """
+    Agregado por hora das decisões (base do dashboard_metricas)
+    Recalculado pela task agregar_decisoes_hora (hora atual e anteriores) e
+    pelo comando agregar_decisoes para o histórico; o dashboard soma estas
+    linhas em vez de varrer DecisaoAntifraude.
+    
+    O tempo de análise fica num histograma de buckets logarítmicos
+    (services_dashboard.HistogramaLatencia), somável entre horas para o p95.
+    """
+    
+    hora = models.DateTimeField(unique=True, help_text="Início da hora")
+    
+    # Decisões
+    aprovadas = models.IntegerField(default=0)
+    reprovadas = models.IntegerField(default=0)
+    revisao = models.IntegerField(default=0)
+    pendentes = models.IntegerField(default=0)
+    bloqueios_blacklist = models.IntegerField(default=0, help_text="Reprovações por blacklist")
+    
+    # Score
+    score_soma = models.BigIntegerField(default=0)
+    score_min = models.IntegerField(null=True, blank=True)
+    score_max = models.IntegerField(null=True, blank=True)
+    
+    # Tempo de análise
+    tempo_soma_ms = models.BigIntegerField(default=0)
+    tempo_max_ms = models.IntegerField(default=0)
+    histograma_tempo = models.JSONField(default=dict, help_text="{bucket: quantidade}")
+    
+    # Regras acionadas
+    regras = models.JSONField(default=dict, help_text="{nome da regra: acionamentos}")
+    
+    atualizado_em = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'antifraude_agregado_decisao_hora'
+        verbose_name = 'Agregado de Decisões por Hora'
+        verbose_name_plural = 'Agregados de Decisões por Hora'
+        ordering = ['-hora']
+    
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H}h - {self.total} decisões"
+    
+    @property
+    def total(self):
+        return self.aprovadas + self.reprovadas + self.revisao + self.pendentes
+
+
+class RegraAcionada(models.Model):
+    """
+    Uma linha por regra acionada em cada decisão (espelho de regras_acionadas)
+    Gravada com bulk_create a cada DecisaoAntifraude criada (signals.py) e
+    preenchida para o histórico via: python manage.py backfill_regras_acionadas
+    
+    Perguntas sobre regras (acionamentos por regra no período, reprovações por
+    blacklist) viram GROUP BY indexado aqui em vez de desserializar o JSON de
+    cada decisão. O JSON continua sendo a fonte para exibir os detalhes.
+    """
+    
+    decisao = models.ForeignKey(DecisaoAntifraude, on_delete=models.CASCADE, related_name='acionamentos')
+    regra = models.ForeignKey(
+        RegraAntifraude, on_delete=models.SET_NULL, null=True, blank=True, related_name='acionamentos',
+        db_constraint=False,
+        help_text="Regra interna (vazio para blacklist, whitelist, MaxMind e autenticação)"
+    )
+    nome = models.CharField(max_length=100)
+    tipo = models.CharField(max_length=50, help_text="Tipo da regra ou BLACKLIST/WHITELIST/SCORE_EXTERNO/AUTENTICACAO")
+    acao = models.CharField(max_length=20, blank=True, default='')
+    ajuste_score = models.IntegerField(default=0, help_text="Pontos somados ao score (peso, para entradas sem ajuste)")
+    created_at = models.DateTimeField(help_text="Data da decisão")
+    
+    class Meta:
+        db_table = 'antifraude_regra_acionada'
+        verbose_name = 'Regra Acionada'
+        verbose_name_plural = 'Regras Acionadas'
+        indexes = [
+            models.Index(fields=['created_at', 'nome']),
+            models.Index(fields=['tipo', 'created_at']),
+            models.Index(fields=['regra', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.nome} ({self.tipo}) - decisão {self.decisao_id}"
+    
+    @classmethod
+    def linhas_da_decisao(cls, decisao, regras_por_nome=None):
+        """
+        Instâncias (não salvas) para cada entrada dict de decisao.regras_acionadas
+        
+        Args:
+            decisao: DecisaoAntifraude já salva
+            regras_por_nome: {nome: id} para resolver a regra de entradas sem
+                             regra_id (decisões anteriores a esta tabela)
+        """
+        import json
+        
+        entradas = decisao.regras_acionadas
+        if isinstance(entradas, str):
+            try:
+                entradas = json.loads(entradas)
+            except ValueError:
+                return []
+        if not isinstance(entradas, list):
+            return []
+        
+        linhas = []
+        for entrada in entradas:
+            if not isinstance(entrada, dict):
+                continue
+            nome = str(entrada.get('nome') or 'Desconhecida')[:100]
+            regra_id = entrada.get('regra_id')
+            if regra_id is None and regras_por_nome:
+                regra_id = regras_por_nome.get(nome)
+            ajuste = entrada.get('ajuste_score', entrada.get('peso'))
+            try:
+                ajuste = int(ajuste or 0)
+            except (TypeError, ValueError):
+                ajuste = 0
+            linhas.append(cls(
+                decisao_id=decisao.id,
+                regra_id=regra_id,
+                nome=nome,
+                tipo=str(entrada.get('tipo') or '')[:50],
+                acao=str(entrada.get('acao') or '')[:20],
+                ajuste_score=ajuste,
+                created_at=decisao.created_at,
+            ))
+        return linhas
+
+
+class DetectorDeclarativo(models.Model):
+    """
+    Detector de atividade suspeita definido por configuração
+    Cada definição (agrupamento, métrica, janela, limite) é compilada em uma
+    consulta agrupada (antifraude/detectores.py) e roda junto dos detectores
+    periódicos. Uma definição com o nome de um detector padrão (ex:
+    login_multiplo) substitui os parâmetros dele; inativa, desliga o detector.
+    """
+    
+    ORIGEM_CHOICES = [
+        ('TRANSACAO', 'Transações (TransacaoRisco)'),
+        ('DECISAO', 'Decisões (DecisaoAntifraude)'),
+    ]
+    AGRUPAMENTO_CHOICES = [
+        ('cpf', 'CPF'),
+        ('ip', 'IP'),
+        ('dispositivo', 'Dispositivo'),
+    ]
+    METRICA_CHOICES = [
+        ('CONTAGEM', 'Quantidade de registros'),
+        ('IPS_DISTINTOS', 'IPs distintos'),
+        ('CPFS_DISTINTOS', 'CPFs distintos'),
+        ('DISPOSITIVOS_DISTINTOS', 'Dispositivos distintos'),
+        ('VALOR_TOTAL', 'Valor total'),
+    ]
+    
+    nome = models.CharField(max_length=30, unique=True, help_text="Tipo da atividade gerada e chave do checkpoint")
+    descricao = models.TextField(blank=True, default='')
+    
+    # Consulta
+    origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES, default='TRANSACAO')
+    agrupar_por = models.CharField(max_length=20, choices=AGRUPAMENTO_CHOICES, default='cpf')
+    metrica = models.CharField(max_length=30, choices=METRICA_CHOICES, default='CONTAGEM')
+    limite = models.DecimalField(max_digits=12, decimal_places=2, help_text="Dispara quando métrica >= limite")
+    janela_minutos = models.IntegerField(default=5)
+    
+    # Filtros opcionais
+    decisao = models.CharField(max_length=20, null=True, blank=True, help_text="Só origem DECISAO (ex: REPROVADO)")
+    hora_inicio = models.IntegerField(null=True, blank=True, help_text="Só registros a partir desta hora (0-23)")
+    hora_fim = models.IntegerField(null=True, blank=True, help_text="Só registros antes desta hora (1-24)")
+    
+    # Atividade gerada
+    severidade = models.IntegerField(default=3, help_text="Nível de severidade 1-5 (5=crítico)")
+    portal = models.CharField(max_length=50, default='app')
+    rotulo_metrica = models.CharField(
+        max_length=50, null=True, blank=True,
+        help_text="Nome extra do valor da métrica nos detalhes (ex: total_ips)"
+    )
+    
+    # Controle
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'antifraude_detector_declarativo'
+        verbose_name = 'Detector Declarativo'
+        verbose_name_plural = 'Detectores Declarativos'
+        ordering = ['nome']
+    
+    def __str__(self):
+        return f"{self.nome}: {self.metrica} por {self.agrupar_por} >= {self.limite} em {self.janela_minutos}min"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .detectores import invalidar_definicoes
+        invalidar_definicoes()
+    
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        from .detectores import invalidar_definicoes
+        invalidar_definicoes()
+        return resultado
+    
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .detectores import DetectorCompilado
+        try:
+            DetectorCompilado(self.como_definicao())
+        except ValueError as e:
+            raise ValidationError(str(e))
+    
+    def como_definicao(self):
+        """Definição no formato de detectores.DEFINICOES_PADRAO"""
+        return {
+            'nome': self.nome,
+            'descricao': self.descricao.strip().split('\n')[0] if self.descricao else None,
+            'origem': self.origem,
+            'agrupar_por': self.agrupar_por,
+            'metrica': self.metrica,
+            'limite': self.limite,
+            'janela_minutos': self.janela_minutos,
+            'decisao': self.decisao or None,
+            'hora_inicio': self.hora_inicio,
+            'hora_fim': self.hora_fim,
+            'severidade': self.severidade,
+            'portal': self.portal,
+            'rotulo_metrica': self.rotulo_metrica or None,
+        }
+
 # Importar modelos de configuração
 from .models_config import ConfiguracaoAntifraude, HistoricoConfiguracao
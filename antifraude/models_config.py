@@ -2,6 +2,8 @@
 Configurações centralizadas do sistema antifraude
 Evita valores hardcoded espalhados pelo código
 """
+import time
+
 from django.db import models
 from django.core.exceptions import ValidationError
 
@@ -68,9 +70,23 @@ class ConfiguracaoAntifraude(models.Model):
             models.Index(fields=['categoria', 'is_active']),
         ]
     
+    # Snapshot por processo das configurações ativas (get_config é chamado várias vezes por análise)
+    SNAPSHOT_TTL_SEGUNDOS = 30
+    _snapshot = None
+    _snapshot_em = 0.0
+    
     def __str__(self):
         return f"{self.chave} = {self.valor_texto}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        ConfiguracaoAntifraude.invalidar_snapshot()
+    
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        ConfiguracaoAntifraude.invalidar_snapshot()
+        return resultado
+    
     def get_valor(self):
         """Retorna valor convertido para o tipo correto"""
         try:
@@ -100,11 +116,10 @@ class ConfiguracaoAntifraude(models.Model):
         Returns:
             Valor convertido ou default
         """
-        try:
-            config = cls.objects.get(chave=chave, is_active=True)
-            return config.get_valor()
-        except cls.DoesNotExist:
+        config = cls.carregar_snapshot().get(chave)
+        if config is None:
             return default
+        return config.get_valor()
     
     @classmethod
     def get_configs_categoria(cls, categoria):
@@ -117,8 +132,26 @@ class ConfiguracaoAntifraude(models.Model):
         Returns:
             dict: {chave: valor}
         """
-        configs = cls.objects.filter(categoria=categoria, is_active=True)
-        return {config.chave: config.get_valor() for config in configs}
+        configs = cls.carregar_snapshot().values()
+        return {config.chave: config.get_valor() for config in configs if config.categoria == categoria}
+    
+    @classmethod
+    def carregar_snapshot(cls):
+        """
+        Configurações ativas por chave, recarregadas do banco a cada SNAPSHOT_TTL_SEGUNDOS
+        
+        Returns:
+            dict: {chave: ConfiguracaoAntifraude}
+        """
+        agora = time.monotonic()
+        if cls._snapshot is None or agora - cls._snapshot_em > cls.SNAPSHOT_TTL_SEGUNDOS:
+            cls._snapshot = {config.chave: config for config in cls.objects.filter(is_active=True)}
+            cls._snapshot_em = agora
+        return cls._snapshot
+    
+    @classmethod
+    def invalidar_snapshot(cls):
+        cls._snapshot = None
 
 
 class HistoricoConfiguracao(models.Model):
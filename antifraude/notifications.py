@@ -133,3 +133,58 @@ class NotificacaoService:
         
         except Exception as e:
             print(f"Erro ao notificar app principal: {e}")
+    
+    @staticmethod
+    def notificar_reavaliacao(decisao, decisao_anterior):
+        """
+        Callback para app principal quando reavaliação pós-decisão exige revisão
+        
+        Args:
+            decisao: Nova DecisaoAntifraude (REVISAO)
+            decisao_anterior: DecisaoAntifraude provisória já retornada ao POS
+        """
+        try:
+            payload = {
+                'transacao_id': decisao.transacao.transacao_id,
+                'decisao_final': decisao.decisao,
+                'score_risco': decisao.score_risco,
+                'reavaliacao': True,
+                'decisao_anterior': decisao_anterior.decisao,
+                'score_anterior': decisao_anterior.score_risco,
+                'motivo': decisao.motivo
+            }
+            
+            url = f"{settings.CALLBACK_URL_PRINCIPAL}/api/antifraude/callback/"
+            
+            response = requests.post(url, json=payload, timeout=10)
+            
+            if response.status_code != 200:
+                print(f"Erro no callback de reavaliação: {response.status_code} - {response.text}")
+        
+        except Exception as e:
+            print(f"Erro ao notificar reavaliação ao app principal: {e}")
+    
+    @staticmethod
+    def notificar_sessao_3ds(callback_url, sessao):
+        """
+        Callback com resultado da preparação assíncrona do 3DS
+        
+        Args:
+            callback_url: URL informada pelo cliente no analyze
+            sessao: Sessão 3DS pública (Auth3DSService.sessao_publica)
+        """
+        try:
+            # Revalida no envio: o DNS do host pode ter mudado desde o analyze
+            from .services_3ds import Auth3DSService
+            erro = Auth3DSService.validar_callback_url(callback_url)
+            if erro:
+                print(f"Callback de sessão 3DS recusado: {erro}")
+                return
+            
+            response = requests.post(callback_url, json=sessao, timeout=10, allow_redirects=False)
+            
+            if response.status_code != 200:
+                print(f"Erro no callback de sessão 3DS: {response.status_code} - {response.text}")
+        
+        except Exception as e:
+            print(f"Erro ao notificar sessão 3DS: {e}")
@@ -0,0 +1,84 @@
+"""
+Paginação keyset (cursor) das listagens
+
+Ordena por (campo de data, id) decrescente e continua de onde a página
+anterior parou: WHERE (data < d) OR (data = d AND id < i) ORDER BY data DESC,
+id DESC LIMIT n. Com índice no campo de data (o InnoDB inclui a PK em todo
+índice), cada página custa o mesmo qualquer que seja o tamanho da tabela, ao
+contrário de OFFSET, que relê as linhas puladas.
+
+O cursor é opaco para o cliente: repassar o `proximo_cursor` da resposta.
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db.models import Q
+
+from .models_config import ConfiguracaoAntifraude
+
+
+class PaginacaoKeyset:
+    """
+    Uso:
+        itens, proximo = PaginacaoKeyset.paginar(query, 'detectado_em', request.GET.get('cursor'), limite)
+    """
+
+    LIMITE_MAXIMO = 200
+
+    @staticmethod
+    def codificar_cursor(data: datetime, id_: int) -> str:
+        return base64.urlsafe_b64encode(f"{data.isoformat()}|{id_}".encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+        """(data, id) do cursor; ValueError se inválido"""
+        try:
+            texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            data, id_ = texto.split('|')
+            return datetime.fromisoformat(data), int(id_)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f"Cursor inválido: {cursor}") from e
+
+    @classmethod
+    def limite(cls, valor, padrao: int) -> int:
+        """Tamanho da página pedido, entre 1 e LIMITE_MAXIMO"""
+        try:
+            return max(1, min(int(valor), cls.LIMITE_MAXIMO))
+        except (TypeError, ValueError):
+            return padrao
+
+    @classmethod
+    def paginar(cls, queryset, campo_data: str, cursor: Optional[str] = None, limite: int = 50) -> Tuple[list, Optional[str]]:
+        """
+        Página de até `limite` itens após o cursor
+
+        Returns:
+            tuple: (itens, proximo_cursor ou None na última página)
+        """
+        if cursor:
+            data, id_ = cls.decodificar_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{campo_data}__lt': data}) | Q(**{campo_data: data, 'id__lt': id_})
+            )
+
+        # Um item a mais indica se existe próxima página
+        itens = list(queryset.order_by(f'-{campo_data}', '-id')[:limite + 1])
+        if len(itens) <= limite:
+            return itens, None
+
+        itens = itens[:limite]
+        ultimo = itens[-1]
+        return itens, cls.codificar_cursor(getattr(ultimo, campo_data), ultimo.id)
+
+    @staticmethod
+    def contar(queryset) -> Tuple[int, bool]:
+        """
+        Total com custo limitado: conta no máximo PAGINACAO_CONTAGEM_MAXIMA linhas
+
+        Returns:
+            tuple: (total, aproximado) — aproximado=True quando atingiu o máximo
+        """
+        maximo = ConfiguracaoAntifraude.get_config('PAGINACAO_CONTAGEM_MAXIMA', 10000)
+        total = queryset.order_by()[:maximo].count()
+        return total, total >= maximo
@@ -5,6 +5,7 @@ Fase 2 - Semana 7-9
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from decimal import Decimal
+from django.conf import settings
 from django.db import models
 from .models import TransacaoRisco, DecisaoAntifraude, RegraAntifraude
 import logging
@@ -278,24 +279,31 @@ class AnaliseRiscoService:
                 f"Whitelist encontrada: {transacao.transacao_id} - Desconto: -{desconto_whitelist} pontos"
             )
         
-        # 1. Consultar MaxMind para score base
-        from .services_maxmind import MaxMindService
+        # 1. Consultar MaxMind para score base (política decide se a consulta vale o custo)
+        from .services_maxmind import MaxMindService, PoliticaConsultaMaxMind
         
-        dados_transacao = {
-            'transacao_id': transacao.transacao_id,
-            'cliente_id': transacao.cliente_id,
-            'cpf': transacao.cpf,
-            'cliente_nome': transacao.cliente_nome,
-            'valor': transacao.valor,
-            'modalidade': transacao.modalidade,
-            'ip_address': transacao.ip_address,
-            'user_agent': transacao.user_agent,
-            'device_fingerprint': transacao.device_fingerprint,
-            'bin_cartao': transacao.bin_cartao,
-            'loja_id': transacao.loja_id
-        }
+        dados_transacao = AnaliseRiscoService._dados_maxmind(transacao)
+        
+        consultar_maxmind, motivo_politica = PoliticaConsultaMaxMind.deve_consultar(
+            dados_transacao,
+            origem=transacao.origem,
+            whitelists=whitelists
+        )
+        
+        # POS (cartão presente): decide só com sinais internos e reavalia MaxMind depois
+        reavaliar_assincrono = (
+            consultar_maxmind
+            and transacao.origem == 'POS'
+            and ConfiguracaoAntifraude.get_config('MAXMIND_POS_ASSINCRONO', False)
+        )
+        
+        if reavaliar_assincrono:
+            resultado_maxmind = PoliticaConsultaMaxMind.score_provisorio(transacao.cpf)
+        elif consultar_maxmind:
+            resultado_maxmind = MaxMindService.consultar_score(dados_transacao)
+        else:
+            resultado_maxmind = PoliticaConsultaMaxMind.score_sem_consulta(transacao.cpf, motivo_politica)
         
-        resultado_maxmind = MaxMindService.consultar_score(dados_transacao)
         score_total = resultado_maxmind['score']
         
         registrar_log(
@@ -359,8 +367,9 @@ class AnaliseRiscoService:
             )
         
         # 3. Buscar regras ativas ordenadas por prioridade
-        regras = RegraAntifraude.objects.filter(is_active=True).order_by('prioridade')
+        regras = RegraAntifraude.regras_ativas()
         decisao_final = 'APROVADO'
+        ajuste_regras = 0
         
         # 3. Executar regras internas (ajustam score MaxMind)
         for regra in regras:
@@ -369,8 +378,10 @@ class AnaliseRiscoService:
             if resultado['acionada']:
                 ajuste_score = regra.peso * 5  # Peso 1-10 → Ajuste 5-50 pontos
                 score_total += ajuste_score
+                ajuste_regras += ajuste_score
                 
                 regras_acionadas.append({
+                    'regra_id': regra.id,
                     'nome': regra.nome,
                     'tipo': regra.tipo,
                     'peso': regra.peso,
@@ -389,6 +400,15 @@ class AnaliseRiscoService:
         # 4. Limitar score a 100
         score_total = min(score_total, 100)
         
+        # Componentes do score além do MaxMind, antes dos limites 0-100: a reavaliação
+        # recalcula a partir deles (o score gravado já pode ter sido limitado)
+        if reavaliar_assincrono:
+            regras_acionadas[0]['detalhes'] = {
+                **(resultado_maxmind['detalhes'] or {}),
+                'desconto_whitelist': desconto_whitelist,
+                'ajuste_sem_maxmind': score_auth + ajuste_regras
+            }
+        
         # 5. Decisão final baseada em thresholds (usa configurações)
         from .models_config import ConfiguracaoAntifraude
         
@@ -437,8 +457,160 @@ class AnaliseRiscoService:
             except Exception as e:
                 registrar_log('antifraude.whitelist_auto', f"Erro ao verificar whitelist automática: {str(e)}", nivel='ERROR')
         
+        # Reavaliação MaxMind fora do hot path (só importa se aprovada: REVISAO/REPROVADO já são tratadas)
+        if reavaliar_assincrono and decisao_final == 'APROVADO':
+            try:
+                from .tasks import reavaliar_maxmind_pos
+                reavaliar_maxmind_pos.delay(decisao.id)
+            except Exception as e:
+                registrar_log('antifraude.maxmind', f"Erro ao agendar reavaliação MaxMind: {str(e)}", nivel='ERROR')
+        
         return decisao
     
+    @staticmethod
+    def _dados_maxmind(transacao: TransacaoRisco) -> Dict[str, Any]:
+        """Monta dados da transação no formato esperado por MaxMindService"""
+        return {
+            'transacao_id': transacao.transacao_id,
+            'cliente_id': transacao.cliente_id,
+            'cpf': transacao.cpf,
+            'cliente_nome': transacao.cliente_nome,
+            'valor': transacao.valor,
+            'modalidade': transacao.modalidade,
+            'ip_address': transacao.ip_address,
+            'user_agent': transacao.user_agent,
+            'device_fingerprint': transacao.device_fingerprint,
+            'bin_cartao': transacao.bin_cartao,
+            'loja_id': transacao.loja_id
+        }
+    
+    @staticmethod
+    def reavaliar_maxmind(decisao: DecisaoAntifraude) -> Optional[DecisaoAntifraude]:
+        """
+        Recalcula score de decisão provisória com o score real do MaxMind
+        
+        Substitui o score provisório pelo retornado pela API. Se o novo score
+        cruzar SCORE_LIMITE_REVISAO, registra segunda decisão REVISAO e notifica.
+        
+        Idempotente (task reentregue ou duplicada): com a decisão original
+        travada (select_for_update), pula se ela já foi reavaliada ou revisada,
+        ou se já existe decisão com decisao_anterior_id apontando para ela; e
+        marca a original como reavaliada na mesma transação.
+        
+        Args:
+            decisao: DecisaoAntifraude tomada com score MaxMind provisório
+        
+        Returns:
+            DecisaoAntifraude: Nova decisão REVISAO, ou None se nada mudou
+        """
+        from django.db import transaction as transacao_db
+        from .services_maxmind import MaxMindService
+        from .models_config import ConfiguracaoAntifraude
+        
+        if not AnaliseRiscoService._regra_provisoria(decisao):
+            return None
+        
+        transacao = decisao.transacao
+        
+        # Chamada externa fora do lock da linha
+        resultado_maxmind = MaxMindService.consultar_score(AnaliseRiscoService._dados_maxmind(transacao))
+        
+        if resultado_maxmind['fonte'] == 'fallback':
+            raise RuntimeError(f"MaxMind indisponível: {resultado_maxmind['detalhes'].get('motivo')}")
+        
+        limite_revisao = ConfiguracaoAntifraude.get_config('SCORE_LIMITE_REVISAO', 31)
+        
+        with transacao_db.atomic():
+            decisao = DecisaoAntifraude.objects.select_for_update().select_related('transacao').get(id=decisao.id)
+            regra_externa = AnaliseRiscoService._regra_provisoria(decisao)
+            if not regra_externa or decisao.revisado_por or AnaliseRiscoService._ja_reavaliada(decisao):
+                registrar_log('antifraude.maxmind', f"Reavaliação MaxMind da decisão {decisao.id} já feita, ignorando")
+                return None
+            
+            score_provisorio = regra_externa['peso']
+            detalhes_provisorios = regra_externa['detalhes']
+            
+            # Mesma conta da análise: desconto de whitelist (mínimo 0), ajustes, máximo 100
+            score_base = max(0, resultado_maxmind['score'] - detalhes_provisorios.get('desconto_whitelist', 0))
+            novo_score = max(0, min(score_base + detalhes_provisorios.get('ajuste_sem_maxmind', 0), 100))
+            
+            registrar_log(
+                'antifraude.maxmind',
+                f"Reavaliação MaxMind: {transacao.transacao_id} - Score {decisao.score_risco} → {novo_score} "
+                f"(MaxMind {score_provisorio} → {resultado_maxmind['score']})"
+            )
+            
+            # Marca a original: reentregas da task param no guard acima
+            detalhes_provisorios.update({
+                'provisorio': False,
+                'reavaliado_em': datetime.now().isoformat(),
+                'score_reavaliado': resultado_maxmind['score']
+            })
+            decisao.save(update_fields=['regras_acionadas', 'updated_at'])
+            
+            if not (decisao.score_risco < limite_revisao <= novo_score):
+                return None
+            
+            regras_acionadas = [
+                r for r in decisao.regras_acionadas if r.get('tipo') != 'SCORE_EXTERNO'
+            ]
+            regras_acionadas.insert(0, {
+                'nome': 'MaxMind minFraud',
+                'tipo': 'SCORE_EXTERNO',
+                'peso': resultado_maxmind['score'],
+                'acao': 'REVISAR',
+                'detalhes': {
+                    **resultado_maxmind['detalhes'],
+                    'reavaliacao': True,
+                    'score_provisorio': score_provisorio,
+                    'decisao_anterior_id': decisao.id
+                }
+            })
+            
+            nova_decisao = DecisaoAntifraude.objects.create(
+                transacao=transacao,
+                score_risco=novo_score,
+                decisao='REVISAO',
+                regras_acionadas=regras_acionadas,
+                motivo=(
+                    f"Reavaliação MaxMind pós-decisão: score {decisao.score_risco} → {novo_score} "
+                    f"(>={limite_revisao}) - requer revisão"
+                ),
+                tempo_analise_ms=resultado_maxmind['tempo_consulta_ms']
+            )
+        
+        try:
+            from .notifications import NotificacaoService
+            NotificacaoService.notificar_revisao_pendente(nova_decisao)
+            NotificacaoService.notificar_reavaliacao(nova_decisao, decisao)
+        except Exception as e:
+            registrar_log('antifraude.notificacao', f"Erro ao notificar reavaliação: {str(e)}", nivel='ERROR')
+        
+        return nova_decisao
+    
+    @staticmethod
+    def _regra_provisoria(decisao: DecisaoAntifraude) -> Optional[Dict]:
+        """Regra SCORE_EXTERNO da decisão se o score MaxMind ainda for provisório"""
+        regra_externa = next(
+            (r for r in decisao.regras_acionadas if r.get('tipo') == 'SCORE_EXTERNO'),
+            None
+        )
+        if not regra_externa or not regra_externa.get('detalhes', {}).get('provisorio'):
+            return None
+        return regra_externa
+    
+    @staticmethod
+    def _ja_reavaliada(decisao: DecisaoAntifraude) -> bool:
+        """Existe decisão posterior da transação com decisao_anterior_id = decisao.id"""
+        posteriores = DecisaoAntifraude.objects.filter(
+            transacao_id=decisao.transacao_id, id__gt=decisao.id
+        ).values_list('regras_acionadas', flat=True)
+        return any(
+            (regra.get('detalhes') or {}).get('decisao_anterior_id') == decisao.id
+            for regras in posteriores
+            for regra in regras or []
+        )
+    
     @staticmethod
     def _executar_regra(regra: RegraAntifraude, transacao: TransacaoRisco) -> Dict[str, Any]:
         """
@@ -480,11 +652,18 @@ class AnaliseRiscoService:
         
         janela_inicio = transacao.data_transacao - timedelta(minutes=janela_minutos)
         
-        count = TransacaoRisco.objects.filter(
-            cpf=transacao.cpf,
-            data_transacao__gte=janela_inicio,
-            data_transacao__lte=transacao.data_transacao
-        ).count()
+        if getattr(settings, 'ROLLUPS_LEITURA_ATIVA', False):
+            # Rollups por minuto do CPF + contagem exata dos minutos parciais
+            from .services_rollup import RollupService
+            count = RollupService.contar_transacoes(
+                'cpf', transacao.cpf, janela_inicio, transacao.data_transacao
+            )
+        else:
+            count = TransacaoRisco.objects.filter(
+                cpf=transacao.cpf,
+                data_transacao__gte=janela_inicio,
+                data_transacao__lte=transacao.data_transacao
+            ).count()
         
         if count > max_transacoes:
             return {
@@ -521,10 +700,17 @@ class AnaliseRiscoService:
         if not transacao.device_fingerprint:
             return {'acionada': False, 'motivo': '', 'detalhes': {}}
         
-        ja_usado = TransacaoRisco.objects.filter(
-            cliente_id=transacao.cliente_id,
-            device_fingerprint=transacao.device_fingerprint
-        ).exclude(id=transacao.id).exists()
+        if getattr(settings, 'VINCULOS_LEITURA_ATIVA', False):
+            # Busca pela chave única do vínculo (CPF + hash do dispositivo)
+            from .models import VinculoCpfEntidade
+            ja_usado = not VinculoCpfEntidade.entidade_nova(
+                transacao, VinculoCpfEntidade.TIPO_DISPOSITIVO, transacao.device_fingerprint
+            )
+        else:
+            ja_usado = TransacaoRisco.objects.filter(
+                cliente_id=transacao.cliente_id,
+                device_fingerprint=transacao.device_fingerprint
+            ).exclude(id=transacao.id).exists()
         
         if not ja_usado:
             return {
@@ -563,6 +749,8 @@ class AnaliseRiscoService:
         
         janela_inicio = transacao.data_transacao - timedelta(hours=janela_horas)
         
+        # Contagem exata (índice ip_address + data_transacao): o sketch dos rollups
+        # erra por colisão justamente na faixa do limite e não serve para decisão
         cpfs_distintos = TransacaoRisco.objects.filter(
             ip_address=transacao.ip_address,
             data_transacao__gte=janela_inicio
@@ -6,14 +6,25 @@ Implementa autenticação 3DS 2.0 para transações com cartão de crédito.
 O 3DS adiciona uma camada extra de segurança validando o titular do cartão
 através do banco emissor.
 """
+from array import array
+from bisect import bisect_left
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 from decimal import Decimal
+from urllib.parse import urlsplit
 import requests
 import hashlib
+import ipaddress
 import json
 import logging
+import socket
+import threading
+import time
+import uuid
 from django.conf import settings
+from django.core.cache import cache
+
+from .singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +37,110 @@ def registrar_log(modulo, mensagem, nivel='INFO'):
         logger.info(f"[{modulo}] {mensagem}")
 
 
+class TabelaBin:
+    """
+    Tabela de BINs em memória (por processo)
+    
+    Cada tamanho de BIN (6 e 8 dígitos) vira um array ordenado de inteiros com
+    uma lista paralela de registros; a busca é binária (bisect), sem I/O.
+    A tabela é recarregada do banco quando a versão publicada no cache muda
+    (comando atualizar_tabela_bin).
+    """
+    
+    CHAVE_VERSAO = '3ds:bin_tabela:versao'
+    VERIFICAR_VERSAO_SEGUNDOS = 60
+    
+    _chaves = {}  # {tamanho: array('Q')}
+    _registros = {}  # {tamanho: [dict]}
+    _versao = None
+    _verificado_em = 0.0
+    _lock = threading.Lock()
+    
+    @classmethod
+    def buscar(cls, bin_cartao: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Busca BIN na tabela local (8 dígitos primeiro, depois 6)
+        
+        Args:
+            bin_cartao: BIN ou início do número do cartão (6+ dígitos)
+        
+        Returns:
+            dict com bin, emissor, pais, bandeira, tipo_cartao, versao_3ds ou None
+        """
+        if not bin_cartao or not bin_cartao.isdigit() or len(bin_cartao) < 6:
+            return None
+        
+        cls.garantir_carregada()
+        
+        for tamanho in (8, 6):
+            if len(bin_cartao) < tamanho:
+                continue
+            chaves = cls._chaves.get(tamanho)
+            if not chaves:
+                continue
+            chave = int(bin_cartao[:tamanho])
+            posicao = bisect_left(chaves, chave)
+            if posicao < len(chaves) and chaves[posicao] == chave:
+                return cls._registros[tamanho][posicao]
+        
+        return None
+    
+    @classmethod
+    def carregar(cls):
+        """Carrega (ou recarrega) a tabela inteira do banco"""
+        from .models import BinCartao
+        
+        chaves = {6: array('Q'), 8: array('Q')}
+        registros = {6: [], 8: []}
+        
+        # order_by('bin'): para BINs de mesmo tamanho, ordem textual = ordem numérica
+        campos = ('bin', 'emissor', 'pais', 'bandeira', 'tipo_cartao', 'versao_3ds')
+        for linha in BinCartao.objects.order_by('bin').values_list(*campos).iterator(chunk_size=5000):
+            registro = dict(zip(campos, linha))
+            tamanho = len(registro['bin'])
+            if tamanho not in chaves or not registro['bin'].isdigit():
+                continue
+            chaves[tamanho].append(int(registro['bin']))
+            registros[tamanho].append(registro)
+        
+        cls._chaves = chaves
+        cls._registros = registros
+        
+        registrar_log(
+            'antifraude.3ds',
+            f'Tabela BIN carregada: {len(chaves[6])} BINs de 6 dígitos, {len(chaves[8])} de 8 dígitos'
+        )
+    
+    @classmethod
+    def publicar_versao(cls):
+        """Sinaliza para todos os processos que a tabela mudou"""
+        cache.set(cls.CHAVE_VERSAO, time.time(), None)
+    
+    @classmethod
+    def total(cls) -> int:
+        return sum(len(c) for c in cls._chaves.values())
+    
+    @classmethod
+    def garantir_carregada(cls):
+        """Carrega a tabela se ainda não carregada ou se a versão publicada mudou"""
+        agora = time.monotonic()
+        if cls._versao is not None and agora - cls._verificado_em < cls.VERIFICAR_VERSAO_SEGUNDOS:
+            return
+        
+        with cls._lock:
+            if cls._versao is not None and agora - cls._verificado_em < cls.VERIFICAR_VERSAO_SEGUNDOS:
+                return
+            try:
+                versao = cache.get(cls.CHAVE_VERSAO) or 0
+                if versao != cls._versao:
+                    cls.carregar()
+                    cls._versao = versao
+            except Exception as e:
+                # Fail-open: mantém tabela anterior (ou vazia)
+                registrar_log('antifraude.3ds', f'Erro ao carregar tabela BIN: {str(e)}', nivel='ERROR')
+            cls._verificado_em = agora
+
+
 class Auth3DSService:
     """
     Service para autenticação 3D Secure 2.0
@@ -42,14 +157,36 @@ class Auth3DSService:
     - THREEDS_MERCHANT_ID
     - THREEDS_MERCHANT_KEY
     - THREEDS_ENABLED (True/False)
+    
+    Opcionais:
+    - THREEDS_ELEGIBILIDADE_CACHE_SEGUNDOS (BIN elegível, padrão 24h)
+    - THREEDS_ELEGIBILIDADE_CACHE_NEGATIVO_SEGUNDOS (BIN não elegível, padrão 1h)
+    - THREEDS_ASSINCRONO (analyze não espera o gateway, padrão True)
     """
     
+    CACHE_PREFIXO = '3ds:elegibilidade'
+    
+    # Coalescência de consultas de elegibilidade simultâneas do mesmo BIN
+    _coalescencia = SingleFlight(
+        '3ds_elegibilidade',
+        espera_maxima_segundos=getattr(settings, 'THREEDS_TIMEOUT', 30),
+        lock_segundos=getattr(settings, 'THREEDS_TIMEOUT', 30) + 5
+    )
+    
+    # Sessões assíncronas: analyze responde na hora e o worker Celery fala com o gateway
+    SESSAO_PREFIXO = '3ds:sessao'
+    SESSAO_TTL_SEGUNDOS = 1800
+    CAMPOS_INTERNOS_SESSAO = ('decisao_original', 'motivo_original', 'bin_cartao', 'valor', 'dados_cliente', 'callback_url')
+    
     def __init__(self):
         self.gateway_url = getattr(settings, 'THREEDS_GATEWAY_URL', None)
         self.merchant_id = getattr(settings, 'THREEDS_MERCHANT_ID', None)
         self.merchant_key = getattr(settings, 'THREEDS_MERCHANT_KEY', None)
         self.enabled = getattr(settings, 'THREEDS_ENABLED', False)
         self.timeout = getattr(settings, 'THREEDS_TIMEOUT', 30)
+        self.cache_segundos = getattr(settings, 'THREEDS_ELEGIBILIDADE_CACHE_SEGUNDOS', 86400)
+        self.cache_negativo_segundos = getattr(settings, 'THREEDS_ELEGIBILIDADE_CACHE_NEGATIVO_SEGUNDOS', 3600)
+        self.assincrono = getattr(settings, 'THREEDS_ASSINCRONO', True)
     
     def esta_habilitado(self) -> bool:
         """Verifica se 3DS está habilitado e configurado"""
@@ -70,8 +207,12 @@ class Auth3DSService:
         """
         Verifica se cartão está inscrito no 3DS (enrolled)
         
+        A resposta depende praticamente só do BIN, então é cacheada por BIN
+        (TTL menor para não elegível). Erros e timeouts não são cacheados.
+        BIN presente na tabela local sem versão 3DS não vai ao gateway.
+        
         Args:
-            bin_cartao: Primeiros 6 dígitos do cartão
+            bin_cartao: Primeiros 6 (ou 8) dígitos do cartão
             valor: Valor da transação
         
         Returns:
@@ -92,6 +233,35 @@ class Auth3DSService:
                 'mensagem': '3DS não está habilitado'
             }
         
+        info_bin = TabelaBin.buscar(bin_cartao)
+        if info_bin and not info_bin['versao_3ds']:
+            return {
+                'elegivel': False,
+                'versao_3ds': None,
+                'banco_emissor': info_bin['emissor'],
+                'acs_url': None,
+                'mensagem': 'BIN sem suporte a 3DS (tabela local)'
+            }
+        
+        chave_cache = f"{self.CACHE_PREFIXO}:{info_bin['bin'] if info_bin else bin_cartao}"
+        try:
+            em_cache = cache.get(chave_cache)
+            if em_cache is not None:
+                return em_cache
+        except Exception as e:
+            registrar_log('antifraude.3ds', f'Erro ao ler cache de elegibilidade: {str(e)}', nivel='ERROR')
+        
+        # Vários cartões do mesmo BIN ao mesmo tempo: uma consulta ao gateway
+        return self._coalescencia.executar(
+            chave_cache,
+            buscar=lambda: self._consultar_elegibilidade(bin_cartao, valor, chave_cache),
+            ler_cache=lambda: cache.get(chave_cache),
+            fallback=lambda: self._resultado_erro('Timeout na verificação'),
+            espera_maxima_segundos=self.timeout
+        )
+    
+    def _consultar_elegibilidade(self, bin_cartao: str, valor: Decimal, chave_cache: str) -> Dict[str, Any]:
+        """Chamada ao /v2/check-enrollment; grava cache se o gateway responder"""
         try:
             payload = {
                 'merchant_id': self.merchant_id,
@@ -127,6 +297,8 @@ class Auth3DSService:
                     f'BIN {bin_cartao} - Elegível: {resultado["elegivel"]}'
                 )
                 
+                self._gravar_cache_elegibilidade(chave_cache, resultado)
+                
                 return resultado
             else:
                 registrar_log(
@@ -144,6 +316,198 @@ class Auth3DSService:
             registrar_log('antifraude.3ds', f'Exceção ao verificar elegibilidade: {str(e)}', nivel='ERROR')
             return self._resultado_erro(f'Erro: {str(e)}')
     
+    def elegibilidade_local(self, bin_cartao: str) -> Optional[Dict[str, Any]]:
+        """
+        Elegibilidade sem ir à rede (tabela local ou cache), ou None se desconhecida
+        """
+        info_bin = TabelaBin.buscar(bin_cartao)
+        if info_bin and not info_bin['versao_3ds']:
+            return self.verificar_elegibilidade(bin_cartao, Decimal('0'))
+        
+        try:
+            return cache.get(f"{self.CACHE_PREFIXO}:{info_bin['bin'] if info_bin else bin_cartao}")
+        except Exception:
+            return None
+    
+    @staticmethod
+    def validar_callback_url(url: str) -> Optional[str]:
+        """
+        Valida callback_url_3ds informada pelo cliente (evita SSRF pelo worker)
+        
+        Exige https, host em THREEDS_CALLBACK_HOSTS (sem lista, nenhum callback
+        é aceito) e que o host resolva só para endereços públicos (não
+        privados, loopback, link-local/metadata ou reservados).
+        
+        Returns:
+            str: Motivo da recusa, ou None se a URL for aceita
+        """
+        try:
+            partes = urlsplit(url)
+            porta = partes.port
+        except (TypeError, ValueError):
+            return 'URL inválida'
+        
+        if partes.scheme != 'https' or not partes.hostname:
+            return 'callback_url_3ds deve ser https'
+        if partes.username or partes.password:
+            return 'callback_url_3ds não pode conter credenciais'
+        
+        host = partes.hostname.lower()
+        permitidos = [h.strip().lower() for h in getattr(settings, 'THREEDS_CALLBACK_HOSTS', []) if h.strip()]
+        if host not in permitidos:
+            return f'Host de callback não permitido: {host}'
+        
+        try:
+            enderecos = {info[4][0] for info in socket.getaddrinfo(host, porta or 443, proto=socket.IPPROTO_TCP)}
+        except (socket.gaierror, UnicodeError):
+            return f'Host de callback não resolvido: {host}'
+        
+        for endereco in enderecos:
+            ip = ipaddress.ip_address(endereco.split('%')[0])
+            if not ip.is_global or ip.is_multicast:
+                return f'Host de callback resolve para endereço não público: {host}'
+        
+        return None
+    
+    @classmethod
+    def criar_sessao(
+        cls,
+        decisao,
+        motivo_3ds: str,
+        decisao_original: str,
+        motivo_original: str,
+        dados_cliente: Optional[Dict] = None,
+        callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Cria sessão 3DS pendente (cache) para ser processada por processar_sessao()
+        
+        Args:
+            decisao: DecisaoAntifraude já marcada como REQUER_3DS
+            motivo_3ds: Motivo da recomendação de 3DS
+            decisao_original/motivo_original: Restaurados se o cartão não for elegível
+            dados_cliente: Dados para iniciar_autenticacao()
+            callback_url: URL opcional para receber o resultado (POST)
+        
+        Returns:
+            dict: Sessão pública (sem campos internos)
+        """
+        transacao = decisao.transacao
+        agora = datetime.now().isoformat()
+        
+        sessao = {
+            'sessao_id': f"3DS-{uuid.uuid4().hex}",
+            'status': 'PENDENTE',
+            'transacao_id': transacao.transacao_id,
+            'decisao_id': decisao.id,
+            'decisao': decisao.decisao,
+            'motivo': motivo_3ds,
+            'dados_3ds': None,
+            'mensagem': 'Autenticação 3DS em preparação',
+            'criada_em': agora,
+            'atualizada_em': agora,
+            'decisao_original': decisao_original,
+            'motivo_original': motivo_original,
+            'bin_cartao': transacao.bin_cartao,
+            'valor': str(transacao.valor),
+            'dados_cliente': dados_cliente,
+            'callback_url': callback_url
+        }
+        
+        cls._salvar_sessao(sessao)
+        return cls.sessao_publica(sessao)
+    
+    @classmethod
+    def obter_sessao(cls, sessao_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna sessão completa do cache (ou None se expirada/inexistente)"""
+        return cache.get(f"{cls.SESSAO_PREFIXO}:{sessao_id}")
+    
+    @classmethod
+    def sessao_publica(cls, sessao: Dict[str, Any]) -> Dict[str, Any]:
+        """Sessão sem dados internos (PII do cliente, callback, decisão original)"""
+        return {k: v for k, v in sessao.items() if k not in cls.CAMPOS_INTERNOS_SESSAO}
+    
+    @classmethod
+    def _salvar_sessao(cls, sessao: Dict[str, Any]):
+        sessao['atualizada_em'] = datetime.now().isoformat()
+        cache.set(f"{cls.SESSAO_PREFIXO}:{sessao['sessao_id']}", sessao, cls.SESSAO_TTL_SEGUNDOS)
+    
+    def processar_sessao(self, sessao_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Executa elegibilidade + início da autenticação de uma sessão pendente
+        
+        Roda no worker Celery (ou inline se o broker estiver fora). Se o cartão
+        não for elegível ou o gateway falhar, a decisão volta a ser a original,
+        como no fluxo síncrono.
+        
+        Returns:
+            dict: Sessão pública atualizada, ou None se a sessão não existe
+        """
+        from .models import DecisaoAntifraude
+        
+        sessao = self.obter_sessao(sessao_id)
+        if not sessao:
+            registrar_log('antifraude.3ds', f'Sessão 3DS não encontrada: {sessao_id}', nivel='ERROR')
+            return None
+        
+        if sessao['status'] != 'PENDENTE':
+            return self.sessao_publica(sessao)
+        
+        valor = Decimal(sessao['valor'])
+        elegibilidade = self.verificar_elegibilidade(sessao['bin_cartao'], valor)
+        
+        if not elegibilidade['elegivel']:
+            sessao['status'] = 'NAO_ELEGIVEL'
+            sessao['mensagem'] = elegibilidade['mensagem']
+        else:
+            auth_resultado = self.iniciar_autenticacao(
+                transacao_id=sessao['transacao_id'],
+                bin_cartao=sessao['bin_cartao'],
+                valor=valor,
+                dados_cliente=sessao['dados_cliente']
+            )
+            
+            if auth_resultado['sucesso']:
+                sessao['status'] = 'PRONTA'
+                sessao['mensagem'] = auth_resultado['mensagem']
+                sessao['dados_3ds'] = {
+                    'auth_id': auth_resultado['auth_id'],
+                    'redirect_url': auth_resultado['redirect_url'],
+                    'metodo': auth_resultado['metodo'],
+                    'expiracao': auth_resultado['expiracao'],
+                    'motivo': sessao['motivo']
+                }
+            else:
+                sessao['status'] = 'ERRO'
+                sessao['mensagem'] = auth_resultado['mensagem']
+        
+        if sessao['status'] != 'PRONTA':
+            # Sem 3DS: restaurar decisão original (se ninguém mexeu nela nesse meio tempo)
+            atualizadas = DecisaoAntifraude.objects.filter(
+                id=sessao['decisao_id'],
+                decisao='REQUER_3DS'
+            ).update(
+                decisao=sessao['decisao_original'],
+                motivo=sessao['motivo_original'],
+                updated_at=datetime.now()  # update() não aplica auto_now: agregados e detectores leem updated_at
+            )
+            if atualizadas:
+                sessao['decisao'] = sessao['decisao_original']
+        
+        sessao['dados_cliente'] = None
+        self._salvar_sessao(sessao)
+        
+        registrar_log(
+            'antifraude.3ds',
+            f"Sessão 3DS {sessao_id} processada - Status: {sessao['status']} - Decisão: {sessao['decisao']}"
+        )
+        
+        if sessao['callback_url']:
+            from .notifications import NotificacaoService
+            NotificacaoService.notificar_sessao_3ds(sessao['callback_url'], self.sessao_publica(sessao))
+        
+        return self.sessao_publica(sessao)
+    
     def iniciar_autenticacao(
         self,
         transacao_id: str,
@@ -334,6 +698,11 @@ class Auth3DSService:
         if not self.esta_habilitado():
             return False, '3DS não habilitado'
         
+        # Regra 0: BIN conhecido sem suporte a 3DS (tabela local) - desafio impossível
+        info_bin = TabelaBin.buscar(bin_cartao)
+        if info_bin and not info_bin['versao_3ds']:
+            return False, f'BIN {info_bin["bin"]} sem suporte a 3DS'
+        
         # Regra 1: Score de risco alto (>60) sempre usa 3DS
         if score_risco > 60:
             return True, f'Score de risco alto ({score_risco})'
@@ -353,6 +722,14 @@ class Auth3DSService:
         # Score baixo (<40) e valor baixo (<R$ 200) não precisa 3DS
         return False, f'Score baixo ({score_risco}) e valor baixo (R$ {valor})'
     
+    def _gravar_cache_elegibilidade(self, chave: str, resultado: Dict[str, Any]):
+        """Cacheia resposta do gateway (negativa com TTL menor)"""
+        ttl = self.cache_segundos if resultado['elegivel'] else self.cache_negativo_segundos
+        try:
+            cache.set(chave, resultado, ttl)
+        except Exception as e:
+            registrar_log('antifraude.3ds', f'Erro ao gravar cache de elegibilidade: {str(e)}', nivel='ERROR')
+    
     def _gerar_assinatura(self, payload: Dict) -> str:
         """Gera assinatura HMAC SHA256 para requisição"""
         # Ordenar chaves para assinatura consistente
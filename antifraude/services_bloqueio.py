@@ -0,0 +1,200 @@
+"""
+Service: Bloqueios de Segurança (IP/CPF)
+Cache da consulta do validate_login e bloqueio automático em lote
+"""
+from datetime import datetime, timedelta
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import AtividadeSuspeita, BloqueioSeguranca
+from .models_config import ConfiguracaoAntifraude
+
+logger = logging.getLogger('antifraude.seguranca')
+
+
+class BloqueioService:
+    """
+    Consulta de bloqueios ativos com cache e criação de bloqueios em lote
+    
+    O validate_login é chamado em todo login dos portais; a consulta fica no
+    cache (positivo e negativo) e é republicada sempre que um bloqueio é
+    salvo ou removido (signals, e publicar() no pipeline em lote, que não
+    dispara signals), então bloqueios e desbloqueios valem na hora.
+    """
+    
+    CACHE_PREFIXO = 'bloqueio'
+    
+    @classmethod
+    def _chave(cls, tipo: str, valor: str) -> str:
+        return f"{cls.CACHE_PREFIXO}:{tipo}:{valor}"
+    
+    @staticmethod
+    def _dados(bloqueio: BloqueioSeguranca) -> dict:
+        return {
+            'id': bloqueio.id,
+            'tipo': bloqueio.tipo,
+            'valor': bloqueio.valor,
+            'motivo': bloqueio.motivo,
+        }
+    
+    @staticmethod
+    def _timeout() -> int:
+        return ConfiguracaoAntifraude.get_config('BLOQUEIO_CACHE_SEGUNDOS', 300)
+    
+    @classmethod
+    def verificar_login(cls, ip: str, cpf: str):
+        """
+        Retorna o bloqueio ativo do IP (prioridade) ou do CPF
+        
+        Returns:
+            dict: id, tipo, valor, motivo do bloqueio; None se não bloqueado
+        """
+        chaves = {('ip', ip): cls._chave('ip', ip), ('cpf', cpf): cls._chave('cpf', cpf)}
+        
+        try:
+            em_cache = cache.get_many(list(chaves.values()))
+        except Exception as e:
+            logger.error(f"Erro ao ler cache de bloqueios: {str(e)}")
+            em_cache = {}
+        
+        faltantes = [(tipo, valor) for (tipo, valor), chave in chaves.items() if chave not in em_cache]
+        if faltantes:
+            encontrados = {
+                (b.tipo, b.valor): cls._dados(b)
+                for b in BloqueioSeguranca.objects.filter(ativo=True, valor__in=[v for _, v in faltantes])
+                if (b.tipo, b.valor) in faltantes
+            }
+            # Negativo em cache como {} (None não é distinguível de ausência)
+            novos = {chaves[chave]: encontrados.get(chave, {}) for chave in faltantes}
+            em_cache.update(novos)
+            try:
+                cache.set_many(novos, cls._timeout())
+            except Exception as e:
+                logger.error(f"Erro ao gravar cache de bloqueios: {str(e)}")
+        
+        return em_cache[chaves[('ip', ip)]] or em_cache[chaves[('cpf', cpf)]] or None
+    
+    @classmethod
+    def publicar(cls, bloqueios):
+        """Atualiza o cache do validate_login com bloqueios criados/reativados/desativados"""
+        try:
+            cache.set_many(
+                {cls._chave(b.tipo, b.valor): cls._dados(b) if b.ativo else {} for b in bloqueios},
+                cls._timeout()
+            )
+        except Exception as e:
+            logger.error(f"Erro ao publicar bloqueios no cache: {str(e)}")
+    
+    @classmethod
+    def remover(cls, bloqueios):
+        """Remove do cache do validate_login bloqueios apagados (próxima consulta relê o banco)"""
+        try:
+            cache.delete_many([cls._chave(b.tipo, b.valor) for b in bloqueios])
+        except Exception as e:
+            logger.error(f"Erro ao remover bloqueios do cache: {str(e)}")
+    
+    @classmethod
+    def bloquear_atividades_criticas(cls, minutos: int = 15) -> dict:
+        """
+        Bloqueia os IPs das atividades críticas pendentes (severidade 5)
+        
+        Pipeline em lote: carrega numa consulta os bloqueios já existentes dos
+        IPs, cria os novos com bulk_create (ignorando conflito no unique
+        (tipo, valor)), reativa os inativos, vincula as atividades com um
+        bulk_update e publica os bloqueios no cache do validate_login.
+        
+        Returns:
+            dict: bloqueios_criados, bloqueios_reativados, atividades_vinculadas
+        """
+        atividades = list(AtividadeSuspeita.objects.filter(
+            status='pendente',
+            severidade=5,
+            detectado_em__gte=datetime.now() - timedelta(minutes=minutos)
+        ).order_by('id'))
+        
+        # Primeira atividade de cada IP define motivo/detalhes do bloqueio
+        por_ip = {}
+        for atividade in atividades:
+            por_ip.setdefault(atividade.ip, atividade)
+        
+        if not por_ip:
+            return {'bloqueios_criados': 0, 'bloqueios_reativados': 0, 'atividades_vinculadas': 0}
+        
+        existentes = {
+            b.valor: b for b in BloqueioSeguranca.objects.filter(tipo='ip', valor__in=por_ip.keys())
+        }
+        
+        novos = []
+        reativados = []
+        for ip, atividade in por_ip.items():
+            bloqueio = existentes.get(ip)
+            if bloqueio is not None and bloqueio.ativo:
+                continue
+            
+            campos = {
+                'motivo': f"Bloqueio automático - {atividade.tipo_label()}",
+                'bloqueado_por': 'sistema_auto',
+                'portal': atividade.portal,
+                'detalhes': {
+                    'atividade_id': atividade.id,
+                    'severidade': atividade.severidade,
+                    'detalhes_atividade': atividade.detalhes
+                },
+                'ativo': True,
+            }
+            
+            if bloqueio is None:
+                novos.append(BloqueioSeguranca(tipo='ip', valor=ip, **campos))
+            else:
+                # Unique (tipo, valor): IP desbloqueado antes volta a ficar ativo
+                for campo, valor in campos.items():
+                    setattr(bloqueio, campo, valor)
+                bloqueio.bloqueado_em = datetime.now()
+                bloqueio.desbloqueado_em = None
+                bloqueio.desbloqueado_por = None
+                reativados.append(bloqueio)
+        
+        with transaction.atomic():
+            BloqueioSeguranca.objects.bulk_create(novos, batch_size=500, ignore_conflicts=True)
+            BloqueioSeguranca.objects.bulk_update(
+                reativados,
+                ['motivo', 'bloqueado_por', 'portal', 'detalhes', 'ativo',
+                 'bloqueado_em', 'desbloqueado_em', 'desbloqueado_por'],
+                batch_size=500
+            )
+            
+            # ignore_conflicts não devolve ids: recarregar os bloqueios deste lote
+            ips_bloqueados = [b.valor for b in novos + reativados]
+            bloqueios = {
+                b.valor: b for b in BloqueioSeguranca.objects.filter(tipo='ip', valor__in=ips_bloqueados, ativo=True)
+            }
+            
+            vinculadas = []
+            for atividade in atividades:
+                bloqueio = bloqueios.get(atividade.ip)
+                if bloqueio is None:
+                    continue
+                atividade.status = 'bloqueado'
+                atividade.bloqueio_relacionado = bloqueio
+                atividade.acao_tomada = 'bloqueio_automatico_ip'
+                vinculadas.append(atividade)
+            
+            AtividadeSuspeita.objects.bulk_update(
+                vinculadas, ['status', 'bloqueio_relacionado', 'acao_tomada'], batch_size=500
+            )
+        
+        cls.publicar(bloqueios.values())
+        
+        for bloqueio in bloqueios.values():
+            logger.warning(
+                f"🚫 Bloqueio automático criado - IP: {bloqueio.valor} | "
+                f"Atividade: {bloqueio.detalhes.get('atividade_id') if bloqueio.detalhes else '-'}"
+            )
+        
+        return {
+            'bloqueios_criados': len(novos),
+            'bloqueios_reativados': len(reativados),
+            'atividades_vinculadas': len(vinculadas),
+        }
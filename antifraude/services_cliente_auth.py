@@ -2,10 +2,17 @@
 Service para consultar dados de autenticação do cliente no Django
 Integração entre riskengine e wallclub_django
 """
+import json
+import math
 import requests
-from typing import Dict, Any, Optional
+import threading
+import time
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Tuple
 from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
 from wallclub_core.oauth.services import OAuthService
+from .singleflight import SingleFlight
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,9 +35,33 @@ class ClienteAutenticacaoService:
     """
     
     # Configurações (devem vir do .env em produção)
-    DJANGO_BASE_URL = 'http://wallclub-prod-release300:8003'  # Container Django
+    DJANGO_BASE_URL = getattr(settings, 'CLIENTE_AUTH_BASE_URL', 'http://wallclub-prod-release300:8003')  # Container Django
     TIMEOUT_SEGUNDOS = 2  # Timeout da requisição
     
+    # Consulta em lote (batch scoring, replays, detectores)
+    TAMANHO_LOTE = 200
+    TIMEOUT_LOTE_SEGUNDOS = 30
+    
+    # Cache do histórico por CPF (Redis)
+    CACHE_HISTORICO_SEGUNDOS = 30
+    CACHE_HISTORICO_PREFIXO = 'cliente_auth'
+    CACHE_GERACAO_SEGUNDOS = 86400  # Geração por CPF: incrementada a cada invalidação
+    
+    # Coalescência de consultas simultâneas do mesmo CPF (threads + workers); espera
+    # e lock de cada chamada saem do timeout configurado (ver consultar_historico_autenticacao)
+    _coalescencia = SingleFlight('cliente_auth')
+    
+    # Cache do token OAuth (por processo)
+    TOKEN_TTL_SEGUNDOS = 3600  # expires_in padrão do OAuth
+    TOKEN_MARGEM_RENOVACAO_SEGUNDOS = 120  # Renovar em background antes de expirar
+    TOKEN_BACKOFF_SEGUNDOS = 15  # Espera entre tentativas após falha do OAuth
+    TOKEN_DURACAO_MAXIMA_SEGUNDOS = 5  # Obtenção síncrona do token (sem token válido) antes da consulta
+    _token = None
+    _token_expira_em = 0.0
+    _token_proxima_tentativa = 0.0
+    _token_lock = threading.Lock()  # Troca de _token/_token_expira_em
+    _renovacao_lock = threading.Lock()  # Uma chamada ao OAuth por vez
+    
     @classmethod
     def consultar_historico_autenticacao(cls, cpf: str, canal_id: Optional[int] = None) -> Dict[str, Any]:
         """
@@ -43,13 +74,39 @@ class ClienteAutenticacaoService:
         Returns:
             dict: Dados de autenticação ou None se falhar
         """
+        # Cache curto por CPF (cliente costuma transacionar várias vezes por minuto)
+        dados_cache = cls._ler_cache_historico(cpf, canal_id)
+        if dados_cache is not None:
+            return dados_cache
+        
+        # Importar ConfiguracaoAntifraude para buscar timeout configurado
+        from antifraude.models_config import ConfiguracaoAntifraude
         try:
-            # Importar ConfiguracaoAntifraude para buscar timeout configurado
-            from antifraude.models_config import ConfiguracaoAntifraude
             timeout = ConfiguracaoAntifraude.get_config('CONSULTA_AUTH_TIMEOUT_SEGUNDOS', cls.TIMEOUT_SEGUNDOS)
-            
-            # Obter token OAuth
-            access_token = OAuthService.get_oauth_token()
+        except Exception:
+            timeout = cls.TIMEOUT_SEGUNDOS
+        
+        # Requests simultâneos do mesmo CPF: uma consulta, os demais aguardam o líder.
+        # O líder pode obter o token antes da requisição: lock e espera cobrem os dois
+        duracao_lider = float(timeout) + cls.TOKEN_DURACAO_MAXIMA_SEGUNDOS
+        return cls._coalescencia.executar(
+            f"{cpf}:{canal_id or 0}",
+            buscar=lambda: cls._consultar_remoto(cpf, canal_id, timeout),
+            ler_cache=lambda: cls._ler_cache_historico(cpf, canal_id),
+            fallback=lambda: cls._retornar_resposta_fallback(cpf, 'timeout'),
+            espera_maxima_segundos=duracao_lider,
+            lock_segundos=math.ceil(duracao_lider) + 2
+        )
+    
+    @classmethod
+    def _consultar_remoto(cls, cpf: str, canal_id: Optional[int], timeout: float) -> Dict[str, Any]:
+        """Consulta o wallclub_django (sem cache na leitura) e grava o cache em caso de sucesso"""
+        # Lida antes da requisição: invalidação durante a consulta descarta a gravação
+        geracao = cls._geracoes_historico([cpf]).get(cpf)
+        
+        try:
+            # Obter token OAuth (cacheado até pouco antes de expirar)
+            access_token = cls._obter_token()
             if not access_token:
                 registrar_log(
                     'antifraude.cliente_auth',
@@ -96,8 +153,19 @@ class ClienteAutenticacaoService:
                     f"Consulta OK: CPF {cpf[:3]}*** - Encontrado: {dados.get('encontrado')} - Tempo: {tempo_ms}ms",
                     nivel='INFO'
                 )
+                cls._gravar_cache_historico(cpf, canal_id, dados, geracao)
                 return dados
             
+            elif response.status_code == 401:
+                # Token revogado/expirado antes do previsto: descartar para próxima chamada
+                cls._descartar_token()
+                registrar_log(
+                    'antifraude.cliente_auth',
+                    'Token OAuth rejeitado (401) - será renovado',
+                    nivel='ERROR'
+                )
+                return cls._retornar_resposta_fallback(cpf, 'http_error_401')
+            
             elif response.status_code == 404:
                 registrar_log(
                     'antifraude.cliente_auth',
@@ -138,6 +206,351 @@ class ClienteAutenticacaoService:
             )
             return cls._retornar_resposta_fallback(cpf, 'erro_inesperado')
     
+    @classmethod
+    def consultar_historico_autenticacao_lote(
+        cls,
+        cpfs: Iterable[str],
+        canal_id: Optional[int] = None,
+        tamanho_lote: Optional[int] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Consulta histórico de autenticação de muitos CPFs
+        
+        CPFs já em cache são devolvidos direto; os demais são pedidos ao
+        wallclub_django em lotes (POST .../analise/lote/) e a resposta NDJSON
+        é processada em streaming, alimentando o cache por CPF.
+        
+        Args:
+            cpfs: CPFs a consultar (duplicados são ignorados)
+            canal_id: Canal opcional
+            tamanho_lote: CPFs por requisição (padrão: TAMANHO_LOTE)
+        
+        Yields:
+            (cpf, dados): dados no mesmo formato de consultar_historico_autenticacao()
+        """
+        tamanho_lote = tamanho_lote or cls.TAMANHO_LOTE
+        
+        lote: List[str] = []
+        vistos = set()
+        
+        for cpf in cpfs:
+            if cpf in vistos:
+                continue
+            vistos.add(cpf)
+            lote.append(cpf)
+            
+            if len(lote) >= tamanho_lote:
+                yield from cls._processar_lote(lote, canal_id)
+                lote = []
+        
+        if lote:
+            yield from cls._processar_lote(lote, canal_id)
+    
+    @classmethod
+    def _processar_lote(cls, cpfs: List[str], canal_id: Optional[int]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Resolve um lote: cache primeiro, depois uma requisição para os misses"""
+        chaves = {cls._chave_cache_historico(cpf): cpf for cpf in cpfs}
+        canal = str(canal_id or 0)
+        
+        try:
+            em_cache = cache.get_many(list(chaves.keys()))
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao ler cache em lote: {str(e)}", nivel='WARNING')
+            em_cache = {}
+        
+        pendentes = []
+        for chave, cpf in chaves.items():
+            dados = (em_cache.get(chave) or {}).get(canal)
+            if dados is not None:
+                yield cpf, dados
+            else:
+                pendentes.append(cpf)
+        
+        if pendentes:
+            yield from cls._consultar_lote_remoto(pendentes, canal_id)
+    
+    @classmethod
+    def _consultar_lote_remoto(cls, cpfs: List[str], canal_id: Optional[int]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Faz uma requisição em lote e processa a resposta NDJSON linha a linha
+        
+        CPFs ausentes na resposta (ou lote que falhou) recebem resposta de fallback.
+        """
+        respondidos = set()
+        para_cache: Dict[str, Dict[str, Any]] = {}
+        motivo_falha = 'ausente_lote'
+        geracoes = cls._geracoes_historico(cpfs)
+        
+        try:
+            access_token = cls._obter_token()
+            if not access_token:
+                registrar_log('antifraude.cliente_auth', 'Falha ao obter token OAuth (lote)', nivel='ERROR')
+                motivo_falha = 'falha_oauth'
+            else:
+                url = f"{cls.DJANGO_BASE_URL}/cliente/api/v1/autenticacao/analise/lote/"
+                payload = {'cpfs': cpfs}
+                if canal_id:
+                    payload['canal_id'] = canal_id
+                
+                headers = {
+                    'Authorization': f'Bearer {access_token}',
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson'
+                }
+                
+                inicio = datetime.now()
+                
+                with requests.post(url, json=payload, headers=headers, timeout=cls.TIMEOUT_LOTE_SEGUNDOS, stream=True) as response:
+                    if response.status_code == 401:
+                        cls._descartar_token()
+                    
+                    if response.status_code != 200:
+                        registrar_log(
+                            'antifraude.cliente_auth',
+                            f"Erro na consulta em lote: Status {response.status_code} - {len(cpfs)} CPFs",
+                            nivel='ERROR'
+                        )
+                        motivo_falha = f'http_error_{response.status_code}'
+                    else:
+                        for linha in response.iter_lines():
+                            if not linha:
+                                continue
+                            dados = json.loads(linha)
+                            cpf = dados.get('cpf')
+                            if not cpf or cpf in respondidos:
+                                continue
+                            respondidos.add(cpf)
+                            para_cache[cpf] = dados
+                            yield cpf, dados
+                
+                tempo_ms = int((datetime.now() - inicio).total_seconds() * 1000)
+                registrar_log(
+                    'antifraude.cliente_auth',
+                    f"Consulta em lote: {len(respondidos)}/{len(cpfs)} CPFs - Tempo: {tempo_ms}ms"
+                )
+        
+        except requests.Timeout:
+            registrar_log('antifraude.cliente_auth', f"Timeout na consulta em lote ({len(cpfs)} CPFs)", nivel='ERROR')
+            motivo_falha = 'timeout'
+        
+        except requests.RequestException as e:
+            registrar_log('antifraude.cliente_auth', f"Erro de conexão (lote): {str(e)}", nivel='ERROR')
+            motivo_falha = 'erro_conexao'
+        
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro inesperado na consulta em lote: {str(e)}", nivel='ERROR')
+            motivo_falha = 'erro_inesperado'
+        
+        finally:
+            # Um get_many + set_many por lote (também se o consumidor parar no meio)
+            cls._gravar_cache_historico_lote(para_cache, canal_id, geracoes)
+        
+        for cpf in cpfs:
+            if cpf not in respondidos:
+                yield cpf, cls._retornar_resposta_fallback(cpf, motivo_falha)
+    
+    @classmethod
+    def _obter_token(cls) -> Optional[str]:
+        """
+        Retorna token OAuth cacheado no processo
+        
+        Próximo de expirar: devolve o token atual e renova em background.
+        Expirado/ausente: renova de forma síncrona com single-flight (apenas
+        uma thread chama o OAuth, as demais aguardam o mesmo resultado).
+        Após uma falha, novas tentativas esperam TOKEN_BACKOFF_SEGUNDOS: sem
+        token válido a consulta cai direto no fallback em vez de aguardar o OAuth.
+        
+        Returns:
+            str: Access token ou None se falhar
+        """
+        agora = time.monotonic()
+        token, expira_em = cls._token, cls._token_expira_em
+        
+        if token and agora < expira_em:
+            if agora >= expira_em - cls.TOKEN_MARGEM_RENOVACAO_SEGUNDOS and agora >= cls._token_proxima_tentativa:
+                cls._renovar_token_background()
+            return token
+        
+        if agora < cls._token_proxima_tentativa:
+            return None
+        
+        with cls._renovacao_lock:
+            # Outra thread pode ter renovado (ou falhado) enquanto aguardávamos o lock
+            agora = time.monotonic()
+            if cls._token and agora < cls._token_expira_em:
+                return cls._token
+            if agora < cls._token_proxima_tentativa:
+                return None
+            return cls._renovar_token()
+    
+    @classmethod
+    def _renovar_token(cls) -> Optional[str]:
+        """
+        Busca novo token no OAuth e atualiza cache (chamar com _renovacao_lock)
+        
+        A chamada HTTP roda fora de _token_lock, que só protege a troca do token.
+        """
+        try:
+            resposta = OAuthService.get_oauth_token()
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao renovar token OAuth: {str(e)}", nivel='ERROR')
+            resposta = None
+        
+        if isinstance(resposta, dict):
+            access_token = resposta.get('access_token')
+            expires_in = resposta.get('expires_in') or cls.TOKEN_TTL_SEGUNDOS
+        else:
+            access_token = resposta
+            expires_in = cls.TOKEN_TTL_SEGUNDOS
+        
+        if access_token:
+            with cls._token_lock:
+                cls._token = access_token
+                cls._token_expira_em = time.monotonic() + int(expires_in)
+            cls._token_proxima_tentativa = 0.0
+        else:
+            cls._token_proxima_tentativa = time.monotonic() + cls.TOKEN_BACKOFF_SEGUNDOS
+        
+        return access_token
+    
+    @classmethod
+    def _renovar_token_background(cls):
+        """Dispara renovação do token em thread separada (no máximo uma por vez, sem bloquear)"""
+        if not cls._renovacao_lock.acquire(blocking=False):
+            return  # Renovação em andamento
+        
+        def _renovar():
+            try:
+                cls._renovar_token()
+            finally:
+                cls._renovacao_lock.release()
+        
+        try:
+            threading.Thread(target=_renovar, name='renovar-token-oauth', daemon=True).start()
+        except Exception:
+            cls._renovacao_lock.release()
+            raise
+    
+    @classmethod
+    def _descartar_token(cls):
+        """Invalida token cacheado (ex: após 401)"""
+        with cls._token_lock:
+            cls._token = None
+            cls._token_expira_em = 0.0
+    
+    @classmethod
+    def _chave_cache_historico(cls, cpf: str) -> str:
+        return f"{cls.CACHE_HISTORICO_PREFIXO}:{cpf}"
+    
+    @classmethod
+    def _chave_geracao_historico(cls, cpf: str) -> str:
+        return f"{cls.CACHE_HISTORICO_PREFIXO}:geracao:{cpf}"
+    
+    @classmethod
+    def _geracoes_historico(cls, cpfs: List[str]) -> Dict[str, int]:
+        """
+        Geração atual do cache de cada CPF (0 se nunca invalidado)
+        
+        CPFs sem geração lida (erro no Redis) ficam fora do dict e não são gravados.
+        """
+        try:
+            chaves = {cls._chave_geracao_historico(cpf): cpf for cpf in cpfs}
+            lidas = cache.get_many(list(chaves.keys()))
+            return {cpf: lidas.get(chave, 0) for chave, cpf in chaves.items()}
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao ler geração do cache: {str(e)}", nivel='WARNING')
+            return {}
+    
+    @classmethod
+    def _ler_cache_historico(cls, cpf: str, canal_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Retorna histórico cacheado do CPF para o canal, se houver"""
+        try:
+            por_canal = cache.get(cls._chave_cache_historico(cpf))
+            if por_canal:
+                return por_canal.get(str(canal_id or 0))
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao ler cache: {str(e)}", nivel='WARNING')
+        return None
+    
+    @classmethod
+    def _gravar_cache_historico(cls, cpf: str, canal_id: Optional[int], dados: Dict[str, Any], geracao: Optional[int]):
+        """
+        Grava histórico no cache do CPF
+        
+        Uma chave por CPF (com entradas por canal) para que a invalidação
+        seja um único DELETE. Só grava se a geração do CPF ainda for a lida
+        antes da consulta (invalidar_cache no meio torna os dados obsoletos).
+        """
+        from antifraude.models_config import ConfiguracaoAntifraude
+        
+        try:
+            ttl = ConfiguracaoAntifraude.get_config('CONSULTA_AUTH_CACHE_SEGUNDOS', cls.CACHE_HISTORICO_SEGUNDOS)
+            if not ttl:
+                return
+            
+            if geracao is None or cls._geracoes_historico([cpf]).get(cpf) != geracao:
+                registrar_log('antifraude.cliente_auth', f"Cache invalidado durante a consulta: CPF {cpf[:3]}*** não gravado")
+                return
+            
+            chave = cls._chave_cache_historico(cpf)
+            por_canal = cache.get(chave) or {}
+            por_canal[str(canal_id or 0)] = dados
+            cache.set(chave, por_canal, ttl)
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao gravar cache: {str(e)}", nivel='WARNING')
+    
+    @classmethod
+    def _gravar_cache_historico_lote(
+        cls, por_cpf: Dict[str, Dict[str, Any]], canal_id: Optional[int], geracoes: Dict[str, int]
+    ):
+        """Mesmo que _gravar_cache_historico para vários CPFs, em três idas ao Redis"""
+        from antifraude.models_config import ConfiguracaoAntifraude
+        
+        if not por_cpf:
+            return
+        
+        try:
+            ttl = ConfiguracaoAntifraude.get_config('CONSULTA_AUTH_CACHE_SEGUNDOS', cls.CACHE_HISTORICO_SEGUNDOS)
+            if not ttl:
+                return
+            
+            atuais = cls._geracoes_historico(list(por_cpf))
+            validos = [cpf for cpf in por_cpf if cpf in geracoes and atuais.get(cpf) == geracoes[cpf]]
+            if not validos:
+                return
+            
+            chaves = {cls._chave_cache_historico(cpf): cpf for cpf in validos}
+            existentes = cache.get_many(list(chaves.keys()))
+            
+            novos = {}
+            for chave, cpf in chaves.items():
+                por_canal = existentes.get(chave) or {}
+                por_canal[str(canal_id or 0)] = por_cpf[cpf]
+                novos[chave] = por_canal
+            cache.set_many(novos, ttl)
+        except Exception as e:
+            registrar_log('antifraude.cliente_auth', f"Erro ao gravar cache em lote: {str(e)}", nivel='WARNING')
+    
+    @classmethod
+    def invalidar_cache(cls, cpf: str):
+        """
+        Remove histórico cacheado do CPF
+        Chamado quando o app principal notifica falha de login ou bloqueio
+        
+        Args:
+            cpf: CPF do cliente
+        """
+        # Nova geração antes do DELETE: consultas em andamento não regravam o cache
+        chave_geracao = cls._chave_geracao_historico(cpf)
+        cache.add(chave_geracao, 0, cls.CACHE_GERACAO_SEGUNDOS)
+        try:
+            cache.incr(chave_geracao)
+        except ValueError:
+            # Expirou entre o add e o incr
+            cache.set(chave_geracao, 1, cls.CACHE_GERACAO_SEGUNDOS)
+        cache.delete(cls._chave_cache_historico(cpf))
+        registrar_log('antifraude.cliente_auth', f"Cache de autenticação invalidado: CPF {cpf[:3]}***")
+    
     @classmethod
     def _retornar_resposta_fallback(cls, cpf: str, motivo: str) -> Dict[str, Any]:
         """
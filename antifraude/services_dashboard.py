@@ -0,0 +1,345 @@
+"""
+Service: Dashboard de Métricas
+Agregados por hora das decisões (AgregadoDecisaoHora) e cache do
+dashboard_metricas com atualização em background
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import json
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncHour
+
+from .models import AgregadoDecisaoHora, DecisaoAntifraude, RegraAcionada, TransacaoRisco
+from .models_config import ConfiguracaoAntifraude
+
+logger = logging.getLogger('antifraude.dashboard')
+
+
+class HistogramaLatencia:
+    """
+    Histograma de buckets logarítmicos (estilo HDR) para o tempo de análise
+
+    Bucket i cobre [BASE^(i-1), BASE^i) ms; o percentil devolve o limite
+    superior do bucket (erro relativo de até 5%). Histogramas de horas
+    diferentes se somam bucket a bucket, então o p95 de 30 dias sai de
+    ~720 histogramas pequenos em vez de milhões de tempos.
+    """
+
+    BASE = 1.05
+
+    @classmethod
+    def bucket(cls, ms: int) -> int:
+        if ms <= 0:
+            return 0
+        return 1 + int(math.log(ms) / math.log(cls.BASE))
+
+    @classmethod
+    def limite_superior(cls, bucket: int) -> float:
+        return 0 if bucket == 0 else cls.BASE ** bucket
+
+    @classmethod
+    def de_contagens(cls, contagens) -> dict:
+        """Histograma a partir de pares (tempo_ms, quantidade)"""
+        histograma = Counter()
+        for ms, quantidade in contagens:
+            histograma[str(cls.bucket(ms or 0))] += quantidade
+        return dict(histograma)
+
+    @staticmethod
+    def somar(histogramas) -> dict:
+        total = Counter()
+        for histograma in histogramas:
+            total.update(histograma)
+        return dict(total)
+
+    @classmethod
+    def percentil(cls, histograma: dict, p: float, maximo: int = None) -> int:
+        """Valor do percentil p (0-1); limitado ao máximo observado, se informado"""
+        total = sum(histograma.values())
+        if not total:
+            return 0
+
+        posicao = min(int(total * p) + 1, total)
+        acumulado = 0
+        for bucket in sorted(histograma, key=int):
+            acumulado += histograma[bucket]
+            if acumulado >= posicao:
+                valor = int(math.ceil(cls.limite_superior(int(bucket))))
+                return min(valor, maximo) if maximo is not None else valor
+        return maximo or 0
+
+
+class DashboardService:
+    """
+    Métricas do dashboard a partir dos agregados por hora
+
+    agregar_hora() recalcula uma hora inteira (idempotente); a task
+    agregar_decisoes_hora mantém a hora atual, recupera horas faltantes e
+    recalcula as horas de decisões alteradas desde a execução anterior.
+    metricas() serve do cache e, passado DASHBOARD_ATUALIZACAO_SEGUNDOS,
+    agenda a atualização em background mantendo a resposta anterior.
+    """
+
+    CACHE_PREFIXO = 'dashboard:metricas'
+    CHAVE_ULTIMA_AGREGACAO = 'dashboard:agregacao:ultima_execucao'
+
+    @staticmethod
+    def inicio_hora(data: datetime) -> datetime:
+        return data.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def _contar_regras(decisoes):
+        """
+        Acionamentos por regra e reprovações por blacklist numa única passada
+
+        Returns:
+            tuple: ({nome da regra: acionamentos}, bloqueios por blacklist)
+        """
+        contagem = Counter()
+        bloqueios_blacklist = 0
+        for decisao, regras_json in decisoes.values_list('decisao', 'regras_acionadas').iterator(chunk_size=2000):
+            if isinstance(regras_json, str):
+                try:
+                    regras_json = json.loads(regras_json)
+                except ValueError:
+                    continue
+
+            if isinstance(regras_json, list):
+                regras = [regra for regra in regras_json if isinstance(regra, dict)]
+                for regra in regras:
+                    contagem[regra.get('nome', 'Desconhecida')] += 1
+                if decisao == 'REPROVADO' and any(regra.get('tipo') == 'BLACKLIST' for regra in regras):
+                    bloqueios_blacklist += 1
+        return dict(contagem), bloqueios_blacklist
+
+    @staticmethod
+    def _contar_regras_indexado(inicio: datetime, fim: datetime):
+        """
+        Mesmo resultado de _contar_regras via GROUP BY em RegraAcionada
+
+        Returns:
+            tuple: ({nome da regra: acionamentos}, bloqueios por blacklist)
+        """
+        acionamentos = RegraAcionada.objects.filter(created_at__gte=inicio, created_at__lt=fim)
+        regras = dict(acionamentos.values('nome').annotate(total=Count('id')).order_by().values_list('nome', 'total'))
+        bloqueios_blacklist = acionamentos.filter(
+            tipo='BLACKLIST',
+            decisao__decisao='REPROVADO'
+        ).values('decisao_id').distinct().count()
+        return regras, bloqueios_blacklist
+
+    @classmethod
+    def agregar_hora(cls, hora: datetime) -> AgregadoDecisaoHora:
+        """Recalcula o agregado da hora a partir de DecisaoAntifraude"""
+        hora = cls.inicio_hora(hora)
+        decisoes = DecisaoAntifraude.objects.filter(created_at__gte=hora, created_at__lt=hora + timedelta(hours=1))
+
+        por_decisao = dict(decisoes.values('decisao').annotate(total=Count('id')).order_by().values_list('decisao', 'total'))
+        estatisticas = decisoes.aggregate(
+            score_soma=Sum('score_risco'),
+            score_min=Min('score_risco'),
+            score_max=Max('score_risco'),
+            tempo_soma=Sum('tempo_analise_ms'),
+            tempo_max=Max('tempo_analise_ms')
+        )
+        if getattr(settings, 'REGRAS_ACIONADAS_LEITURA_ATIVA', False):
+            regras, bloqueios_blacklist = cls._contar_regras_indexado(hora, hora + timedelta(hours=1))
+        else:
+            regras, bloqueios_blacklist = cls._contar_regras(decisoes)
+        tempos = decisoes.values('tempo_analise_ms').annotate(total=Count('id')).order_by().values_list(
+            'tempo_analise_ms', 'total'
+        )
+
+        agregado, _ = AgregadoDecisaoHora.objects.update_or_create(
+            hora=hora,
+            defaults={
+                'aprovadas': por_decisao.get('APROVADO', 0),
+                'reprovadas': por_decisao.get('REPROVADO', 0),
+                'revisao': por_decisao.get('REVISAO', 0),
+                'pendentes': por_decisao.get('PENDENTE', 0),
+                'bloqueios_blacklist': bloqueios_blacklist,
+                'score_soma': estatisticas['score_soma'] or 0,
+                'score_min': estatisticas['score_min'],
+                'score_max': estatisticas['score_max'],
+                'tempo_soma_ms': estatisticas['tempo_soma'] or 0,
+                'tempo_max_ms': estatisticas['tempo_max'] or 0,
+                'histograma_tempo': HistogramaLatencia.de_contagens(tempos),
+                'regras': regras,
+            }
+        )
+        return agregado
+
+    @classmethod
+    def agregar_pendentes(cls, agora: datetime = None) -> list:
+        """
+        Recalcula a hora atual, a anterior (decisões gravadas na virada), as
+        horas sem agregado dentro de DASHBOARD_RECUPERACAO_HORAS (beat parado)
+        e as horas de decisões com updated_at posterior ao início da execução
+        anterior (3DS, revisão, correções)
+
+        Returns:
+            list: Horas recalculadas
+        """
+        inicio_execucao = agora or datetime.now()
+        agora = cls.inicio_hora(inicio_execucao)
+        recuperacao = ConfiguracaoAntifraude.get_config('DASHBOARD_RECUPERACAO_HORAS', 24)
+
+        # Sem marca (primeira execução, cache perdido): alteradas dentro da recuperação
+        ultima_execucao = cache.get(cls.CHAVE_ULTIMA_AGREGACAO) or agora - timedelta(hours=recuperacao)
+
+        existentes = set(AgregadoDecisaoHora.objects.filter(
+            hora__gte=agora - timedelta(hours=recuperacao)
+        ).values_list('hora', flat=True))
+
+        horas = [agora, agora - timedelta(hours=1)] + [
+            agora - timedelta(hours=n)
+            for n in range(2, recuperacao + 1)
+            if agora - timedelta(hours=n) not in existentes
+        ]
+        alteradas = DecisaoAntifraude.objects.filter(
+            updated_at__gte=ultima_execucao,
+            created_at__lt=agora - timedelta(hours=1)
+        ).annotate(hora_criacao=TruncHour('created_at')).values_list('hora_criacao', flat=True).distinct()
+        horas += sorted(set(alteradas) - set(horas), reverse=True)
+
+        for hora in horas:
+            cls.agregar_hora(hora)
+
+        # Início desta execução: alterações durante o recálculo entram na próxima
+        cache.set(cls.CHAVE_ULTIMA_AGREGACAO, inicio_execucao, None)
+        return horas
+
+    @classmethod
+    def calcular_metricas(cls, dias: int) -> dict:
+        """Resposta do dashboard_metricas para os últimos `dias` (período arredondado à hora)"""
+        from .models import BlacklistAntifraude, WhitelistAntifraude
+
+        data_fim = datetime.now()
+        data_inicio = data_fim - timedelta(days=dias)
+
+        # 1. Transações
+        if getattr(settings, 'ROLLUPS_LEITURA_ATIVA', False):
+            from .services_rollup import RollupService
+            transacoes_por_origem = RollupService.transacoes_por_valor('origem', data_inicio, data_fim)
+        else:
+            transacoes_por_origem = dict(
+                TransacaoRisco.objects.filter(
+                    data_transacao__gte=data_inicio,
+                    data_transacao__lte=data_fim
+                ).values('origem').annotate(total=Count('id')).order_by().values_list('origem', 'total')
+            )
+        transacoes_total = sum(transacoes_por_origem.values())
+
+        # 2-4. Decisões, scores, performance e regras: soma dos agregados por hora
+        agregados = list(AgregadoDecisaoHora.objects.filter(hora__gte=cls.inicio_hora(data_inicio)))
+
+        aprovadas = sum(a.aprovadas for a in agregados)
+        reprovadas = sum(a.reprovadas for a in agregados)
+        revisao = sum(a.revisao for a in agregados)
+        total_decisoes = aprovadas + reprovadas + revisao
+        total_com_pendentes = sum(a.total for a in agregados)
+
+        taxa_aprovacao = (aprovadas / total_decisoes * 100) if total_decisoes > 0 else 0
+
+        scores_min = [a.score_min for a in agregados if a.score_min is not None]
+        scores_max = [a.score_max for a in agregados if a.score_max is not None]
+        histograma = HistogramaLatencia.somar(a.histograma_tempo for a in agregados)
+        tempo_max = max((a.tempo_max_ms for a in agregados), default=0)
+
+        regras_count = Counter()
+        for agregado in agregados:
+            regras_count.update(agregado.regras)
+
+        # 5-6. Blacklist e whitelist (tabelas pequenas)
+        whitelist_stats = WhitelistAntifraude.objects.filter(is_active=True).values('origem').annotate(total=Count('id'))
+        whitelist_dict = {item['origem']: item['total'] for item in whitelist_stats}
+
+        return {
+            'periodo': {
+                'dias': dias,
+                'data_inicio': data_inicio.strftime('%Y-%m-%d'),
+                'data_fim': data_fim.strftime('%Y-%m-%d')
+            },
+            'transacoes': {
+                'total': transacoes_total,
+                'por_origem': transacoes_por_origem
+            },
+            'decisoes': {
+                'aprovadas': aprovadas,
+                'reprovadas': reprovadas,
+                'revisao': revisao,
+                'total': total_decisoes,
+                'taxa_aprovacao': round(taxa_aprovacao, 2)
+            },
+            'scores': {
+                'medio': round(sum(a.score_soma for a in agregados) / total_com_pendentes, 2) if total_com_pendentes else 0,
+                'minimo': min(scores_min, default=0),
+                'maximo': max(scores_max, default=0)
+            },
+            'performance': {
+                'tempo_medio_ms': int(sum(a.tempo_soma_ms for a in agregados) / total_com_pendentes) if total_com_pendentes else 0,
+                'tempo_p95_ms': HistogramaLatencia.percentil(histograma, 0.95, maximo=tempo_max)
+            },
+            'blacklist': {
+                'total': BlacklistAntifraude.objects.count(),
+                'ativos': BlacklistAntifraude.objects.filter(is_active=True).count(),
+                'bloqueios_periodo': sum(a.bloqueios_blacklist for a in agregados)
+            },
+            'whitelist': {
+                'total': sum(whitelist_dict.values()),
+                'automaticas': whitelist_dict.get('AUTO', 0),
+                'manuais': whitelist_dict.get('MANUAL', 0),
+                'vip': whitelist_dict.get('CLIENTE_VIP', 0)
+            },
+            'regras_top': [
+                {'nome': nome, 'acionamentos': count}
+                for nome, count in regras_count.most_common(5)
+            ],
+            'gerado_em': data_fim.isoformat()
+        }
+
+    @classmethod
+    def atualizar_cache(cls, dias: int) -> dict:
+        dados = cls.calcular_metricas(dias)
+        try:
+            cache.set(
+                f"{cls.CACHE_PREFIXO}:{dias}",
+                {'gerado_em': time.time(), 'dados': dados},
+                ConfiguracaoAntifraude.get_config('DASHBOARD_CACHE_SEGUNDOS', 3600)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache do dashboard: {str(e)}")
+        return dados
+
+    @classmethod
+    def metricas(cls, dias: int) -> dict:
+        """
+        Dashboard do cache; sem cache calcula na hora, cache velho é servido
+        enquanto a task atualizar_dashboard recalcula em background
+        """
+        try:
+            em_cache = cache.get(f"{cls.CACHE_PREFIXO}:{dias}")
+        except Exception as e:
+            logger.error(f"Erro ao ler cache do dashboard: {str(e)}")
+            em_cache = None
+
+        if em_cache is None:
+            return cls.atualizar_cache(dias)
+
+        idade = time.time() - em_cache['gerado_em']
+        if idade > ConfiguracaoAntifraude.get_config('DASHBOARD_ATUALIZACAO_SEGUNDOS', 60):
+            try:
+                # Uma atualização por vez para cada `dias`
+                if cache.add(f"{cls.CACHE_PREFIXO}:atualizando:{dias}", 1, 60):
+                    from .tasks import atualizar_dashboard
+                    atualizar_dashboard.delay(dias)
+            except Exception as e:
+                logger.error(f"Erro ao agendar atualização do dashboard: {str(e)}")
+
+        return em_cache['dados']
@@ -0,0 +1,215 @@
+"""
+Service: Exportação de Decisões
+Decisões com os dados da transação em NDJSON ou CSV (opcionalmente gzip),
+geradas em streaming para o endpoint exportar/decisoes/ e o comando
+exportar_decisoes
+"""
+from datetime import date, datetime
+from decimal import Decimal
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Max, Min
+
+from .models import DecisaoAntifraude
+from .models_config import ConfiguracaoAntifraude
+
+
+class ExportacaoService:
+    """
+    Exportação em streaming: memória constante qualquer que seja o período
+
+    As decisões são lidas em lotes por faixa de id (keyset: id > último id
+    do lote anterior, dentro dos ids do período) e cada lote é percorrido
+    com iterator(chunk_size). No MySQL o driver carrega o resultado inteiro
+    de cada consulta, então é o tamanho do lote que limita a memória; no
+    PostgreSQL o iterator usa cursor no servidor. A saída sai em blocos de
+    ~64 KB, comprimidos incrementalmente quando gzip.
+    """
+
+    FORMATOS = ('ndjson', 'csv')
+    TAMANHO_BLOCO = 64 * 1024
+
+    # Coluna exportada -> campo (DecisaoAntifraude com a transação)
+    CAMPOS = [
+        ('decisao_id', 'id'),
+        ('transacao_id', 'transacao__transacao_id'),
+        ('origem', 'transacao__origem'),
+        ('cliente_id', 'transacao__cliente_id'),
+        ('cpf', 'transacao__cpf'),
+        ('valor', 'transacao__valor'),
+        ('modalidade', 'transacao__modalidade'),
+        ('parcelas', 'transacao__parcelas'),
+        ('bandeira', 'transacao__bandeira'),
+        ('bin_cartao', 'transacao__bin_cartao'),
+        ('ip_address', 'transacao__ip_address'),
+        ('device_fingerprint', 'transacao__device_fingerprint'),
+        ('loja_id', 'transacao__loja_id'),
+        ('canal_id', 'transacao__canal_id'),
+        ('terminal', 'transacao__terminal'),
+        ('data_transacao', 'transacao__data_transacao'),
+        ('decisao', 'decisao'),
+        ('score_risco', 'score_risco'),
+        ('motivo', 'motivo'),
+        ('tempo_analise_ms', 'tempo_analise_ms'),
+        ('revisado_por', 'revisado_por'),
+        ('revisado_em', 'revisado_em'),
+        ('created_at', 'created_at'),
+    ]
+
+    # Colunas achatadas de regras_acionadas (listas separadas por '|')
+    CAMPOS_REGRAS = ['regras_total', 'regras_nomes', 'regras_tipos', 'regras_ajuste_total']
+
+    @classmethod
+    def colunas(cls) -> list:
+        return [coluna for coluna, _ in cls.CAMPOS] + cls.CAMPOS_REGRAS
+
+    @staticmethod
+    def filtrar(inicio: datetime, fim: datetime, decisao: str = None, origem: str = None):
+        """Decisões criadas em [inicio, fim)"""
+        decisoes = DecisaoAntifraude.objects.filter(created_at__gte=inicio, created_at__lt=fim)
+        if decisao:
+            decisoes = decisoes.filter(decisao=decisao)
+        if origem:
+            decisoes = decisoes.filter(transacao__origem=origem)
+        return decisoes
+
+    @staticmethod
+    def achatar_regras(regras_json) -> dict:
+        """Colunas de CAMPOS_REGRAS a partir do JSON de regras_acionadas"""
+        if isinstance(regras_json, str):
+            try:
+                regras_json = json.loads(regras_json)
+            except ValueError:
+                regras_json = []
+        regras = [regra for regra in regras_json or [] if isinstance(regra, dict)]
+
+        # Regras do motor gravam ajuste_score; MaxMind, whitelist e autenticação, peso
+        # (mesma leitura de RegraAcionada.linhas_da_decisao)
+        ajuste_total = 0
+        for regra in regras:
+            try:
+                ajuste_total += int(regra.get('ajuste_score', regra.get('peso')) or 0)
+            except (TypeError, ValueError):
+                continue
+
+        return {
+            'regras_total': len(regras),
+            'regras_nomes': '|'.join(str(regra.get('nome', '')) for regra in regras),
+            'regras_tipos': '|'.join(str(regra.get('tipo', '')) for regra in regras),
+            'regras_ajuste_total': ajuste_total,
+        }
+
+    @staticmethod
+    def _serializar(valor):
+        if isinstance(valor, (datetime, date)):
+            return valor.isoformat()
+        if isinstance(valor, Decimal):
+            return str(valor)
+        return valor
+
+    @classmethod
+    def linhas(cls, decisoes, lote: int = None):
+        """
+        Gera um dict por decisão (colunas de colunas()), em ordem de id
+
+        Args:
+            decisoes: QuerySet de DecisaoAntifraude (ver filtrar)
+            lote: Decisões por consulta (padrão: EXPORTACAO_LOTE)
+        """
+        lote = lote or ConfiguracaoAntifraude.get_config('EXPORTACAO_LOTE', 2000)
+
+        # Faixa de ids do período: cada lote vira uma varredura curta pela PK
+        limites = decisoes.aggregate(primeiro=Min('id'), ultimo=Max('id'))
+        if limites['primeiro'] is None:
+            return
+        decisoes = decisoes.filter(id__lte=limites['ultimo'])
+
+        colunas = [coluna for coluna, _ in cls.CAMPOS]
+        caminhos = [caminho for _, caminho in cls.CAMPOS] + ['regras_acionadas']
+        ultimo_id = limites['primeiro'] - 1
+
+        while True:
+            consulta = decisoes.filter(id__gt=ultimo_id).order_by('id').values_list(*caminhos)[:lote]
+            lidas = 0
+            for valores in consulta.iterator(chunk_size=min(lote, 2000)):
+                lidas += 1
+                ultimo_id = valores[0]
+                linha = {coluna: cls._serializar(valor) for coluna, valor in zip(colunas, valores)}
+                linha.update(cls.achatar_regras(valores[-1]))
+                yield linha
+            if lidas < lote:
+                return
+
+    @classmethod
+    def _textos(cls, linhas, formato: str):
+        """Linhas formatadas (NDJSON ou CSV com cabeçalho)"""
+        if formato == 'ndjson':
+            for linha in linhas:
+                yield json.dumps(linha, ensure_ascii=False, default=str) + '\n'
+            return
+
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=cls.colunas(), extrasaction='ignore')
+        escritor.writeheader()
+        for linha in linhas:
+            escritor.writerow(linha)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    @classmethod
+    def exportar(cls, decisoes, formato: str = 'ndjson', compactar: bool = False, lote: int = None):
+        """
+        Gera a exportação em blocos de bytes (para StreamingHttpResponse ou arquivo)
+
+        Args:
+            decisoes: QuerySet de DecisaoAntifraude (ver filtrar)
+            formato: 'ndjson' ou 'csv'
+            compactar: True para gzip
+            lote: Decisões por consulta
+        """
+        if formato not in cls.FORMATOS:
+            raise ValueError(f"Formato inválido: {formato} (use {', '.join(cls.FORMATOS)})")
+        return cls._blocos(decisoes, formato, compactar, lote)
+
+    @classmethod
+    def _blocos(cls, decisoes, formato: str, compactar: bool, lote: int):
+        # wbits=31: cabeçalho e rodapé gzip, comprimido bloco a bloco
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compactar else None
+
+        def saida(bloco):
+            dados = bloco.encode('utf-8')
+            return compressor.compress(dados) if compressor else dados
+
+        partes = []
+        tamanho = 0
+        for texto in cls._textos(cls.linhas(decisoes, lote), formato):
+            partes.append(texto)
+            tamanho += len(texto)
+            if tamanho >= cls.TAMANHO_BLOCO:
+                dados = saida(''.join(partes))
+                partes, tamanho = [], 0
+                if dados:
+                    yield dados
+
+        dados = saida(''.join(partes))
+        if compressor:
+            dados += compressor.flush()
+        if dados:
+            yield dados
+
+    @classmethod
+    def nome_arquivo(cls, inicio: datetime, fim: datetime, formato: str, compactar: bool) -> str:
+        extensao = 'csv' if formato == 'csv' else 'ndjson'
+        nome = f"decisoes_{inicio:%Y%m%d}_{fim:%Y%m%d}.{extensao}"
+        return f"{nome}.gz" if compactar else nome
+
+    @staticmethod
+    def tipo_conteudo(formato: str, compactar: bool) -> str:
+        if compactar:
+            return 'application/gzip'
+        return 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson; charset=utf-8'
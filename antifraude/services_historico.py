@@ -0,0 +1,105 @@
+"""
+Service: Histórico do Cliente
+Últimas transações do cliente com a decisão mais recente de cada uma
+(historico_cliente), em uma consulta e com cache curto por cliente_id
+"""
+import logging
+from typing import Any, Dict
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .models import DecisaoAntifraude, TransacaoRisco
+from .models_config import ConfiguracaoAntifraude
+
+logger = logging.getLogger('antifraude.historico')
+
+
+class HistoricoClienteService:
+    """
+    A decisão mais recente entra como Subquery anotada em cada transação:
+    uma única consulta em vez de uma por transação.
+
+    Cache: uma chave por cliente (entradas por limit) para que a
+    invalidação seja um único DELETE; os signals invalidam a cada decisão
+    criada ou revisada de uma transação do cliente.
+    """
+
+    CACHE_PREFIXO = 'historico_cliente'
+    CACHE_SEGUNDOS = 30
+    LIMITE_MAXIMO = 100
+
+    @classmethod
+    def _chave_cache(cls, cliente_id: int) -> str:
+        return f"{cls.CACHE_PREFIXO}:{cliente_id}"
+
+    @staticmethod
+    def calcular(cliente_id: int, limit: int) -> Dict[str, Any]:
+        """Histórico direto do banco (sem cache)"""
+        ultima_decisao = DecisaoAntifraude.objects.filter(
+            transacao=OuterRef('pk')
+        ).order_by('-created_at', '-id')
+
+        transacoes = TransacaoRisco.objects.filter(
+            cliente_id=cliente_id
+        ).annotate(
+            ultima_decisao=Subquery(ultima_decisao.values('decisao')[:1]),
+            ultimo_score=Subquery(ultima_decisao.values('score_risco')[:1])
+        ).order_by('-data_transacao').values(
+            'transacao_id', 'origem', 'valor', 'data_transacao', 'ultima_decisao', 'ultimo_score'
+        )[:limit]
+
+        resultado = [
+            {
+                'transacao_id': transacao['transacao_id'],
+                'origem': transacao['origem'],
+                'valor': str(transacao['valor']),
+                'data_transacao': transacao['data_transacao'].isoformat(),
+                'decisao': transacao['ultima_decisao'],
+                'score_risco': transacao['ultimo_score']
+            }
+            for transacao in transacoes
+            # Transações ainda sem decisão ficam de fora
+            if transacao['ultima_decisao'] is not None
+        ]
+
+        return {
+            'cliente_id': cliente_id,
+            'total': len(resultado),
+            'transacoes': resultado
+        }
+
+    @classmethod
+    def consultar(cls, cliente_id: int, limit: int = 10) -> Dict[str, Any]:
+        """Histórico do cache (HISTORICO_CLIENTE_CACHE_SEGUNDOS) ou do banco"""
+        limit = max(1, min(limit, cls.LIMITE_MAXIMO))
+        chave = cls._chave_cache(cliente_id)
+
+        try:
+            por_limit = cache.get(chave)
+            if por_limit and str(limit) in por_limit:
+                return por_limit[str(limit)]
+        except Exception as e:
+            logger.warning(f"Erro ao ler cache do histórico: {str(e)}")
+            por_limit = None
+
+        dados = cls.calcular(cliente_id, limit)
+
+        try:
+            ttl = ConfiguracaoAntifraude.get_config('HISTORICO_CLIENTE_CACHE_SEGUNDOS', cls.CACHE_SEGUNDOS)
+            if ttl:
+                por_limit = por_limit or {}
+                por_limit[str(limit)] = dados
+                cache.set(chave, por_limit, ttl)
+        except Exception as e:
+            logger.warning(f"Erro ao gravar cache do histórico: {str(e)}")
+
+        return dados
+
+    @classmethod
+    def invalidar_cache(cls, cliente_id: int):
+        """Remove o histórico cacheado do cliente (fail-open)"""
+        try:
+            cache.delete(cls._chave_cache(cliente_id))
+        except Exception as e:
+            logger.warning(f"Erro ao invalidar cache do histórico do cliente {cliente_id}: {str(e)}")
@@ -6,10 +6,12 @@ from decimal import Decimal
 from datetime import datetime, timedelta
 import requests
 import json
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 from django.core.cache import cache
 from django.conf import settings
 
+from .singleflight import SingleFlight
+
 
 class MaxMindService:
     """
@@ -21,6 +23,11 @@ class MaxMindService:
     API_URL = "https://minfraud.maxmind.com/minfraud/v2.0/score"
     CACHE_TIMEOUT = 3600  # 1 hora em segundos
     SCORE_NEUTRO = 50  # Score padrão quando API falha
+    ULTIMO_SCORE_TIMEOUT = 7 * 24 * 3600  # Último score conhecido por CPF (7 dias)
+    TIMEOUT_SEGUNDOS = 3
+    
+    # Consultas simultâneas com a mesma chave de cache viram uma só
+    _coalescencia = SingleFlight('maxmind', espera_maxima_segundos=TIMEOUT_SEGUNDOS, lock_segundos=TIMEOUT_SEGUNDOS + 2)
     
     @staticmethod
     def _get_cache_key(cpf: str, valor: Decimal, ip: str = None) -> str:
@@ -118,16 +125,10 @@ class MaxMindService:
         # Verificar cache primeiro
         if usar_cache:
             cache_key = MaxMindService._get_cache_key(cpf, valor, ip)
-            cached_score = cache.get(cache_key)
+            resultado_cache = MaxMindService._resultado_cache(cache_key)
             
-            if cached_score is not None:
-                return {
-                    'score': cached_score,
-                    'risk_score': cached_score / 100,
-                    'fonte': 'cache',
-                    'detalhes': {'cached': True},
-                    'tempo_consulta_ms': 0
-                }
+            if resultado_cache is not None:
+                return resultado_cache
         
         # Verificar se credenciais estão configuradas
         account_id = getattr(settings, 'MAXMIND_ACCOUNT_ID', None)
@@ -143,6 +144,46 @@ class MaxMindService:
                 'tempo_consulta_ms': 0
             }
         
+        if usar_cache:
+            # Rajada do mesmo CPF: um busca, os demais esperam o resultado (ou o cache)
+            return MaxMindService._coalescencia.executar(
+                cache_key,
+                buscar=lambda: MaxMindService._consultar_api(transacao_data, account_id, license_key, usar_cache),
+                ler_cache=lambda: MaxMindService._resultado_cache(cache_key),
+                fallback=lambda: {
+                    'score': MaxMindService.SCORE_NEUTRO,
+                    'risk_score': MaxMindService.SCORE_NEUTRO / 100,
+                    'fonte': 'fallback',
+                    'detalhes': {'motivo': 'Timeout aguardando consulta MaxMind em andamento'},
+                    'tempo_consulta_ms': 0
+                }
+            )
+        
+        return MaxMindService._consultar_api(transacao_data, account_id, license_key, usar_cache)
+    
+    @staticmethod
+    def _resultado_cache(cache_key: str) -> Optional[Dict[str, Any]]:
+        """Resultado no formato de consultar_score() se houver score em cache"""
+        cached_score = cache.get(cache_key)
+        
+        if cached_score is None:
+            return None
+        
+        return {
+            'score': cached_score,
+            'risk_score': cached_score / 100,
+            'fonte': 'cache',
+            'detalhes': {'cached': True},
+            'tempo_consulta_ms': 0
+        }
+    
+    @staticmethod
+    def _consultar_api(transacao_data: Dict[str, Any], account_id: str, license_key: str, usar_cache: bool) -> Dict[str, Any]:
+        """Chamada HTTP ao minFraud (sem cache na leitura); grava cache se usar_cache"""
+        cpf = transacao_data.get('cpf')
+        valor = transacao_data.get('valor')
+        ip = transacao_data.get('ip_address')
+        
         # Preparar requisição
         payload = MaxMindService._preparar_payload(transacao_data)
         auth = (account_id, license_key)
@@ -152,10 +193,10 @@ class MaxMindService:
         try:
             # Consultar API MaxMind
             response = requests.post(
-                MaxMindService.API_URL,
+                getattr(settings, 'MAXMIND_API_URL', MaxMindService.API_URL),
                 auth=auth,
                 json=payload,
-                timeout=3  # 3 segundos de timeout
+                timeout=MaxMindService.TIMEOUT_SEGUNDOS
             )
             
             tempo_ms = int((datetime.now() - inicio).total_seconds() * 1000)
@@ -172,6 +213,9 @@ class MaxMindService:
                     cache_key = MaxMindService._get_cache_key(cpf, valor, ip)
                     cache.set(cache_key, score, MaxMindService.CACHE_TIMEOUT)
                 
+                # Alimentar política de amostragem (último score + latência média)
+                PoliticaConsultaMaxMind.registrar_consulta(cpf, score, tempo_ms)
+                
                 return {
                     'score': score,
                     'risk_score': risk_score / 100,
@@ -254,5 +298,283 @@ class MaxMindService:
         return {
             'cache_timeout': MaxMindService.CACHE_TIMEOUT,
             'score_neutro': MaxMindService.SCORE_NEUTRO,
-            'api_url': MaxMindService.API_URL
+            'api_url': getattr(settings, 'MAXMIND_API_URL', MaxMindService.API_URL),
+            'politica': PoliticaConsultaMaxMind.obter_economia(),
+            'coalescencia': dict(MaxMindService._coalescencia.estatisticas)
+        }
+
+
+class PoliticaConsultaMaxMind:
+    """
+    Decide, por transação, se vale a pena consultar o minFraud
+    
+    Evita consultas cujo resultado pouco muda a decisão (POS sem IP,
+    cliente em whitelist, histórico recente de baixo risco). Quando a
+    consulta é pulada, usa o último score conhecido do CPF ou o score
+    a priori configurado.
+    
+    Configurações (ConfiguracaoAntifraude):
+    - MAXMIND_POLITICA_ATIVA: liga/desliga a política (padrão: False)
+    - MAXMIND_PULAR_POS_SEM_IP: pula POS sem IP (padrão: True)
+    - MAXMIND_PULAR_WHITELIST: pula CPF em whitelist (padrão: True)
+    - MAXMIND_VALOR_CONSULTA_OBRIGATORIA: a partir deste valor sempre consulta (padrão: 1000.00)
+    - MAXMIND_HISTORICO_TRANSACOES: consultas reais recentes avaliadas (padrão: 5)
+    - MAXMIND_HISTORICO_SCORE_MAX: score minFraud máximo do histórico para pular (padrão: 20)
+    - MAXMIND_HISTORICO_DIAS: idade máxima das consultas do histórico (padrão: 7)
+    - MAXMIND_SCORE_PRIORI: score usado sem histórico MaxMind (padrão: 50)
+    """
+    
+    CHAVE_ULTIMO_SCORE = "maxmind:ultimo_score:{cpf}"
+    CHAVE_LATENCIA_MEDIA = "maxmind:politica:latencia_media_ms"
+    CHAVE_CONSULTAS_REALIZADAS = "maxmind:politica:consultas_realizadas"
+    CHAVE_CONSULTAS_EVITADAS = "maxmind:politica:consultas_evitadas"
+    CHAVE_LATENCIA_EVITADA = "maxmind:politica:latencia_evitada_ms"
+    CONTADORES_TIMEOUT = 30 * 24 * 3600  # 30 dias
+    HISTORICO_DECISOES_MAX = 50  # Decisões lidas para achar as consultas reais
+    
+    @staticmethod
+    def deve_consultar(transacao_data: Dict[str, Any], origem: str, whitelists: Optional[list] = None) -> Tuple[bool, str]:
+        """
+        Avalia se a transação deve consultar o minFraud
+        
+        Args:
+            transacao_data: Dados da transação (cpf, valor, ip_address, transacao_id)
+            origem: POS, APP ou WEB
+            whitelists: Resultado de AnaliseRiscoService._verificar_whitelist()
+        
+        Returns:
+            (consultar: bool, motivo: str)
+        """
+        from .models_config import ConfiguracaoAntifraude
+        
+        if not ConfiguracaoAntifraude.get_config('MAXMIND_POLITICA_ATIVA', False):
+            return True, 'politica_inativa'
+        
+        valor = Decimal(str(transacao_data.get('valor') or 0))
+        valor_obrigatorio = ConfiguracaoAntifraude.get_config('MAXMIND_VALOR_CONSULTA_OBRIGATORIA', 1000.0)
+        
+        # Faixa de valor alto sempre consulta (custo da consulta << custo da fraude)
+        if valor >= Decimal(str(valor_obrigatorio)):
+            return True, 'valor_alto'
+        
+        if origem == 'POS' and not transacao_data.get('ip_address'):
+            if ConfiguracaoAntifraude.get_config('MAXMIND_PULAR_POS_SEM_IP', True):
+                return False, 'pos_sem_ip'
+        
+        cpf_em_whitelist = any(w.get('tipo') == 'CPF' for w in (whitelists or []))
+        if cpf_em_whitelist and ConfiguracaoAntifraude.get_config('MAXMIND_PULAR_WHITELIST', True):
+            return False, 'whitelist'
+        
+        if PoliticaConsultaMaxMind._historico_baixo_risco(transacao_data):
+            return False, 'historico_baixo_risco'
+        
+        return True, 'sem_criterio_para_pular'
+    
+    @staticmethod
+    def _historico_baixo_risco(transacao_data: Dict[str, Any]) -> bool:
+        """
+        True se as últimas N consultas reais ao minFraud do CPF têm score baixo
+        
+        Conta só decisões em que o minFraud foi consultado (ou reavaliado), com
+        o score da API: o score final já traz desconto de whitelist e as
+        decisões com consulta pulada ou provisória repetiriam o próprio
+        histórico. IP ou dispositivo que não aparece nessas consultas, ou
+        consulta mais antiga que MAXMIND_HISTORICO_DIAS, obriga consultar.
+        """
+        from .models import DecisaoAntifraude
+        from .models_config import ConfiguracaoAntifraude
+        
+        cpf = transacao_data.get('cpf')
+        if not cpf:
+            return False
+        
+        quantidade = ConfiguracaoAntifraude.get_config('MAXMIND_HISTORICO_TRANSACOES', 5)
+        score_max = ConfiguracaoAntifraude.get_config('MAXMIND_HISTORICO_SCORE_MAX', 20)
+        dias = ConfiguracaoAntifraude.get_config('MAXMIND_HISTORICO_DIAS', 7)
+        
+        decisoes = DecisaoAntifraude.objects.filter(
+            transacao__cpf=cpf,
+            created_at__gte=datetime.now() - timedelta(days=dias)
+        ).exclude(
+            transacao__transacao_id=transacao_data.get('transacao_id')
+        ).order_by('-created_at').values_list(
+            'regras_acionadas', 'transacao__ip_address', 'transacao__device_fingerprint'
+        )[:PoliticaConsultaMaxMind.HISTORICO_DECISOES_MAX]
+        
+        scores = []
+        ips = set()
+        dispositivos = set()
+        for regras, ip, dispositivo in decisoes:
+            score = PoliticaConsultaMaxMind._score_consultado(regras)
+            if score is None:
+                continue
+            scores.append(score)
+            ips.add(ip)
+            dispositivos.add(dispositivo)
+            if len(scores) >= quantidade:
+                break
+        
+        # Histórico incompleto não é evidência suficiente
+        if len(scores) < quantidade:
+            return False
+        
+        # IP/dispositivo novo: o histórico não cobre o sinal que o minFraud avaliaria
+        if transacao_data.get('ip_address') and transacao_data['ip_address'] not in ips:
+            return False
+        if transacao_data.get('device_fingerprint') and transacao_data['device_fingerprint'] not in dispositivos:
+            return False
+        
+        return max(scores) <= score_max
+    
+    @staticmethod
+    def _score_consultado(regras_acionadas) -> Optional[int]:
+        """Score minFraud da decisão se a API foi consultada (None: pulada, provisória ou fallback)"""
+        regra = next(
+            (r for r in regras_acionadas or [] if isinstance(r, dict) and r.get('tipo') == 'SCORE_EXTERNO'),
+            None
+        )
+        if regra is None:
+            return None
+        
+        detalhes = regra.get('detalhes') or {}
+        if 'score_reavaliado' in detalhes:
+            # Provisória já reavaliada (reavaliar_maxmind)
+            return detalhes['score_reavaliado']
+        if detalhes.get('provisorio') or detalhes.get('consulta_evitada') or 'motivo' in detalhes:
+            return None
+        return regra.get('peso')
+    
+    @staticmethod
+    def score_sem_consulta(cpf: str, motivo: str) -> Dict[str, Any]:
+        """
+        Monta resultado no formato de consultar_score() sem chamar a API
+        
+        Args:
+            cpf: CPF do cliente
+            motivo: Motivo retornado por deve_consultar()
+        
+        Returns:
+            Dict no mesmo formato de MaxMindService.consultar_score() com fonte='politica'
+        """
+        score, score_origem = PoliticaConsultaMaxMind._score_conhecido(cpf)
+        
+        PoliticaConsultaMaxMind._registrar_economia()
+        
+        return {
+            'score': score,
+            'risk_score': score / 100,
+            'fonte': 'politica',
+            'detalhes': {
+                'consulta_evitada': True,
+                'motivo_politica': motivo,
+                'score_origem': score_origem
+            },
+            'tempo_consulta_ms': 0
+        }
+    
+    @staticmethod
+    def score_provisorio(cpf: str) -> Dict[str, Any]:
+        """
+        Score provisório para decisão imediata (consulta real feita depois, via Celery)
+        
+        Args:
+            cpf: CPF do cliente
+        
+        Returns:
+            Dict no mesmo formato de MaxMindService.consultar_score() com fonte='provisorio'
+        """
+        score, score_origem = PoliticaConsultaMaxMind._score_conhecido(cpf)
+        
+        return {
+            'score': score,
+            'risk_score': score / 100,
+            'fonte': 'provisorio',
+            'detalhes': {
+                'provisorio': True,
+                'score_origem': score_origem
+            },
+            'tempo_consulta_ms': 0
+        }
+    
+    @staticmethod
+    def _score_conhecido(cpf: str) -> Tuple[int, str]:
+        """Último score MaxMind do CPF ou score a priori configurado"""
+        from .models_config import ConfiguracaoAntifraude
+        
+        ultimo_score = cache.get(PoliticaConsultaMaxMind.CHAVE_ULTIMO_SCORE.format(cpf=cpf)) if cpf else None
+        
+        if ultimo_score is not None:
+            return ultimo_score, 'ultimo_conhecido'
+        
+        return ConfiguracaoAntifraude.get_config('MAXMIND_SCORE_PRIORI', MaxMindService.SCORE_NEUTRO), 'priori'
+    
+    @staticmethod
+    def registrar_consulta(cpf: str, score: int, tempo_ms: int):
+        """
+        Registra consulta real: último score do CPF e média móvel da latência
+        
+        Args:
+            cpf: CPF do cliente
+            score: Score retornado pela API
+            tempo_ms: Latência da consulta
+        """
+        try:
+            if cpf:
+                cache.set(
+                    PoliticaConsultaMaxMind.CHAVE_ULTIMO_SCORE.format(cpf=cpf),
+                    score,
+                    MaxMindService.ULTIMO_SCORE_TIMEOUT
+                )
+            
+            # Média móvel exponencial (alpha=0.1) da latência real
+            media_atual = cache.get(PoliticaConsultaMaxMind.CHAVE_LATENCIA_MEDIA)
+            nova_media = tempo_ms if media_atual is None else int(media_atual * 0.9 + tempo_ms * 0.1)
+            cache.set(PoliticaConsultaMaxMind.CHAVE_LATENCIA_MEDIA, nova_media, PoliticaConsultaMaxMind.CONTADORES_TIMEOUT)
+            
+            PoliticaConsultaMaxMind._incrementar(PoliticaConsultaMaxMind.CHAVE_CONSULTAS_REALIZADAS, 1)
+        except Exception:
+            # Métricas nunca quebram a análise
+            pass
+    
+    @staticmethod
+    def _registrar_economia():
+        """Contabiliza consulta evitada e latência estimada economizada"""
+        try:
+            latencia_media = cache.get(PoliticaConsultaMaxMind.CHAVE_LATENCIA_MEDIA) or 0
+            PoliticaConsultaMaxMind._incrementar(PoliticaConsultaMaxMind.CHAVE_CONSULTAS_EVITADAS, 1)
+            PoliticaConsultaMaxMind._incrementar(PoliticaConsultaMaxMind.CHAVE_LATENCIA_EVITADA, int(latencia_media))
+        except Exception:
+            pass
+    
+    @staticmethod
+    def _incrementar(chave: str, delta: int):
+        """Incrementa contador no cache criando a chave se necessário"""
+        cache.add(chave, 0, PoliticaConsultaMaxMind.CONTADORES_TIMEOUT)
+        if delta:
+            cache.incr(chave, delta)
+    
+    @staticmethod
+    def obter_economia() -> Dict[str, Any]:
+        """
+        Retorna contadores de consultas realizadas/evitadas e latência economizada
+        
+        Returns:
+            {
+                'consultas_realizadas': 1200,
+                'consultas_evitadas': 800,
+                'taxa_evitada': 40.0,
+                'latencia_media_ms': 240,
+                'latencia_evitada_ms': 192000
+            }
+        """
+        realizadas = cache.get(PoliticaConsultaMaxMind.CHAVE_CONSULTAS_REALIZADAS) or 0
+        evitadas = cache.get(PoliticaConsultaMaxMind.CHAVE_CONSULTAS_EVITADAS) or 0
+        total = realizadas + evitadas
+        
+        return {
+            'consultas_realizadas': realizadas,
+            'consultas_evitadas': evitadas,
+            'taxa_evitada': round(evitadas / total * 100, 2) if total else 0.0,
+            'latencia_media_ms': cache.get(PoliticaConsultaMaxMind.CHAVE_LATENCIA_MEDIA) or 0,
+            'latencia_evitada_ms': cache.get(PoliticaConsultaMaxMind.CHAVE_LATENCIA_EVITADA) or 0
         }
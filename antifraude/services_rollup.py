@@ -0,0 +1,216 @@
+"""
+Service: Rollups de Transações
+Agregados por minuto/hora e dimensão (RollupTransacao) para as consultas
+agregadas das regras e do dashboard
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+import hashlib
+import logging
+import math
+
+from django.db.models import Q, Sum
+
+from .models import RollupTransacao, TransacaoRisco
+
+logger = logging.getLogger('antifraude.rollup')
+
+
+class RollupService:
+    """
+    Escrita incremental e leitura dos rollups
+
+    Sketch de distintos: contagem linear em 63 bits (cabe num BIGINT com
+    sinal); cada CPF/IP liga um bit pelo hash, janelas se combinam com OR e a
+    estimativa é -m * ln(bits_zerados / m). Precisa para as dezenas de
+    entidades que as regras comparam; satura perto de 250 distintos.
+    """
+
+    BITS_SKETCH = 63
+
+    # Dimensão -> atributo de TransacaoRisco
+    DIMENSOES = {
+        'cpf': 'cpf',
+        'ip': 'ip_address',
+        'dispositivo': 'device_fingerprint',
+        'bin': 'bin_cartao',
+        'loja': 'loja_id',
+        'origem': 'origem',
+    }
+
+    @staticmethod
+    def bucket(data: datetime, granularidade: str) -> datetime:
+        """Início do minuto/hora de data"""
+        if granularidade == RollupTransacao.GRANULARIDADE_HORA:
+            return data.replace(minute=0, second=0, microsecond=0)
+        return data.replace(second=0, microsecond=0)
+
+    @classmethod
+    def bit_sketch(cls, valor) -> int:
+        if not valor:
+            return 0
+        return 1 << (int(hashlib.sha1(str(valor).encode()).hexdigest()[:8], 16) % cls.BITS_SKETCH)
+
+    @classmethod
+    def estimar_distintos(cls, sketch: int) -> int:
+        """Estimativa de distintos do sketch (contagem linear)"""
+        zerados = cls.BITS_SKETCH - bin(sketch & ((1 << cls.BITS_SKETCH) - 1)).count('1')
+        if zerados == 0:
+            return round(cls.BITS_SKETCH * math.log(cls.BITS_SKETCH))
+        return round(-cls.BITS_SKETCH * math.log(zerados / cls.BITS_SKETCH))
+
+    @classmethod
+    def linhas_da_transacao(cls, transacao: TransacaoRisco, reprovadas: int = 0, contar_transacao: bool = True) -> list:
+        """
+        Linhas de RollupTransacao.registrar para a transação (uma por dimensão e granularidade)
+
+        Args:
+            transacao: TransacaoRisco
+            reprovadas: Decisões REPROVADO a somar
+            contar_transacao: False para registrar só a reprovação (decisão posterior à transação)
+        """
+        sketch_cpfs = cls.bit_sketch(transacao.cpf) if contar_transacao else 0
+        sketch_ips = cls.bit_sketch(transacao.ip_address) if contar_transacao else 0
+
+        linhas = []
+        for granularidade in (RollupTransacao.GRANULARIDADE_MINUTO, RollupTransacao.GRANULARIDADE_HORA):
+            bucket = cls.bucket(transacao.data_transacao, granularidade)
+            for dimensao, atributo in cls.DIMENSOES.items():
+                valor = getattr(transacao, atributo)
+                if valor in (None, ''):
+                    continue
+                linhas.append({
+                    'granularidade': granularidade,
+                    'bucket': bucket,
+                    'dimensao': dimensao,
+                    'valor_dimensao': str(valor),
+                    'transacoes': 1 if contar_transacao else 0,
+                    'valor_total': transacao.valor if contar_transacao else Decimal('0'),
+                    'reprovadas': reprovadas,
+                    'sketch_cpfs': sketch_cpfs,
+                    'sketch_ips': sketch_ips,
+                })
+        return linhas
+
+    @staticmethod
+    def combinar(linhas: list) -> list:
+        """Soma linhas com a mesma chave (lotes do backfill)"""
+        combinadas = {}
+        for linha in linhas:
+            chave = (linha['granularidade'], linha['bucket'], linha['dimensao'], linha['valor_dimensao'])
+            atual = combinadas.get(chave)
+            if atual is None:
+                combinadas[chave] = dict(linha)
+                continue
+            for campo in ('transacoes', 'valor_total', 'reprovadas'):
+                atual[campo] += linha[campo]
+            for campo in ('sketch_cpfs', 'sketch_ips'):
+                atual[campo] |= linha[campo]
+        return list(combinadas.values())
+
+    @classmethod
+    def consultar(cls, dimensao: str, valor, inicio: datetime, fim: datetime,
+                  granularidade: str = RollupTransacao.GRANULARIDADE_MINUTO) -> dict:
+        """
+        Agregado da chave entre inicio e fim
+
+        A janela é arredondada para baixo no minuto/hora de inicio (pode
+        incluir até uma granularidade a mais antes de inicio).
+
+        Returns:
+            dict: transacoes, valor_total, reprovadas, cpfs_distintos, ips_distintos
+        """
+        linhas = RollupTransacao.objects.filter(
+            granularidade=granularidade,
+            dimensao=dimensao,
+            valor_dimensao=str(valor),
+            bucket__gte=cls.bucket(inicio, granularidade),
+            bucket__lte=fim
+        ).values_list('transacoes', 'valor_total', 'reprovadas', 'sketch_cpfs', 'sketch_ips')
+
+        resultado = {'transacoes': 0, 'valor_total': Decimal('0'), 'reprovadas': 0}
+        sketch_cpfs = sketch_ips = 0
+        for transacoes, valor_total, reprovadas, cpfs, ips in linhas:
+            resultado['transacoes'] += transacoes
+            resultado['valor_total'] += valor_total
+            resultado['reprovadas'] += reprovadas
+            sketch_cpfs |= cpfs
+            sketch_ips |= ips
+
+        resultado['cpfs_distintos'] = cls.estimar_distintos(sketch_cpfs)
+        resultado['ips_distintos'] = cls.estimar_distintos(sketch_ips)
+        return resultado
+
+    @classmethod
+    def contar_transacoes(cls, dimensao: str, valor, inicio: datetime, fim: datetime) -> int:
+        """
+        Transações da chave em [inicio, fim], exato
+
+        Soma os rollups por minuto inteiramente dentro da janela e conta em
+        TransacaoRisco só as bordas (minuto parcial de inicio e de fim).
+        """
+        um_minuto = timedelta(minutes=1)
+        primeiro_inteiro = cls.bucket(inicio, RollupTransacao.GRANULARIDADE_MINUTO)
+        if primeiro_inteiro < inicio:
+            primeiro_inteiro += um_minuto
+        minuto_fim = cls.bucket(fim, RollupTransacao.GRANULARIDADE_MINUTO)
+
+        transacoes = TransacaoRisco.objects.filter(**{cls.DIMENSOES[dimensao]: valor})
+        if primeiro_inteiro >= minuto_fim:
+            # Janela menor que um minuto inteiro
+            return transacoes.filter(data_transacao__gte=inicio, data_transacao__lte=fim).count()
+
+        inteiros = RollupTransacao.objects.filter(
+            granularidade=RollupTransacao.GRANULARIDADE_MINUTO,
+            dimensao=dimensao,
+            valor_dimensao=str(valor),
+            bucket__gte=primeiro_inteiro,
+            bucket__lt=minuto_fim
+        ).aggregate(total=Sum('transacoes'))['total'] or 0
+
+        bordas = transacoes.filter(
+            Q(data_transacao__gte=inicio, data_transacao__lt=primeiro_inteiro)
+            | Q(data_transacao__gte=minuto_fim, data_transacao__lte=fim)
+        ).count()
+        return inteiros + bordas
+
+    @classmethod
+    def transacoes_por_valor(cls, dimensao: str, inicio: datetime, fim: datetime) -> dict:
+        """{valor_dimensao: transações} no período (rollups por hora)"""
+        return dict(RollupTransacao.objects.filter(
+            granularidade=RollupTransacao.GRANULARIDADE_HORA,
+            dimensao=dimensao,
+            bucket__gte=cls.bucket(inicio, RollupTransacao.GRANULARIDADE_HORA),
+            bucket__lte=fim
+        ).values('valor_dimensao').annotate(
+            total=Sum('transacoes')
+        ).order_by().values_list('valor_dimensao', 'total'))
+
+    @staticmethod
+    def podar(retencao_minutos_horas: int, retencao_horas_dias: int, lote: int = 5000) -> dict:
+        """
+        Remove rollups por minuto/hora mais antigos que a retenção, em lotes
+
+        Returns:
+            dict: {granularidade: linhas removidas}
+        """
+        agora = datetime.now()
+        limites = {
+            RollupTransacao.GRANULARIDADE_MINUTO: agora - timedelta(hours=retencao_minutos_horas),
+            RollupTransacao.GRANULARIDADE_HORA: agora - timedelta(days=retencao_horas_dias),
+        }
+
+        removidas = {}
+        for granularidade, limite in limites.items():
+            total = 0
+            while True:
+                ids = list(RollupTransacao.objects.filter(
+                    granularidade=granularidade,
+                    bucket__lt=limite
+                ).values_list('id', flat=True)[:lote])
+                if not ids:
+                    break
+                total += RollupTransacao.objects.filter(id__in=ids).delete()[0]
+            removidas[granularidade] = total
+
+        return removidas
@@ -0,0 +1,107 @@
+"""
+Signals do app Antifraude
+- Vínculos CPF-IP/dispositivo (VinculoCpfEntidade) a cada transação inserida
+- Rollups por minuto/hora (RollupTransacao) a cada transação inserida e decisão que passa a REPROVADO
+- Regras acionadas de cada decisão (RegraAcionada) com bulk_create
+- Invalidação do histórico do cliente em cache a cada decisão criada ou revisada
+- Publicação de transações e decisões (criadas ou que passam a REPROVADO) no stream de detecção em tempo real (streaming.py)
+- Cache de bloqueios do validate_login a cada bloqueio salvo ou apagado (admin, views, shell)
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import streaming
+from .models import (
+    TransacaoRisco, DecisaoAntifraude, VinculoCpfEntidade, RollupTransacao, RegraAcionada, BloqueioSeguranca
+)
+from .services_bloqueio import BloqueioService
+from .services_historico import HistoricoClienteService
+from .services_rollup import RollupService
+
+logger = logging.getLogger('antifraude.signals')
+
+
+@receiver(post_save, sender=TransacaoRisco, dispatch_uid='antifraude_vinculos_transacao')
+def registrar_vinculos_transacao(sender, instance, created, **kwargs):
+    if not created:
+        return
+    try:
+        # Savepoint: falha no upsert não pode abortar a transação da análise
+        with transaction.atomic():
+            VinculoCpfEntidade.registrar(VinculoCpfEntidade.linhas_da_transacao(instance))
+    except Exception as e:
+        logger.error(f"Erro ao registrar vínculos da transação {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=TransacaoRisco, dispatch_uid='antifraude_rollup_transacao')
+def registrar_rollup_transacao(sender, instance, created, **kwargs):
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            RollupTransacao.registrar(RollupService.linhas_da_transacao(instance))
+    except Exception as e:
+        logger.error(f"Erro ao registrar rollup da transação {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=DecisaoAntifraude, dispatch_uid='antifraude_rollup_decisao')
+def registrar_rollup_reprovacao(sender, instance, created, **kwargs):
+    # Na criação ou depois (validação 3DS, revisão manual)
+    if not instance.entrou_em('REPROVADO'):
+        return
+    try:
+        with transaction.atomic():
+            RollupTransacao.registrar(
+                RollupService.linhas_da_transacao(instance.transacao, reprovadas=1, contar_transacao=False)
+            )
+    except Exception as e:
+        logger.error(f"Erro ao registrar rollup da decisão {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=DecisaoAntifraude, dispatch_uid='antifraude_regras_acionadas')
+def registrar_regras_acionadas(sender, instance, created, **kwargs):
+    if not created:
+        return
+    try:
+        linhas = RegraAcionada.linhas_da_decisao(instance)
+        if linhas:
+            with transaction.atomic():
+                RegraAcionada.objects.bulk_create(linhas)
+    except Exception as e:
+        logger.error(f"Erro ao registrar regras acionadas da decisão {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=DecisaoAntifraude, dispatch_uid='antifraude_historico_cliente')
+def invalidar_historico_cliente(sender, instance, **kwargs):
+    cliente_id = instance.transacao.cliente_id
+    if cliente_id is not None:
+        # Após o commit: invalidar antes deixaria uma leitura concorrente recachear o estado antigo
+        transaction.on_commit(lambda: HistoricoClienteService.invalidar_cache(cliente_id))
+
+
+@receiver(post_save, sender=TransacaoRisco, dispatch_uid='antifraude_stream_transacao')
+def publicar_transacao_criada(sender, instance, created, **kwargs):
+    if created and streaming.ativo():
+        # Só publica o que foi commitado (consumidor lê o banco em seguida)
+        transaction.on_commit(lambda: streaming.publicar_transacao(instance))
+
+
+@receiver(post_save, sender=DecisaoAntifraude, dispatch_uid='antifraude_stream_decisao')
+def publicar_decisao(sender, instance, created, **kwargs):
+    # Criada, ou reprovada depois (3DS, revisão): o consumidor só conta REPROVADO
+    if (created or instance.entrou_em('REPROVADO')) and streaming.ativo():
+        transaction.on_commit(lambda: streaming.publicar_decisao(instance))
+
+
+@receiver(post_save, sender=BloqueioSeguranca, dispatch_uid='antifraude_cache_bloqueio')
+def publicar_bloqueio(sender, instance, **kwargs):
+    # Após o commit: rollback não pode deixar bloqueio (ou desbloqueio) fantasma no cache
+    transaction.on_commit(lambda: BloqueioService.publicar([instance]))
+
+
+@receiver(post_delete, sender=BloqueioSeguranca, dispatch_uid='antifraude_cache_bloqueio_removido')
+def remover_bloqueio(sender, instance, **kwargs):
+    transaction.on_commit(lambda: BloqueioService.remover([instance]))
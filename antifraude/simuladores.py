@@ -0,0 +1,675 @@
+"""
+Simuladores locais de serviços externos
+Permitem benchmark, testes de carga e injeção de falhas offline (sem rede)
+
+Upstreams simulados:
+- MaxMind minFraud score (POST /minfraud/v2.0/score)
+- Histórico de autenticação do wallclub_django (GET .../analise/<cpf>/, POST .../analise/lote/)
+- Gateway 3DS (/v2/check-enrollment, /v2/authenticate, /v2/authenticate/<id>)
+- Webhook Slack
+- Callback do app principal
+
+Cada simulador aceita um PerfilFalha (latência com cauda, erros HTTP,
+travamento estilo slowloris e respostas truncadas).
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Iterable
+from urllib.parse import urlsplit
+
+
+class PerfilFalha:
+    """
+    Comportamento de um upstream simulado
+
+    Latência: log-normal com mediana latencia_ms e p99 latencia_p99_ms
+    (sem p99 = latência fixa). Falhas são sorteadas por requisição, na ordem
+    erro → travamento → parcial, com as taxas informadas (0.0 a 1.0).
+    """
+
+    def __init__(
+        self,
+        latencia_ms: float = 0,
+        latencia_p99_ms: Optional[float] = None,
+        taxa_erro: float = 0.0,
+        status_erro: int = 503,
+        taxa_travamento: float = 0.0,
+        travamento_segundos: float = 30,
+        taxa_parcial: float = 0.0,
+        semente: Optional[int] = None
+    ):
+        """
+        Args:
+            latencia_ms: Mediana da latência
+            latencia_p99_ms: p99 da latência (cauda log-normal)
+            taxa_erro: Fração de requisições respondidas com status_erro
+            status_erro: Status HTTP dos erros injetados (500, 503, 429...)
+            taxa_travamento: Fração de requisições que travam (slowloris)
+            travamento_segundos: Quanto tempo a resposta travada fica pingando bytes
+            taxa_parcial: Fração de respostas truncadas no meio do corpo
+            semente: Semente do sorteio (reprodutibilidade)
+        """
+        self.latencia_ms = latencia_ms
+        self.latencia_p99_ms = latencia_p99_ms
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.taxa_travamento = taxa_travamento
+        self.travamento_segundos = travamento_segundos
+        self.taxa_parcial = taxa_parcial
+        self._random = random.Random(semente)
+
+    def sortear_latencia_ms(self) -> float:
+        if not self.latencia_ms:
+            return 0.0
+        if not self.latencia_p99_ms or self.latencia_p99_ms <= self.latencia_ms:
+            return float(self.latencia_ms)
+        # p99 da normal padrão = 2.326
+        sigma = math.log(self.latencia_p99_ms / self.latencia_ms) / 2.326
+        return self.latencia_ms * math.exp(sigma * self._random.gauss(0, 1))
+
+    def sortear_falha(self) -> Optional[str]:
+        """Retorna 'erro', 'travamento', 'parcial' ou None"""
+        sorteio = self._random.random()
+        for falha, taxa in (
+            ('erro', self.taxa_erro),
+            ('travamento', self.taxa_travamento),
+            ('parcial', self.taxa_parcial),
+        ):
+            if sorteio < taxa:
+                return falha
+            sorteio -= taxa
+        return None
+
+    @classmethod
+    def de_texto(cls, texto: str) -> 'PerfilFalha':
+        """
+        Cria perfil a partir de nome pré-definido (PERFIS) ou lista chave=valor
+
+        Ex: 'lento', 'latencia=20,p99=400,erro=0.1,status=429,travamento=0.02,travamento_s=20,parcial=0.05'
+        """
+        if texto in PERFIS:
+            return PERFIS[texto]()
+
+        campos = {
+            'latencia': ('latencia_ms', float),
+            'p99': ('latencia_p99_ms', float),
+            'erro': ('taxa_erro', float),
+            'status': ('status_erro', int),
+            'travamento': ('taxa_travamento', float),
+            'travamento_s': ('travamento_segundos', float),
+            'parcial': ('taxa_parcial', float),
+            'semente': ('semente', int),
+        }
+        kwargs = {}
+        for par in filter(None, texto.split(',')):
+            chave, _, valor = par.partition('=')
+            if chave.strip() not in campos:
+                raise ValueError(f"Parâmetro de perfil desconhecido: {chave}")
+            nome, tipo = campos[chave.strip()]
+            kwargs[nome] = tipo(valor)
+        return cls(**kwargs)
+
+    def __repr__(self):
+        return (
+            f"PerfilFalha(latencia={self.latencia_ms}ms p99={self.latencia_p99_ms}ms "
+            f"erro={self.taxa_erro}/{self.status_erro} travamento={self.taxa_travamento}/{self.travamento_segundos}s "
+            f"parcial={self.taxa_parcial})"
+        )
+
+
+PERFIS = {
+    'normal': lambda: PerfilFalha(latencia_ms=20, latencia_p99_ms=120),
+    'lento': lambda: PerfilFalha(latencia_ms=800, latencia_p99_ms=4000),
+    'instavel': lambda: PerfilFalha(latencia_ms=40, latencia_p99_ms=600, taxa_erro=0.2),
+    'fora': lambda: PerfilFalha(taxa_erro=1.0, status_erro=503),
+    'limitado': lambda: PerfilFalha(latencia_ms=20, taxa_erro=0.5, status_erro=429),
+    'travado': lambda: PerfilFalha(taxa_travamento=1.0, travamento_segundos=40),
+    'parcial': lambda: PerfilFalha(latencia_ms=20, taxa_parcial=0.5),
+}
+
+
+class RespostaStream:
+    """Resposta em streaming (uma linha por item), truncável pelo perfil 'parcial'"""
+
+    def __init__(self, linhas: Iterable[bytes], content_type: str = 'application/x-ndjson', total: Optional[int] = None, atraso_linha_ms: float = 0):
+        self.linhas = linhas
+        self.content_type = content_type
+        self.total = total
+        self.atraso_linha_ms = atraso_linha_ms
+
+
+class _HandlerSimulador(BaseHTTPRequestHandler):
+    """Encaminha requisições para o simulador dono do servidor"""
+
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        # Sem log por requisição (atrapalha benchmark)
+        pass
+
+    def do_GET(self):
+        self.server.simulador.tratar(self, 'GET')
+
+    def do_POST(self):
+        self.server.simulador.tratar(self, 'POST')
+
+    def ler_corpo(self) -> Any:
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if not tamanho:
+            return {}
+        bruto = self.rfile.read(tamanho)
+        try:
+            return json.loads(bruto)
+        except ValueError:
+            return bruto.decode(errors='replace')
+
+    def responder_json(self, status: int, dados: Any):
+        corpo = json.dumps(dados).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+class SimuladorUpstream:
+    """
+    Base dos simuladores: servidor HTTP em thread daemon + roteamento + injeção de falhas
+
+    Subclasses definem ROTAS = [(metodo, regex, nome_do_metodo)]; cada método
+    recebe (match, corpo, handler) e retorna (status, dados) ou RespostaStream.
+    """
+
+    NOME = 'upstream'
+    ROTAS = []
+    EXIGE_BEARER = False
+    MAX_RECEBIDOS = 1000
+
+    def __init__(self, perfil: Optional[PerfilFalha] = None, host: str = '127.0.0.1', porta: int = 0):
+        self.perfil = perfil or PerfilFalha()
+        self.host = host
+        self.porta = porta
+        self.requisicoes = 0
+        self.falhas_injetadas = {'erro': 0, 'travamento': 0, 'parcial': 0}
+        self.recebidos = deque(maxlen=self.MAX_RECEBIDOS)
+        self._rotas = [(metodo, re.compile(padrao), nome) for metodo, padrao, nome in self.ROTAS]
+        self._servidor: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._parando = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar(self) -> str:
+        """Sobe o servidor em thread daemon e retorna a URL base"""
+        self._parando.clear()
+        self._servidor = ThreadingHTTPServer((self.host, self.porta), _HandlerSimulador)
+        self._servidor.daemon_threads = True
+        self._servidor.simulador = self
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name=f'simulador-{self.NOME}', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def parar(self):
+        """Derruba o servidor (libera respostas travadas)"""
+        self._parando.set()
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self) -> str:
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            'requisicoes': self.requisicoes,
+            'falhas_injetadas': dict(self.falhas_injetadas),
+        }
+
+    def tratar(self, handler: _HandlerSimulador, metodo: str):
+        """Roteia requisição, aplica latência/falhas do perfil e responde"""
+        caminho = urlsplit(handler.path).path
+
+        for metodo_rota, padrao, nome in self._rotas:
+            match = padrao.match(caminho)
+            if metodo_rota == metodo and match:
+                break
+        else:
+            handler.responder_json(404, {'erro': 'rota não encontrada'})
+            return
+
+        if self.EXIGE_BEARER and not handler.headers.get('Authorization', '').startswith('Bearer '):
+            handler.responder_json(401, {'erro': 'token ausente'})
+            return
+
+        corpo = handler.ler_corpo() if metodo == 'POST' else {}
+        falha = self.perfil.sortear_falha()
+
+        with self._lock:
+            self.requisicoes += 1
+            self.recebidos.append({'caminho': caminho, 'corpo': corpo})
+            if falha:
+                self.falhas_injetadas[falha] += 1
+
+        self._aguardar(self.perfil.sortear_latencia_ms())
+
+        if falha == 'erro':
+            handler.responder_json(self.perfil.status_erro, {'erro': 'falha injetada pelo simulador'})
+            return
+
+        if falha == 'travamento':
+            self._travar(handler)
+            return
+
+        resposta = getattr(self, nome)(match, corpo, handler)
+
+        if isinstance(resposta, RespostaStream):
+            self._responder_stream(handler, resposta, parcial=falha == 'parcial')
+            return
+
+        status, dados = resposta
+        if falha == 'parcial':
+            self._responder_parcial(handler, status, dados)
+        else:
+            handler.responder_json(status, dados)
+
+    def _aguardar(self, ms: float):
+        if ms > 0:
+            self._parando.wait(ms / 1000)
+
+    def _travar(self, handler: _HandlerSimulador):
+        """
+        Slowloris: envia headers prometendo corpo grande e pinga 1 byte por segundo
+
+        Timeout de leitura do requests é por recv, então cada byte renova o
+        timeout e a chamada só termina quando o travamento acaba.
+        """
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', '1048576')
+        handler.end_headers()
+        handler.wfile.flush()
+
+        fim = time.monotonic() + self.perfil.travamento_segundos
+        try:
+            while time.monotonic() < fim and not self._parando.is_set():
+                handler.wfile.write(b' ')
+                handler.wfile.flush()
+                self._parando.wait(1)
+        except OSError:
+            pass  # Cliente desistiu
+
+    def _responder_parcial(self, handler: _HandlerSimulador, status: int, dados: Any):
+        """Anuncia o corpo inteiro mas envia só metade e fecha a conexão"""
+        corpo = json.dumps(dados).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(corpo)))
+        handler.end_headers()
+        handler.wfile.write(corpo[:max(1, len(corpo) // 2)])
+        handler.close_connection = True
+
+    def _responder_stream(self, handler: _HandlerSimulador, resposta: RespostaStream, parcial: bool = False):
+        """Escreve linhas à medida que são geradas; parcial corta no meio de uma linha"""
+        handler.send_response(200)
+        handler.send_header('Content-Type', resposta.content_type)
+        handler.end_headers()
+
+        limite = (resposta.total // 2) if (parcial and resposta.total) else None
+
+        try:
+            for indice, linha in enumerate(resposta.linhas):
+                self._aguardar(resposta.atraso_linha_ms)
+                if limite is not None and indice >= limite:
+                    handler.wfile.write(linha[:max(1, len(linha) // 2)])
+                    break
+                handler.wfile.write(linha + b'\n')
+            handler.wfile.flush()
+        except OSError:
+            pass
+        handler.close_connection = True
+
+
+def _semente(texto: str) -> bytes:
+    return hashlib.sha256(texto.encode()).digest()
+
+
+def dados_autenticacao_sinteticos(cpf: str) -> Dict[str, Any]:
+    """
+    Gera resposta determinística no formato do endpoint de análise de autenticação
+
+    O mesmo CPF sempre gera os mesmos dados, para resultados reproduzíveis.
+
+    Args:
+        cpf: CPF do cliente
+
+    Returns:
+        dict: Mesmo formato de /cliente/api/v1/autenticacao/analise/<cpf>/
+    """
+    semente = _semente(cpf)
+
+    tentativas = semente[0] % 20
+    falhas = semente[1] % (tentativas + 1)
+    bloqueado = semente[2] % 50 == 0
+
+    flags = []
+    if semente[3] % 10 == 0:
+        flags.append('multiplos_ips_recentes')
+    if semente[4] % 10 == 0:
+        flags.append('multiplos_devices_recentes')
+    if bloqueado:
+        flags.append('bloqueio_recente')
+
+    return {
+        'encontrado': semente[5] % 10 != 0,
+        'cpf': cpf,
+        'status_autenticacao': {
+            'bloqueado': bloqueado,
+            'tentativas_15min': falhas % 3,
+            'tentativas_1h': falhas % 5,
+            'tentativas_24h': falhas
+        },
+        'historico_recente': {
+            'total_tentativas': tentativas,
+            'tentativas_falhas': falhas,
+            'taxa_falha': round(falhas / tentativas, 2) if tentativas else 0.0,
+            'ips_distintos': 1 + semente[6] % 4,
+            'devices_distintos': 1 + semente[7] % 3
+        },
+        'dispositivos_conhecidos': [],
+        'bloqueios_historico': [{'motivo': 'simulado'}] if bloqueado else [],
+        'flags_risco': flags
+    }
+
+
+class SimuladorAutenticacao(SimuladorUpstream):
+    """
+    Stub local do endpoint de análise de autenticação do wallclub_django
+
+    Rotas:
+    - GET  /cliente/api/v1/autenticacao/analise/<cpf>/
+    - POST /cliente/api/v1/autenticacao/analise/lote/  (NDJSON em streaming)
+
+    Uso:
+        with SimuladorAutenticacao(latencia_ms=20) as url:
+            ClienteAutenticacaoService.DJANGO_BASE_URL = url
+            ...
+    """
+
+    NOME = 'autenticacao'
+    EXIGE_BEARER = True
+    ROTAS = [
+        ('GET', r'^/cliente/api/v1/autenticacao/analise/(\d{11})/$', 'analise'),
+        ('POST', r'^/cliente/api/v1/autenticacao/analise/lote/$', 'analise_lote'),
+    ]
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        porta: int = 0,
+        latencia_ms: int = 0,
+        latencia_por_cpf_ms: float = 0,
+        perfil: Optional[PerfilFalha] = None
+    ):
+        """
+        Args:
+            host: Interface de escuta
+            porta: Porta (0 = escolhida pelo sistema)
+            latencia_ms: Latência fixa por requisição (ignorada se perfil for informado)
+            latencia_por_cpf_ms: Latência adicional por CPF processado
+            perfil: Perfil de latência/falhas
+        """
+        super().__init__(perfil or PerfilFalha(latencia_ms=latencia_ms), host, porta)
+        self.latencia_por_cpf_ms = latencia_por_cpf_ms
+        self.cpfs_servidos = 0
+
+    def analise(self, match, corpo, handler):
+        with self._lock:
+            self.cpfs_servidos += 1
+        self._aguardar(self.latencia_por_cpf_ms)
+        return 200, dados_autenticacao_sinteticos(match.group(1))
+
+    def analise_lote(self, match, corpo, handler):
+        cpfs = corpo.get('cpfs', []) if isinstance(corpo, dict) else []
+        with self._lock:
+            self.cpfs_servidos += len(cpfs)
+        return RespostaStream(
+            (json.dumps(dados_autenticacao_sinteticos(cpf)).encode() for cpf in cpfs),
+            total=len(cpfs),
+            atraso_linha_ms=self.latencia_por_cpf_ms
+        )
+
+
+class SimuladorMaxMind(SimuladorUpstream):
+    """Stub do minFraud Score (POST /minfraud/v2.0/score), risk_score determinístico por CPF/IP"""
+
+    NOME = 'maxmind'
+    ROTAS = [
+        ('POST', r'^/minfraud/v2\.0/score$', 'score'),
+    ]
+
+    def score(self, match, corpo, handler):
+        corpo = corpo if isinstance(corpo, dict) else {}
+        chave = f"{corpo.get('account', {}).get('user_id')}:{corpo.get('device', {}).get('ip_address')}"
+        semente = _semente(chave)
+        risk_score = round(0.1 + (semente[0] * 256 + semente[1]) / 65535 * 60, 2)
+
+        return 200, {
+            'id': str(uuid.uuid4()),
+            'risk_score': risk_score,
+            'funds_remaining': 100.0,
+            'queries_remaining': 100000,
+            'ip_address': {'risk': round(semente[2] / 255 * 10, 2)},
+            'warnings': []
+        }
+
+
+class Simulador3DS(SimuladorUpstream):
+    """Stub do gateway 3DS (/v2/check-enrollment, /v2/authenticate, /v2/authenticate/<id>)"""
+
+    NOME = 'threeds'
+    ROTAS = [
+        ('POST', r'^/v2/check-enrollment$', 'check_enrollment'),
+        ('POST', r'^/v2/authenticate$', 'authenticate'),
+        ('GET', r'^/v2/authenticate/([\w-]+)$', 'resultado'),
+    ]
+
+    def check_enrollment(self, match, corpo, handler):
+        bin_cartao = str(corpo.get('bin', '')) if isinstance(corpo, dict) else ''
+        semente = _semente(bin_cartao)
+        return 200, {
+            'enrolled': semente[0] % 5 != 0,
+            'version': '2.2.0',
+            'issuer_bank': f"Banco Simulado {semente[1] % 10}",
+            'acs_url': 'https://acs.simulado.local/challenge',
+            'message': 'Simulado'
+        }
+
+    def authenticate(self, match, corpo, handler):
+        auth_id = f"SIM-{uuid.uuid4().hex[:16]}"
+        return 200, {
+            'auth_id': auth_id,
+            'redirect_url': f"https://acs.simulado.local/challenge/{auth_id}",
+            'method': 'BROWSER',
+            'expires_at': None
+        }
+
+    def resultado(self, match, corpo, handler):
+        status = 'N' if _semente(match.group(1))[0] % 10 == 0 else 'Y'
+        return 200, {
+            'status': status,
+            'eci': '05' if status == 'Y' else '07',
+            'cavv': 'AAABCZIhcQAAAABZlyFxAAAAAAA=' if status == 'Y' else None,
+            'xid': uuid.uuid4().hex
+        }
+
+
+class SimuladorSlack(SimuladorUpstream):
+    """Stub de webhook Slack (POST /services/<qualquer coisa>)"""
+
+    NOME = 'slack'
+    ROTAS = [
+        ('POST', r'^/services/.*$', 'webhook'),
+    ]
+
+    def webhook(self, match, corpo, handler):
+        return 200, 'ok'
+
+
+class SimuladorCallback(SimuladorUpstream):
+    """Stub do app principal (callbacks de revisão, reavaliação e sessão 3DS)"""
+
+    NOME = 'callback'
+    ROTAS = [
+        ('POST', r'^/.*$', 'callback'),
+    ]
+
+    def callback(self, match, corpo, handler):
+        return 200, {'sucesso': True}
+
+
+# Cenários de falha prontos para o harness de carga: {upstream: nome do perfil}
+# (sem 3DS: o gateway é chamado pela view de análise, não por analisar_transacao)
+CENARIOS = {
+    'normal': {},
+    'maxmind_lento': {'maxmind': 'lento'},
+    'maxmind_fora': {'maxmind': 'fora'},
+    'maxmind_travado': {'maxmind': 'travado'},
+    'maxmind_parcial': {'maxmind': 'parcial'},
+    'auth_lento': {'autenticacao': 'lento'},
+    'auth_fora': {'autenticacao': 'fora'},
+    'auth_travado': {'autenticacao': 'travado'},
+    'slack_travado': {'slack': 'travado'},
+    'callback_fora': {'callback': 'fora'},
+    'tudo_instavel': {
+        'maxmind': 'instavel',
+        'autenticacao': 'instavel',
+        'slack': 'instavel',
+        'callback': 'instavel'
+    },
+}
+
+
+class AmbienteSimulado:
+    """
+    Sobe todos os upstreams simulados e aponta o Risk Engine para eles (in-process)
+
+    Uso:
+        with AmbienteSimulado({'maxmind': PerfilFalha.de_texto('travado')}) as ambiente:
+            AnaliseRiscoService.analisar_transacao(transacao)
+            ambiente.estatisticas()
+    """
+
+    CLASSES = {
+        'maxmind': SimuladorMaxMind,
+        'autenticacao': SimuladorAutenticacao,
+        'threeds': Simulador3DS,
+        'slack': SimuladorSlack,
+        'callback': SimuladorCallback,
+    }
+
+    def __init__(self, perfis: Optional[Dict[str, PerfilFalha]] = None, perfil_padrao: str = 'normal', portas: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            perfis: Perfil por upstream (maxmind, autenticacao, threeds, slack, callback)
+            perfil_padrao: Perfil dos upstreams não informados
+            portas: Porta fixa por upstream (modo standalone); padrão = porta livre
+        """
+        perfis = perfis or {}
+        portas = portas or {}
+        self.simuladores = {
+            nome: classe(perfil=perfis.get(nome) or PerfilFalha.de_texto(perfil_padrao), porta=portas.get(nome, 0))
+            for nome, classe in self.CLASSES.items()
+        }
+        self._override = None
+        self._auth_original = None
+
+    @classmethod
+    def de_cenario(cls, cenario: str) -> 'AmbienteSimulado':
+        return cls({upstream: PerfilFalha.de_texto(perfil) for upstream, perfil in CENARIOS[cenario].items()})
+
+    def iniciar(self):
+        for simulador in self.simuladores.values():
+            simulador.iniciar()
+
+    def parar(self):
+        for simulador in self.simuladores.values():
+            simulador.parar()
+
+    def variaveis_ambiente(self) -> Dict[str, str]:
+        """Variáveis para apontar outro processo (runserver, worker) para os simuladores"""
+        return {
+            'MAXMIND_API_URL': f"{self.simuladores['maxmind'].url}/minfraud/v2.0/score",
+            'CLIENTE_AUTH_BASE_URL': self.simuladores['autenticacao'].url,
+            'THREEDS_ENABLED': 'True',
+            'THREEDS_GATEWAY_URL': self.simuladores['threeds'].url,
+            'THREEDS_MERCHANT_ID': 'simulado',
+            'THREEDS_MERCHANT_KEY': 'simulado',
+            'SLACK_WEBHOOK_URL': f"{self.simuladores['slack'].url}/services/simulado",
+            'CALLBACK_URL_PRINCIPAL': self.simuladores['callback'].url,
+        }
+
+    def __enter__(self) -> 'AmbienteSimulado':
+        from django.test import override_settings
+        from .services_cliente_auth import ClienteAutenticacaoService
+
+        self.iniciar()
+        variaveis = self.variaveis_ambiente()
+
+        self._override = override_settings(
+            MAXMIND_API_URL=variaveis['MAXMIND_API_URL'],
+            MAXMIND_ACCOUNT_ID='simulado',
+            MAXMIND_LICENSE_KEY='simulado',
+            THREEDS_ENABLED=True,
+            THREEDS_GATEWAY_URL=variaveis['THREEDS_GATEWAY_URL'],
+            THREEDS_MERCHANT_ID='simulado',
+            THREEDS_MERCHANT_KEY='simulado',
+            SLACK_WEBHOOK_URL=variaveis['SLACK_WEBHOOK_URL'],
+            CALLBACK_URL_PRINCIPAL=variaveis['CALLBACK_URL_PRINCIPAL'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        )
+        self._override.enable()
+
+        # Base URL e token são atributos de classe do service (token fixo: sem OAuth real)
+        self._auth_original = (
+            ClienteAutenticacaoService.DJANGO_BASE_URL,
+            ClienteAutenticacaoService._token,
+            ClienteAutenticacaoService._token_expira_em,
+        )
+        ClienteAutenticacaoService.DJANGO_BASE_URL = variaveis['CLIENTE_AUTH_BASE_URL']
+        ClienteAutenticacaoService._token = 'simulado'
+        ClienteAutenticacaoService._token_expira_em = time.monotonic() + 86400
+        return self
+
+    def __exit__(self, *exc):
+        from .services_cliente_auth import ClienteAutenticacaoService
+
+        if self._override:
+            self._override.disable()
+            self._override = None
+        if self._auth_original:
+            (
+                ClienteAutenticacaoService.DJANGO_BASE_URL,
+                ClienteAutenticacaoService._token,
+                ClienteAutenticacaoService._token_expira_em,
+            ) = self._auth_original
+            self._auth_original = None
+        self.parar()
+
+    def estatisticas(self) -> Dict[str, Dict[str, Any]]:
+        return {nome: simulador.estatisticas() for nome, simulador in self.simuladores.items()}
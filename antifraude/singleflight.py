@@ -0,0 +1,168 @@
+"""
+Single-flight: coalescência de consultas idênticas simultâneas a upstreams
+
+Rajadas (card testing, retries) trazem o mesmo CPF ao mesmo tempo; sem
+coalescência cada request perde o cache e faz a sua própria chamada externa.
+
+Com SingleFlight.executar(chave, buscar, ler_cache):
+- Mesma chave no mesmo processo: só uma thread chama buscar(), as demais
+  esperam o resultado dela (Event).
+- Entre processos/containers: lock curto no Redis (cache.add); quem não pegou
+  o lock faz polling em ler_cache() até o líder gravar o resultado.
+- Espera limitada: passou do limite (ou o líder falhou), o seguidor responde
+  com fallback() em vez de chamar o upstream: se o líder travou, o upstream
+  provavelmente está travado para todos e a rajada inteira pagaria o timeout.
+"""
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger('antifraude.singleflight')
+
+
+class _Chamada:
+    """Chamada em andamento no processo"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.sucesso = False
+
+
+class SingleFlight:
+    """
+    Coalescência por chave (threads do processo + lock Redis entre workers)
+
+    Args:
+        nome: Prefixo das chaves de lock (ex: 'maxmind')
+        espera_maxima_segundos: Quanto um seguidor espera antes de cair no fallback
+        lock_segundos: TTL do lock Redis (deve cobrir o timeout do upstream)
+        intervalo_polling_segundos: Intervalo de polling do cache entre workers
+    """
+
+    PREFIXO_LOCK = 'singleflight'
+
+    def __init__(
+        self,
+        nome: str,
+        espera_maxima_segundos: float = 3.0,
+        lock_segundos: int = 5,
+        intervalo_polling_segundos: float = 0.05
+    ):
+        self.nome = nome
+        self.espera_maxima_segundos = espera_maxima_segundos
+        self.lock_segundos = lock_segundos
+        self.intervalo_polling_segundos = intervalo_polling_segundos
+        self._em_andamento: Dict[str, _Chamada] = {}
+        self._lock = threading.Lock()
+        self.estatisticas = {'lider': 0, 'coalescido_local': 0, 'coalescido_redis': 0, 'espera_esgotada': 0}
+
+    def executar(
+        self,
+        chave: str,
+        buscar: Callable[[], Any],
+        ler_cache: Callable[[], Optional[Any]],
+        fallback: Callable[[], Any],
+        espera_maxima_segundos: Optional[float] = None,
+        lock_segundos: Optional[int] = None
+    ) -> Any:
+        """
+        Executa buscar() uma única vez por chave entre chamadas simultâneas
+
+        Args:
+            chave: Mesma chave do cache do resultado
+            buscar: Faz a chamada externa (e grava o cache, quando for o caso)
+            ler_cache: Lê o resultado gravado pelo líder em outro worker (None = ainda não)
+            fallback: Resposta do seguidor quando a espera esgota ou o líder falha
+            espera_maxima_segundos: Sobrescreve o limite de espera desta chamada
+            lock_segundos: Sobrescreve o TTL do lock Redis desta chamada
+
+        Returns:
+            Resultado de buscar() (próprio ou do líder), ou de fallback()
+        """
+        espera = self.espera_maxima_segundos if espera_maxima_segundos is None else espera_maxima_segundos
+        ttl_lock = self.lock_segundos if lock_segundos is None else lock_segundos
+
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = _Chamada()
+                self._em_andamento[chave] = chamada
+
+        if not lider:
+            if chamada.evento.wait(espera) and chamada.sucesso:
+                self._contar('coalescido_local')
+                return chamada.resultado
+            return self._desistir(ler_cache, fallback)
+
+        try:
+            chamada.resultado = self._executar_entre_workers(chave, buscar, ler_cache, fallback, espera, ttl_lock)
+            chamada.sucesso = True
+            return chamada.resultado
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            chamada.evento.set()
+
+    def _executar_entre_workers(self, chave, buscar, ler_cache, fallback, espera, ttl_lock):
+        chave_lock = f"{self.PREFIXO_LOCK}:{self.nome}:{chave}"
+        dono = uuid.uuid4().hex
+
+        try:
+            adquiriu = cache.add(chave_lock, dono, ttl_lock)
+        except Exception as e:
+            # Redis fora: segue sem coordenação entre workers
+            logger.warning(f"[{self.nome}] Lock single-flight indisponível: {str(e)}")
+            adquiriu = True
+            dono = None
+
+        if adquiriu:
+            self._contar('lider')
+            try:
+                return buscar()
+            finally:
+                if dono:
+                    self._liberar(chave_lock, dono)
+
+        # Outro worker está buscando: aguardar o resultado aparecer no cache
+        limite = time.monotonic() + espera
+        while time.monotonic() < limite:
+            time.sleep(self.intervalo_polling_segundos)
+            try:
+                resultado = ler_cache()
+                if resultado is not None:
+                    self._contar('coalescido_redis')
+                    return resultado
+                if cache.get(chave_lock) is None:
+                    break  # Líder terminou sem gravar cache (falha/fallback)
+            except Exception:
+                break
+
+        return self._desistir(ler_cache, fallback)
+
+    def _desistir(self, ler_cache, fallback):
+        """Seguidor sem resultado do líder: último olhar no cache, senão fallback"""
+        self._contar('espera_esgotada')
+        try:
+            resultado = ler_cache()
+            if resultado is not None:
+                return resultado
+        except Exception:
+            pass
+        return fallback()
+
+    def _liberar(self, chave_lock, dono):
+        try:
+            if cache.get(chave_lock) == dono:
+                cache.delete(chave_lock)
+        except Exception:
+            pass  # Expira sozinho
+
+    def _contar(self, evento):
+        with self._lock:
+            self.estatisticas[evento] += 1
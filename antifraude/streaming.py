@@ -0,0 +1,485 @@
+"""
+Detecção em tempo real sobre Redis Streams
+
+Publicação (signals.py): cada TransacaoRisco criada e cada DecisaoAntifraude
+criada ou que passa a REPROVADO depois (validação 3DS, revisão) vira um
+evento num stream particionado (antifraude:eventos:<n>):
+- transação: partição pelo CPF (login múltiplo, velocidade)
+- decisão: partição pelo IP (tentativas falhas)
+Assim todo evento de uma mesma chave cai na mesma partição e o estado da
+janela fica inteiro num único consumidor.
+
+Consumo (python manage.py consumir_stream): ConsumidorStream lê as partições
+com consumer group, mantém as janelas em memória (EstadoJanelas) e grava as
+atividades via tasks.registrar_atividades em segundos. O XACK só acontece
+depois da gravação (at-least-once); reentregas não duplicam atividades
+porque registrar_atividades deduplica pela janela de cada tipo.
+
+A detecção periódica (detectar_atividades_suspeitas) continua rodando e cobre
+o que não depende de estado em memória (IP novo, horário suspeito).
+"""
+import heapq
+import logging
+import os
+import socket
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+logger = logging.getLogger('antifraude.stream')
+
+
+PREFIXO_STREAM = 'antifraude:eventos'
+GRUPO = 'detectores'
+
+
+def ativo() -> bool:
+    return getattr(settings, 'DETECCAO_STREAM_ATIVA', False)
+
+
+def total_particoes() -> int:
+    return getattr(settings, 'DETECCAO_STREAM_PARTICOES', 4)
+
+
+def nome_stream(particao: int) -> str:
+    return f"{PREFIXO_STREAM}:{particao}"
+
+
+def particao_de(chave) -> int:
+    """Partição estável da chave (mesmo CPF/IP sempre na mesma partição)"""
+    return zlib.crc32(str(chave).encode()) % total_particoes()
+
+
+def _conexao():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _timestamp(valor) -> float:
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.timestamp() if valor else time.time()
+
+
+def evento_transacao(transacao) -> dict:
+    return {
+        'tipo': 'transacao',
+        'id': transacao.id,
+        'transacao_id': transacao.transacao_id,
+        'cpf': transacao.cpf,
+        'ip': transacao.ip_address or '',
+        'valor': str(transacao.valor),
+        'origem': transacao.origem,
+        'ts': _timestamp(transacao.data_transacao),
+    }
+
+
+def evento_decisao(decisao) -> dict:
+    transacao = decisao.transacao
+    return {
+        'tipo': 'decisao',
+        'id': decisao.id,
+        'decisao': decisao.decisao,
+        'cpf': transacao.cpf,
+        'ip': transacao.ip_address or '',
+        # Quando entrou no estado (igual a created_at se já nasceu nele)
+        'ts': _timestamp(getattr(decisao, 'updated_at', None) or decisao.created_at),
+    }
+
+
+def publicar(evento: dict, chave, conexao=None) -> bool:
+    """
+    Publica evento na partição da chave (fail-open: erro não afeta a análise)
+    
+    Returns:
+        bool: True se publicado
+    """
+    try:
+        (conexao or _conexao()).xadd(
+            nome_stream(particao_de(chave)),
+            {campo: str(valor) for campo, valor in evento.items()},
+            maxlen=getattr(settings, 'DETECCAO_STREAM_MAXLEN', 100000),
+            approximate=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao publicar evento {evento.get('tipo')} {evento.get('id')}: {str(e)}")
+        return False
+
+
+def publicar_transacao(transacao, conexao=None) -> bool:
+    return publicar(evento_transacao(transacao), transacao.cpf, conexao)
+
+
+def publicar_decisao(decisao, conexao=None) -> bool:
+    transacao = decisao.transacao
+    return publicar(evento_decisao(decisao), transacao.ip_address or transacao.cpf, conexao)
+
+
+def _decodificar(campos: dict) -> dict:
+    evento = {
+        (chave.decode() if isinstance(chave, bytes) else chave): (valor.decode() if isinstance(valor, bytes) else valor)
+        for chave, valor in campos.items()
+    }
+    evento['id'] = int(evento['id'])
+    evento['ts'] = float(evento['ts'])
+    return evento
+
+
+class EstadoJanelas:
+    """
+    Janelas deslizantes em memória por chave
+    
+    - ips_por_cpf: (id, ts, ip) das transações do CPF (login múltiplo)
+    - transacoes_por_cpf: (id, ts, valor, ip) das transações do CPF (velocidade)
+    - reprovacoes_por_ip: (id, ts, cpf) das decisões REPROVADO do IP (tentativas falhas)
+    
+    O tempo é o do evento (data_transacao / updated_at da decisão), não o do consumidor,
+    então replay e recuperação de atraso produzem as mesmas janelas.
+    """
+    
+    def __init__(self):
+        # Janelas e limites das mesmas definições da detecção periódica (detectores.py);
+        # detector desligado fica sem limite (não emite)
+        self.janela_login, self.limite_ips = self._parametros('login_multiplo')
+        self.janela_reprovacoes, self.limite_reprovacoes = self._parametros('tentativas_falhas')
+        self.janela_velocidade, self.limite_transacoes = self._parametros('velocidade_transacao')
+        
+        self.ips_por_cpf = {}
+        self.transacoes_por_cpf = {}
+        self.reprovacoes_por_ip = {}
+        self.ultimo_ts = 0.0
+    
+    @staticmethod
+    def _parametros(nome):
+        """(janela em segundos, limite ou None) do detector"""
+        from .detectores import DEFINICOES_PADRAO, detectores_compilados
+        
+        detector = detectores_compilados().get(nome)
+        if detector is not None:
+            return detector.janela_minutos * 60, detector.limite
+        padrao = next(definicao for definicao in DEFINICOES_PADRAO if definicao['nome'] == nome)
+        return padrao['janela_minutos'] * 60, None
+    
+    @property
+    def janela_maxima_segundos(self):
+        return max(self.janela_login, self.janela_reprovacoes, self.janela_velocidade)
+    
+    def aplicar(self, evento: dict, emitir: bool = True) -> list:
+        """
+        Aplica o evento às janelas
+        
+        Eventos reentregues (mesmo id) não entram duas vezes em nenhuma
+        janela, mas são avaliados de novo (at-least-once).
+        
+        Returns:
+            list: AtividadeSuspeita candidatas (vazia se emitir=False)
+        """
+        self.ultimo_ts = max(self.ultimo_ts, evento['ts'])
+        
+        if evento['tipo'] == 'transacao':
+            return self._aplicar_transacao(evento, emitir)
+        if evento['tipo'] == 'decisao':
+            return self._aplicar_decisao(evento, emitir)
+        return []
+    
+    def _aplicar_transacao(self, evento, emitir):
+        cpf, ts = evento['cpf'], evento['ts']
+        
+        ips = self._janela(self.ips_por_cpf, cpf, ts, self.janela_login)
+        transacoes = self._janela(self.transacoes_por_cpf, cpf, ts, self.janela_velocidade)
+        
+        # Cada fila deduplica sozinha: as janelas têm tamanhos diferentes, então
+        # um id já podado de uma ainda pode estar na outra
+        if evento['ip'] and not self._contem(ips, evento['id']):
+            ips.append((evento['id'], ts, evento['ip']))
+        if not self._contem(transacoes, evento['id']):
+            transacoes.append((evento['id'], ts, Decimal(evento['valor']), evento['ip']))
+        
+        if not emitir:
+            return []
+        
+        from .models import AtividadeSuspeita
+        candidatas = []
+        
+        ips_usados = list(dict.fromkeys(ip for _, _, ip in ips))
+        if self.limite_ips is not None and len(ips_usados) >= self.limite_ips:
+            candidatas.append(AtividadeSuspeita(
+                tipo='login_multiplo',
+                cpf=cpf,
+                ip=ips_usados[0],
+                portal='app',
+                detalhes={
+                    'ips_usados': ips_usados,
+                    'total_ips': len(ips_usados),
+                    'valor_metrica': len(ips_usados),
+                    'janela_tempo_minutos': self.janela_login // 60,
+                    'deteccao': 'stream'
+                },
+                severidade=4,
+                status='pendente'
+            ))
+        
+        if self.limite_transacoes is not None and len(transacoes) >= self.limite_transacoes:
+            ips_transacoes = list(dict.fromkeys(ip or None for _, _, _, ip in transacoes))
+            candidatas.append(AtividadeSuspeita(
+                tipo='velocidade_transacao',
+                cpf=cpf,
+                ip=ips_transacoes[0] or 'desconhecido',
+                portal='app',
+                detalhes={
+                    'total_transacoes': len(transacoes),
+                    'valor_metrica': len(transacoes),
+                    'valor_total': str(sum(valor for _, _, valor, _ in transacoes)),
+                    'ips_usados': ips_transacoes,
+                    'janela_tempo_minutos': self.janela_velocidade // 60,
+                    'deteccao': 'stream'
+                },
+                severidade=4,
+                status='pendente'
+            ))
+        
+        return candidatas
+    
+    def _aplicar_decisao(self, evento, emitir):
+        if evento['decisao'] != 'REPROVADO' or not evento['ip']:
+            return []
+        
+        ip, ts = evento['ip'], evento['ts']
+        reprovacoes = self._janela(self.reprovacoes_por_ip, ip, ts, self.janela_reprovacoes)
+        
+        if not self._contem(reprovacoes, evento['id']):
+            reprovacoes.append((evento['id'], ts, evento['cpf']))
+        
+        if not emitir or self.limite_reprovacoes is None or len(reprovacoes) < self.limite_reprovacoes:
+            return []
+        
+        from .models import AtividadeSuspeita
+        cpfs_tentados = list(dict.fromkeys(cpf for _, _, cpf in reprovacoes))
+        return [AtividadeSuspeita(
+            tipo='tentativas_falhas',
+            cpf=cpfs_tentados[0],
+            ip=ip,
+            portal='web',
+            detalhes={
+                'total_reprovadas': len(reprovacoes),
+                'valor_metrica': len(reprovacoes),
+                'cpfs_tentados': cpfs_tentados[:10],
+                'janela_tempo_minutos': self.janela_reprovacoes // 60,
+                'deteccao': 'stream'
+            },
+            severidade=5,
+            status='pendente'
+        )]
+    
+    @staticmethod
+    def _contem(fila, id_):
+        return any(item[0] == id_ for item in fila)
+    
+    @staticmethod
+    def _janela(indice, chave, ts, janela_segundos):
+        """Fila da chave sem os itens fora da janela que termina em ts"""
+        fila = indice.get(chave)
+        if fila is None:
+            fila = indice[chave] = deque()
+        while fila and fila[0][1] < ts - janela_segundos:
+            fila.popleft()
+        return fila
+    
+    def podar(self):
+        """Remove chaves sem itens na janela (chamado periodicamente pelo consumidor)"""
+        for indice, janela in (
+            (self.ips_por_cpf, self.janela_login),
+            (self.transacoes_por_cpf, self.janela_velocidade),
+            (self.reprovacoes_por_ip, self.janela_reprovacoes),
+        ):
+            limite = self.ultimo_ts - janela
+            for chave in [chave for chave, fila in indice.items() if not fila or fila[-1][1] < limite]:
+                del indice[chave]
+    
+    def tamanho(self) -> dict:
+        return {
+            'cpfs_login': len(self.ips_por_cpf),
+            'cpfs_velocidade': len(self.transacoes_por_cpf),
+            'ips_reprovacoes': len(self.reprovacoes_por_ip),
+        }
+
+
+class ConsumidorStream:
+    """
+    Consumidor do consumer group 'detectores'
+    
+    Escala por partição: cada processo consome um conjunto disjunto de
+    partições (--particoes). Mensagens pendentes de um consumidor que morreu
+    são reivindicadas (XAUTOCLAIM) por quem assumir a partição depois de
+    `ocioso_reivindicar_ms`.
+    
+    Args:
+        particoes: Partições consumidas por este processo
+        nome: Nome do consumidor no grupo (padrão: host-pid)
+        lote: Mensagens por leitura
+        bloqueio_ms: Espera máxima do XREADGROUP
+        ocioso_reivindicar_ms: Idade mínima de pendentes para reivindicar
+    """
+    
+    def __init__(self, particoes, nome=None, lote=200, bloqueio_ms=2000, ocioso_reivindicar_ms=60000, conexao=None):
+        self.streams = [nome_stream(particao) for particao in particoes]
+        self.nome = nome or f"{socket.gethostname()}-{os.getpid()}"
+        self.lote = lote
+        self.bloqueio_ms = bloqueio_ms
+        self.ocioso_reivindicar_ms = ocioso_reivindicar_ms
+        self.conexao = conexao or _conexao()
+        self.estado = EstadoJanelas()
+        self.estatisticas = {'eventos': 0, 'candidatas': 0, 'criadas': 0, 'erros': 0}
+    
+    def preparar(self):
+        """Cria o consumer group em cada partição (idempotente)"""
+        from redis.exceptions import ResponseError
+        
+        for stream in self.streams:
+            try:
+                self.conexao.xgroup_create(stream, GRUPO, id='0', mkstream=True)
+            except ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+    
+    def aquecer(self, minutos=None) -> int:
+        """
+        Reconstrói as janelas com os eventos recentes das partições (sem emitir)
+        
+        Returns:
+            int: Eventos aplicados
+        """
+        segundos = minutos * 60 if minutos else self.estado.janela_maxima_segundos
+        inicio = f"{int((time.time() - segundos) * 1000)}-0"
+        
+        total = 0
+        for stream in self.streams:
+            minimo = inicio
+            while True:
+                mensagens = self.conexao.xrange(stream, min=minimo, max='+', count=1000)
+                if not mensagens:
+                    break
+                for _, campos in mensagens:
+                    self.estado.aplicar(_decodificar(campos), emitir=False)
+                    total += 1
+                ultimo = mensagens[-1][0]
+                minimo = f"({ultimo.decode() if isinstance(ultimo, bytes) else ultimo}"
+        
+        logger.info(f"♻️ Stream {self.nome}: {total} eventos aplicados no aquecimento | {self.estado.tamanho()}")
+        return total
+    
+    def executar(self, parar=lambda: False):
+        """Loop principal: pendentes próprios, pendentes órfãos e novos eventos"""
+        from django.db import close_old_connections
+        
+        self.preparar()
+        self.aquecer()
+        
+        self.processar(self._ler('0'))
+        proxima_poda = time.monotonic() + 60
+        
+        while not parar():
+            close_old_connections()
+            try:
+                self.processar(self._reivindicar() + self._ler('>'))
+            except Exception as e:
+                self.estatisticas['erros'] += 1
+                logger.error(f"❌ Stream {self.nome}: {str(e)}")
+                time.sleep(1)
+            
+            if time.monotonic() >= proxima_poda:
+                self.estado.podar()
+                proxima_poda = time.monotonic() + 60
+                logger.info(f"📈 Stream {self.nome}: {self.estatisticas} | {self.estado.tamanho()}")
+    
+    def processar(self, mensagens) -> int:
+        """
+        Aplica as mensagens, grava as atividades e só então confirma (XACK)
+        
+        Args:
+            mensagens: Lista de (stream, id, campos)
+        
+        Returns:
+            int: Atividades criadas
+        """
+        from django.db import transaction
+        from .tasks import registrar_atividades
+        
+        if not mensagens:
+            return 0
+        
+        candidatas = []
+        for _, _, campos in mensagens:
+            candidatas.extend(self.estado.aplicar(_decodificar(campos)))
+        
+        with transaction.atomic():
+            criadas = registrar_atividades(candidatas)
+        
+        por_stream = {}
+        for stream, id_mensagem, _ in mensagens:
+            por_stream.setdefault(stream, []).append(id_mensagem)
+        for stream, ids in por_stream.items():
+            self.conexao.xack(stream, GRUPO, *ids)
+        
+        self.estatisticas['eventos'] += len(mensagens)
+        self.estatisticas['candidatas'] += len(candidatas)
+        self.estatisticas['criadas'] += sum(criadas.values())
+        return sum(criadas.values())
+    
+    def _ler(self, a_partir_de):
+        resposta = self.conexao.xreadgroup(
+            GRUPO, self.nome,
+            {stream: a_partir_de for stream in self.streams},
+            count=self.lote,
+            block=self.bloqueio_ms if a_partir_de == '>' else None
+        ) or []
+        
+        return [
+            (stream.decode() if isinstance(stream, bytes) else stream, id_mensagem, campos)
+            for stream, entradas in resposta
+            for id_mensagem, campos in entradas
+            if campos  # Pendente cuja mensagem já saiu do stream (MAXLEN)
+        ]
+    
+    def _reivindicar(self):
+        mensagens = []
+        for stream in self.streams:
+            resposta = self.conexao.xautoclaim(
+                stream, GRUPO, self.nome,
+                min_idle_time=self.ocioso_reivindicar_ms,
+                start_id='0-0',
+                count=self.lote
+            )
+            mensagens.extend((stream, id_mensagem, campos) for id_mensagem, campos in resposta[1] if campos)
+        return mensagens
+
+
+def eventos_do_banco(minutos: int):
+    """
+    Eventos das transações criadas e das decisões criadas ou alteradas nos últimos `minutos`, em ordem de tempo
+    (replay_stream: republicação no stream ou reconstrução local das janelas)
+    
+    Yields:
+        tuple: (evento, chave de partição)
+    """
+    from .models import TransacaoRisco, DecisaoAntifraude
+    
+    desde = datetime.now() - timedelta(minutes=minutos)
+    
+    transacoes = (
+        (evento_transacao(t), t.cpf)
+        for t in TransacaoRisco.objects.filter(created_at__gte=desde).order_by('id').iterator(chunk_size=2000)
+    )
+    decisoes = (
+        (evento_decisao(d), d.transacao.ip_address or d.transacao.cpf)
+        for d in DecisaoAntifraude.objects.filter(
+            updated_at__gte=desde
+        ).select_related('transacao').order_by('updated_at', 'id').iterator(chunk_size=2000)
+    )
+    
+    yield from heapq.merge(transacoes, decisoes, key=lambda item: item[0]['ts'])
@@ -2,364 +2,537 @@
 Tasks Celery para Detecção Automática de Atividades Suspeitas
 Fase 4 - Semana 23
 """
-from celery import shared_task
-from django.db.models import Count, Q
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
 from datetime import datetime, timedelta
 import logging
+import time
 
-from .models import TransacaoRisco, AtividadeSuspeita, BloqueioSeguranca
+from .detectores import detectores_compilados
+from .lease import Lease, registrar_metrica, tarefa_unica
+from .models import (
+    TransacaoRisco, AtividadeSuspeita, CheckpointDetector, VinculoCpfEntidade
+)
 
 logger = logging.getLogger('antifraude.detector')
 
 
+# Janela de agregação do detector de IP novo (minutos); os demais estão em detectores.py
+JANELA_IP_NOVO = 5
+
+
 @shared_task
+@tarefa_unica()
 def detectar_atividades_suspeitas():
     """
     Task periódica (a cada 5 minutos) que analisa logs e detecta atividades suspeitas
     
-    Regras de detecção:
+    Regras de detecção (padrões; limites e janelas em detectores.py e no
+    model DetectorDeclarativo, que também aceita detectores novos):
     1. Login Múltiplo: mesmo CPF em 3+ IPs diferentes em 10 minutos
     2. Tentativas Falhas: 5+ transações reprovadas do mesmo IP em 5 minutos
     3. IP Novo: CPF usando IP nunca visto antes
     4. Horário Suspeito: transações entre 02:00-05:00 AM
     5. Velocidade Transação: 10+ transações do mesmo CPF em 5 minutos
     6. Localização Anômala: IP de país diferente em menos de 1 hora
+    
+    Cada detector processa só as linhas novas desde o seu checkpoint
+    (CheckpointDetector), em lotes; se o beat atrasar ou a task expirar,
+    a próxima execução continua de onde parou. Os detectores rodam em
+    paralelo (group na fila 'deteccao') e o resumo sai no callback do chord.
+    
+    Cada detector roda sob um lease próprio ('deteccao:<nome>'): se o ciclo
+    anterior ainda estiver processando um detector, ele é pulado neste ciclo.
+    
+    O @tarefa_unica desta task só cobre o disparo do chord (milissegundos) e,
+    sem broker, a execução em sequência no próprio worker; a exclusão entre
+    ciclos do trabalho dos detectores vem dos leases por detector.
     """
     logger.info("🔍 Iniciando detecção automática de atividades suspeitas...")
     
+    agora = datetime.now()
+    nomes = [nome for nome, *_ in obter_detectores()]
+    
+    # Detectores em paralelo na fila 'deteccao'; consolidar_deteccoes recebe todos os resultados
     try:
-        agora = datetime.now()
-        janela_5min = agora - timedelta(minutes=5)
-        janela_10min = agora - timedelta(minutes=10)
-        janela_1hora = agora - timedelta(hours=1)
-        
-        deteccoes = {
-            'login_multiplo': 0,
-            'tentativas_falhas': 0,
-            'ip_novo': 0,
-            'horario_suspeito': 0,
-            'velocidade_transacao': 0,
-        }
-        
-        # 1. Detectar Login Múltiplo (mesmo CPF em 3+ IPs diferentes em 10 min)
-        deteccoes['login_multiplo'] = detectar_login_multiplo(janela_10min)
-        
-        # 2. Detectar Tentativas Falhas (5+ transações reprovadas do mesmo IP)
-        deteccoes['tentativas_falhas'] = detectar_tentativas_falhas(janela_5min)
-        
-        # 3. Detectar IP Novo (CPF usando IP nunca visto antes)
-        deteccoes['ip_novo'] = detectar_ip_novo(janela_5min)
-        
-        # 4. Detectar Horário Suspeito (transações entre 02:00-05:00 AM)
-        deteccoes['horario_suspeito'] = detectar_horario_suspeito(janela_5min)
-        
-        # 5. Detectar Velocidade de Transação (10+ transações do mesmo CPF)
-        deteccoes['velocidade_transacao'] = detectar_velocidade_transacao(janela_5min)
-        
-        total_detectado = sum(deteccoes.values())
-        logger.info(f"✅ Detecção concluída: {total_detectado} atividades suspeitas | Detalhes: {deteccoes}")
+        resultado = chord(
+            group(executar_detector.s(nome) for nome in nomes)
+        )(consolidar_deteccoes.s(agora.isoformat()))
         
         return {
             'success': True,
-            'total_detectado': total_detectado,
-            'detalhes': deteccoes,
+            'paralelo': True,
+            'chord_id': resultado.id,
+            'detectores': nomes,
             'timestamp': agora.isoformat()
         }
-        
     except Exception as e:
-        logger.error(f"❌ Erro na detecção automática: {str(e)}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
+        logger.error(f"❌ Erro ao disparar detectores em paralelo, executando em sequência: {str(e)}")
+    
+    resultados = [executar_detector(nome) for nome in nomes]
+    return consolidar_deteccoes(resultados, agora.isoformat())
 
 
-def detectar_login_multiplo(janela_tempo):
+@shared_task(soft_time_limit=270, time_limit=290)
+def executar_detector(nome):
     """
-    Detecta mesmo CPF logando em 3+ IPs diferentes em curto período
+    Executa um detector (uma task por detector, fila 'deteccao')
+    
+    Nunca levanta exceção: o erro vai no resultado para o chord consolidar
+    os demais detectores normalmente.
+    
+    Returns:
+        dict: detector, deteccoes, duracao_ms, linhas_processadas, telemetria e pulado
     """
-    count = 0
-    try:
-        # Agrupar transações por CPF e contar IPs distintos
-        transacoes_recentes = TransacaoRisco.objects.filter(
-            data_transacao__gte=janela_tempo
-        ).values('cpf').annotate(
-            ips_distintos=Count('ip_address', distinct=True)
-        ).filter(ips_distintos__gte=3)
-        
-        for trans in transacoes_recentes:
-            cpf = trans['cpf']
-            ips_distintos = trans['ips_distintos']
-            
-            # Buscar IPs usados
-            ips_usados = list(TransacaoRisco.objects.filter(
-                cpf=cpf,
-                data_transacao__gte=janela_tempo
-            ).values_list('ip_address', flat=True).distinct())
-            
-            # Verificar se já existe atividade suspeita recente
-            ja_detectado = AtividadeSuspeita.objects.filter(
-                tipo='login_multiplo',
-                cpf=cpf,
-                detectado_em__gte=janela_tempo
-            ).exists()
-            
-            if not ja_detectado:
-                # Criar atividade suspeita
-                AtividadeSuspeita.objects.create(
-                    tipo='login_multiplo',
-                    cpf=cpf,
-                    ip=ips_usados[0] if ips_usados else 'desconhecido',
-                    portal='app',  # Assumir APP por padrão
-                    detalhes={
-                        'ips_usados': ips_usados,
-                        'total_ips': ips_distintos,
-                        'janela_tempo_minutos': 10
-                    },
-                    severidade=4,  # Alta severidade
-                    status='pendente'
-                )
-                count += 1
-                logger.warning(f"⚠️ Login múltiplo detectado - CPF: {cpf[:3]}*** em {ips_distintos} IPs")
-        
-        return count
-        
-    except Exception as e:
-        logger.error(f"Erro em detectar_login_multiplo: {str(e)}")
-        return 0
+    inicio = time.perf_counter()
+    nome_lease = f'deteccao:{nome}'
+    
+    with Lease(nome_lease) as lease:
+        if not lease.adquirido:
+            # Execução anterior do mesmo detector ainda em andamento
+            registrar_metrica(nome_lease, 'puladas')
+            logger.info(f"⏭️ Detector {nome} já em execução ({lease.titular()}), pulando")
+            deteccoes, telemetria, erro = 0, {}, None
+        else:
+            registrar_metrica(nome_lease, 'executadas')
+            try:
+                _, processar_lote, modelo, campo_data, janela_minutos = obter_detector(nome)
+                deteccoes, telemetria = _executar_incremental(nome, processar_lote, modelo, campo_data, janela_minutos, lease)
+                erro = None
+            except Exception as e:
+                logger.error(f"❌ Erro no detector {nome}: {str(e)}")
+                deteccoes, telemetria, erro = 0, {}, str(e)
+    
+    return {
+        'detector': nome,
+        'deteccoes': deteccoes,
+        'duracao_ms': int((time.perf_counter() - inicio) * 1000),
+        'linhas_processadas': telemetria.get('linhas_processadas', 0),
+        'telemetria': telemetria,
+        'pulado': not lease.adquirido,
+        'erro': erro
+    }
 
 
-def detectar_tentativas_falhas(janela_tempo):
+@shared_task
+def consolidar_deteccoes(resultados, iniciado_em):
     """
-    Detecta 5+ transações reprovadas do mesmo IP em curto período
+    Callback do chord: resumo do ciclo de detecção
+    
+    Args:
+        resultados: Retornos de executar_detector
+        iniciado_em: Início do ciclo (ISO)
     """
-    count = 0
-    try:
-        # Buscar transações reprovadas agrupadas por IP
-        from .models import DecisaoAntifraude
+    deteccoes = {r['detector']: r['deteccoes'] for r in resultados}
+    telemetria = {
+        r['detector']: {
+            'duracao_ms': r['duracao_ms'],
+            'linhas_processadas': r['linhas_processadas'],
+            'deteccoes': r['deteccoes'],
+            'erro': r['erro'],
+            'pulado': r.get('pulado', False),
+            **r['telemetria']
+        }
+        for r in resultados
+    }
+    
+    total_detectado = sum(deteccoes.values())
+    duracao_ciclo_ms = int((datetime.now() - datetime.fromisoformat(iniciado_em)).total_seconds() * 1000)
+    mais_lento = max(resultados, key=lambda r: r['duracao_ms'])['detector'] if resultados else None
+    
+    logger.info(
+        f"✅ Detecção concluída em {duracao_ciclo_ms}ms: {total_detectado} atividades suspeitas | "
+        f"Detalhes: {deteccoes} | Mais lento: {mais_lento}"
+    )
+    
+    for r in resultados:
+        logger.info(
+            f"📊 Detector {r['detector']}: {r['duracao_ms']}ms | {r['linhas_processadas']} linhas | "
+            f"{r['deteccoes']} detecções{' | erro: ' + r['erro'] if r['erro'] else ''}"
+            f"{' | pulado (já em execução)' if r.get('pulado') else ''}"
+        )
+    
+    return {
+        'success': all(r['erro'] is None for r in resultados),
+        'total_detectado': total_detectado,
+        'detalhes': deteccoes,
+        'telemetria': telemetria,
+        'duracao_ciclo_ms': duracao_ciclo_ms,
+        'timestamp': iniciado_em
+    }
+
+
+def _executar_incremental(detector, processar_lote, modelo, campo_data, janela_minutos, lease=None):
+    """
+    Processa as linhas de `modelo` acima do checkpoint do detector, em lotes
+    
+    Cada lote tem no máximo DETECTOR_LOTE linhas e cobre no máximo
+    `janela_minutos` de created_at, o que limita o intervalo lido por lote a
+    duas janelas ao recuperar atraso (a métrica de cada grupo é avaliada
+    na janela de cada linha nova, ver DetectorCompilado.consulta). Atividades do lote e avanço do checkpoint
+    são gravados na mesma transação.
+    
+    Args:
+        detector: Nome do detector (chave do checkpoint)
+        processar_lote: Função (de_id, ate_id) -> lista de AtividadeSuspeita
+        modelo: Tabela de origem (TransacaoRisco ou DecisaoAntifraude)
+        campo_data: Campo de data usado na marca inicial
+        janela_minutos: Janela de agregação do detector
+        lease: Lease da execução; perdido (outro worker assumiu), para antes do próximo lote
+    
+    Returns:
+        tuple: (atividades criadas, telemetria)
+    """
+    from .models_config import ConfiguracaoAntifraude
+    
+    inicio = time.perf_counter()
+    agora = datetime.now()
+    
+    lote = ConfiguracaoAntifraude.get_config('DETECTOR_LOTE', 5000)
+    margem = ConfiguracaoAntifraude.get_config('DETECTOR_MARGEM_SEGUNDOS', 5)
+    tempo_maximo = ConfiguracaoAntifraude.get_config('DETECTOR_TEMPO_MAXIMO_SEGUNDOS', 200)
+    
+    # Margem para linhas ainda não commitadas com id menor
+    limite_criacao = agora - timedelta(seconds=margem)
+    
+    checkpoint = CheckpointDetector.obter(
+        detector, agora - timedelta(minutes=janela_minutos), modelo, campo_data
+    )
+    
+    linhas = 0
+    deteccoes = 0
+    
+    while time.perf_counter() - inicio < tempo_maximo:
+        if lease is not None and lease.perdido:
+            logger.error(f"❌ Detector {detector}: lease perdido, interrompendo no checkpoint {checkpoint.ultimo_id}")
+            break
         
-        ips_suspeitos = DecisaoAntifraude.objects.filter(
-            created_at__gte=janela_tempo,
-            decisao='REPROVADO'
-        ).values('transacao__ip_address').annotate(
-            total_reprovadas=Count('id')
-        ).filter(total_reprovadas__gte=5)
+        pendentes = modelo.objects.filter(id__gt=checkpoint.ultimo_id, created_at__lte=limite_criacao)
         
-        for item in ips_suspeitos:
-            ip = item['transacao__ip_address']
-            total = item['total_reprovadas']
-            
-            if not ip:
-                continue
-            
-            # Buscar CPFs relacionados
-            cpfs_relacionados = DecisaoAntifraude.objects.filter(
-                created_at__gte=janela_tempo,
-                decisao='REPROVADO',
-                transacao__ip_address=ip
-            ).values_list('transacao__cpf', flat=True).distinct()
-            
-            # Verificar se já detectado
-            ja_detectado = AtividadeSuspeita.objects.filter(
-                tipo='tentativas_falhas',
-                ip=ip,
-                detectado_em__gte=janela_tempo
-            ).exists()
-            
-            if not ja_detectado:
-                AtividadeSuspeita.objects.create(
-                    tipo='tentativas_falhas',
-                    cpf=list(cpfs_relacionados)[0] if cpfs_relacionados else 'desconhecido',
-                    ip=ip,
-                    portal='web',
-                    detalhes={
-                        'total_reprovadas': total,
-                        'cpfs_tentados': list(cpfs_relacionados)[:10],
-                        'janela_tempo_minutos': 5
-                    },
-                    severidade=5,  # Crítico
-                    status='pendente'
-                )
-                count += 1
-                logger.warning(f"⚠️ Tentativas falhas detectadas - IP: {ip} | Total: {total}")
+        primeira = pendentes.order_by('id').values_list('created_at', flat=True).first()
+        if primeira is None:
+            break
         
-        return count
+        ids = list(pendentes.filter(
+            created_at__lte=primeira + timedelta(minutes=janela_minutos)
+        ).order_by('id').values_list('id', flat=True)[:lote])
         
-    except Exception as e:
-        logger.error(f"Erro em detectar_tentativas_falhas: {str(e)}")
-        return 0
+        if not ids:
+            # created_at fora de ordem em relação ao id: avança uma linha
+            ids = [pendentes.order_by('id').values_list('id', flat=True).first()]
+        
+        with transaction.atomic():
+            criadas = registrar_atividades(processar_lote(checkpoint.ultimo_id, ids[-1]))
+            checkpoint.avancar(ids[-1])
+        
+        linhas += len(ids)
+        deteccoes += sum(criadas.values())
+    
+    # Linhas já processadas que entraram no estado do detector depois (ex: 3DS/revisão -> REPROVADO):
+    # updated_at desde o início da execução anterior até o limite desta
+    if getattr(processar_lote, 'rastreia_alteracoes', False) and not (lease is not None and lease.perdido):
+        desde = checkpoint.ultima_execucao or agora - timedelta(minutes=janela_minutos)
+        with transaction.atomic():
+            criadas = registrar_atividades(processar_lote.alteradas(
+                desde - timedelta(seconds=margem), limite_criacao, checkpoint.ultimo_id, margem
+            ))
+        deteccoes += sum(criadas.values())
+    
+    # Telemetria: atraso em linhas e em segundos (linha pendente mais antiga)
+    restantes = modelo.objects.filter(id__gt=checkpoint.ultimo_id)
+    mais_antiga = restantes.order_by('id').values_list('created_at', flat=True).first()
+    
+    checkpoint.registrar_execucao(
+        linhas=linhas,
+        deteccoes=deteccoes,
+        duracao_ms=int((time.perf_counter() - inicio) * 1000),
+        atraso_linhas=restantes.count(),
+        atraso_segundos=int((datetime.now() - mais_antiga).total_seconds()) if mais_antiga else 0,
+        iniciada_em=agora
+    )
+    
+    if checkpoint.atraso_linhas:
+        logger.warning(
+            f"⏳ Detector {detector} com atraso: {checkpoint.atraso_linhas} linhas / "
+            f"{checkpoint.atraso_segundos}s ({checkpoint.taxa_linhas_segundo} linhas/s)"
+        )
+    
+    return deteccoes, checkpoint.telemetria()
 
 
-def detectar_ip_novo(janela_tempo):
+def registrar_atividades(candidatas):
     """
-    Detecta CPF usando IP nunca visto antes (em toda a base histórica)
+    Deduplica e grava atividades candidatas em lote
+    
+    Busca numa única consulta as detecções (tipo, cpf, ip) já registradas na
+    janela de cada tipo, descarta duplicadas (inclusive entre as candidatas) e
+    grava as novas com bulk_create em lotes de DETECTOR_BULK_LOTE.
+    
+    Args:
+        candidatas: Lista de AtividadeSuspeita não salvas
+    
+    Returns:
+        dict: {tipo: atividades criadas}
     """
-    count = 0
-    try:
-        # Buscar transações recentes
-        transacoes_recentes = TransacaoRisco.objects.filter(
-            data_transacao__gte=janela_tempo
-        ).exclude(ip_address__isnull=True)
-        
-        for trans in transacoes_recentes:
-            # Verificar se este CPF já usou este IP antes (histórico completo)
-            uso_anterior = TransacaoRisco.objects.filter(
-                cpf=trans.cpf,
-                ip_address=trans.ip_address,
-                data_transacao__lt=janela_tempo
-            ).exists()
-            
-            # Se for primeira vez usando este IP
-            if not uso_anterior:
-                # Verificar se já detectado
-                ja_detectado = AtividadeSuspeita.objects.filter(
-                    tipo='ip_novo',
-                    cpf=trans.cpf,
-                    ip=trans.ip_address,
-                    detectado_em__gte=janela_tempo
-                ).exists()
-                
-                if not ja_detectado:
-                    # Contar quantos IPs diferentes este CPF já usou
-                    ips_historicos = TransacaoRisco.objects.filter(
-                        cpf=trans.cpf
-                    ).values_list('ip_address', flat=True).distinct().count()
-                    
-                    AtividadeSuspeita.objects.create(
-                        tipo='ip_novo',
-                        cpf=trans.cpf,
-                        ip=trans.ip_address,
-                        portal=trans.origem.lower(),
-                        detalhes={
-                            'transacao_id': trans.transacao_id,
-                            'valor': str(trans.valor),
-                            'total_ips_historicos': ips_historicos,
-                            'primeira_vez': True
-                        },
-                        severidade=3,  # Média severidade
-                        status='pendente'
-                    )
-                    count += 1
-                    logger.info(f"🆕 IP novo detectado - CPF: {trans.cpf[:3]}*** | IP: {trans.ip_address}")
-        
-        return count
-        
-    except Exception as e:
-        logger.error(f"Erro em detectar_ip_novo: {str(e)}")
-        return 0
+    from .models_config import ConfiguracaoAntifraude
+    
+    contagem = {}
+    if not candidatas:
+        return contagem
+    
+    agora = datetime.now()
+    filtro = Q()
+    for tipo in {atividade.tipo for atividade in candidatas}:
+        _, janela_minutos = _regra_deduplicacao(tipo)
+        filtro |= Q(tipo=tipo, detectado_em__gte=agora - timedelta(minutes=janela_minutos))
+    
+    existentes = AtividadeSuspeita.objects.filter(filtro).filter(
+        Q(cpf__in={atividade.cpf for atividade in candidatas}) |
+        Q(ip__in={atividade.ip for atividade in candidatas})
+    ).values_list('tipo', 'cpf', 'ip')
+    
+    vistos = {_chave_deduplicacao(tipo, cpf, ip) for tipo, cpf, ip in existentes}
+    
+    novas = []
+    for atividade in candidatas:
+        chave = _chave_deduplicacao(atividade.tipo, atividade.cpf, atividade.ip)
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        novas.append(atividade)
+        contagem[atividade.tipo] = contagem.get(atividade.tipo, 0) + 1
+    
+    AtividadeSuspeita.objects.bulk_create(
+        novas,
+        batch_size=ConfiguracaoAntifraude.get_config('DETECTOR_BULK_LOTE', 500)
+    )
+    
+    for atividade in novas:
+        logger.log(*_mensagem_atividade(atividade))
+    
+    return contagem
 
 
-def detectar_horario_suspeito(janela_tempo):
+def _chave_deduplicacao(tipo, cpf, ip):
+    """(tipo, cpf, ip) reduzido aos campos que identificam a atividade do tipo"""
+    campos, _ = _regra_deduplicacao(tipo)
+    valores = {'cpf': cpf, 'ip': ip}
+    return (tipo,) + tuple(valores[campo] for campo in campos)
+
+
+def detectar_ip_novo(de_id, ate_id):
     """
-    Detecta transações em horário suspeito (02:00-05:00 AM)
+    Detecta CPF usando IP nunca visto antes (em toda a base histórica)
+    
+    Set-based: um anti-join (NOT EXISTS) encontra os pares (cpf, ip) do lote
+    sem ocorrência anterior; o total de IPs por CPF vem de uma única consulta.
+    Com VINCULOS_LEITURA_ATIVA, ambos saem de VinculoCpfEntidade (índices).
     """
-    count = 0
-    try:
-        # Buscar transações na janela de tempo
-        transacoes = TransacaoRisco.objects.filter(
-            data_transacao__gte=janela_tempo
+    if getattr(settings, 'VINCULOS_LEITURA_ATIVA', False):
+        return _detectar_ip_novo_por_vinculos(de_id, ate_id)
+    
+    uso_anterior = TransacaoRisco.objects.filter(
+        cpf=OuterRef('cpf'),
+        ip_address=OuterRef('ip_address'),
+        id__lte=de_id
+    )
+    
+    # Primeira transação de cada par (cpf, ip) inédito no lote
+    pares_novos = TransacaoRisco.objects.filter(
+        id__gt=de_id,
+        id__lte=ate_id
+    ).exclude(
+        ip_address__isnull=True
+    ).filter(
+        ~Exists(uso_anterior)
+    ).values('cpf', 'ip_address').annotate(
+        primeiro_id=Min('id')
+    ).order_by()
+    
+    primeiros_ids = [par['primeiro_id'] for par in pares_novos]
+    if not primeiros_ids:
+        return []
+    
+    transacoes = list(TransacaoRisco.objects.filter(id__in=primeiros_ids).order_by('id'))
+    cpfs = {trans.cpf for trans in transacoes}
+    
+    # Quantos IPs diferentes cada CPF já usou
+    ips_historicos = dict(TransacaoRisco.objects.filter(
+        cpf__in=cpfs
+    ).values('cpf').annotate(
+        total=Count('ip_address', distinct=True)
+    ).order_by().values_list('cpf', 'total'))
+    
+    atividades = []
+    for trans in transacoes:
+        atividades.append(AtividadeSuspeita(
+            tipo='ip_novo',
+            cpf=trans.cpf,
+            ip=trans.ip_address,
+            portal=trans.origem.lower(),
+            detalhes={
+                'transacao_id': trans.transacao_id,
+                'valor': str(trans.valor),
+                'total_ips_historicos': ips_historicos.get(trans.cpf, 0),
+                'primeira_vez': True
+            },
+            severidade=3,  # Média severidade
+            status='pendente'
+        ))
+    
+    return atividades
+
+
+def _detectar_ip_novo_por_vinculos(de_id, ate_id):
+    """IP novo = vínculo (cpf, IP) cuja primeira transação está no lote"""
+    primeiros_ids = list(VinculoCpfEntidade.objects.filter(
+        tipo_entidade=VinculoCpfEntidade.TIPO_IP,
+        primeira_transacao_id__gt=de_id,
+        primeira_transacao_id__lte=ate_id
+    ).values_list('primeira_transacao_id', flat=True))
+    
+    if not primeiros_ids:
+        return []
+    
+    transacoes = list(TransacaoRisco.objects.filter(id__in=primeiros_ids).order_by('id'))
+    
+    # Quantos IPs diferentes cada CPF já usou
+    ips_historicos = dict(VinculoCpfEntidade.objects.filter(
+        cpf__in={trans.cpf for trans in transacoes},
+        tipo_entidade=VinculoCpfEntidade.TIPO_IP
+    ).values('cpf').annotate(total=Count('id')).order_by().values_list('cpf', 'total'))
+    
+    return [
+        AtividadeSuspeita(
+            tipo='ip_novo',
+            cpf=trans.cpf,
+            ip=trans.ip_address,
+            portal=trans.origem.lower(),
+            detalhes={
+                'transacao_id': trans.transacao_id,
+                'valor': str(trans.valor),
+                'total_ips_historicos': ips_historicos.get(trans.cpf, 0),
+                'primeira_vez': True
+            },
+            severidade=3,  # Média severidade
+            status='pendente'
         )
-        
-        for trans in transacoes:
-            hora = trans.data_transacao.hour
-            
-            # Horário suspeito: 02:00 - 05:00 AM
-            if 2 <= hora < 5:
-                # Verificar se já detectado
-                ja_detectado = AtividadeSuspeita.objects.filter(
-                    tipo='horario_suspeito',
-                    cpf=trans.cpf,
-                    detectado_em__gte=janela_tempo
-                ).exists()
-                
-                if not ja_detectado:
-                    AtividadeSuspeita.objects.create(
-                        tipo='horario_suspeito',
-                        cpf=trans.cpf,
-                        ip=trans.ip_address or 'desconhecido',
-                        portal=trans.origem.lower(),
-                        detalhes={
-                            'transacao_id': trans.transacao_id,
-                            'horario': trans.data_transacao.strftime('%H:%M:%S'),
-                            'valor': str(trans.valor),
-                            'modalidade': trans.modalidade
-                        },
-                        severidade=2,  # Baixa severidade (pode ser legítimo)
-                        status='pendente'
-                    )
-                    count += 1
-                    logger.info(f"🌙 Horário suspeito - CPF: {trans.cpf[:3]}*** às {trans.data_transacao.strftime('%H:%M')}")
-        
-        return count
-        
-    except Exception as e:
-        logger.error(f"Erro em detectar_horario_suspeito: {str(e)}")
-        return 0
+        for trans in transacoes
+        if trans.ip_address
+    ]
+
+
+# Campos que identificam uma atividade já registrada, e janela da deduplicação (minutos)
+# Detectores declarativos usam a chave de agrupamento (DetectorCompilado.deduplicacao)
+DEDUPLICACAO = {
+    'ip_novo': (('cpf', 'ip'), JANELA_IP_NOVO),
+}
+
+# Log de cada atividade criada: (nível, mensagem)
+MENSAGENS_ATIVIDADE = {
+    'login_multiplo': (logging.WARNING, lambda a: f"⚠️ Login múltiplo detectado - CPF: {a.cpf[:3]}*** em {a.detalhes.get('valor_metrica')} IPs"),
+    'tentativas_falhas': (logging.WARNING, lambda a: f"⚠️ Tentativas falhas detectadas - IP: {a.ip} | Total: {a.detalhes.get('valor_metrica')}"),
+    'ip_novo': (logging.INFO, lambda a: f"🆕 IP novo detectado - CPF: {a.cpf[:3]}*** | IP: {a.ip}"),
+    'horario_suspeito': (logging.INFO, lambda a: f"🌙 Horário suspeito - CPF: {a.cpf[:3]}*** às {a.detalhes.get('horario', '')[:5]}"),
+    'velocidade_transacao': (logging.WARNING, lambda a: f"⚠️ Velocidade anormal - CPF: {a.cpf[:3]}*** | {a.detalhes.get('valor_metrica')} transações em {a.detalhes.get('janela_tempo_minutos')}min"),
+}
 
+# Detectores com lógica própria: (nome, processar_lote, tabela de origem, campo de data, janela em minutos)
+DETECTORES_FIXOS = [
+    ('ip_novo', detectar_ip_novo, TransacaoRisco, 'data_transacao', JANELA_IP_NOVO),
+]
 
-def detectar_velocidade_transacao(janela_tempo):
+
+def obter_detectores():
     """
-    Detecta 10+ transações do mesmo CPF em 5 minutos
+    Detectores do ciclo: fixos + declarativos (detectores.py), no formato de DETECTORES_FIXOS
     """
-    count = 0
+    declarativos = [
+        (nome, detector, detector.modelo, detector.campo_data, detector.janela_minutos)
+        for nome, detector in detectores_compilados().items()
+    ]
+    return DETECTORES_FIXOS + declarativos
+
+
+def obter_detector(nome):
+    """Definição do detector pelo nome (KeyError se não existir ou estiver inativo)"""
+    return {detector[0]: detector for detector in obter_detectores()}[nome]
+
+
+def _regra_deduplicacao(tipo):
+    if tipo in DEDUPLICACAO:
+        return DEDUPLICACAO[tipo]
+    detector = detectores_compilados().get(tipo)
+    if detector is not None:
+        return detector.deduplicacao
+    return ('cpf', 'ip'), JANELA_IP_NOVO
+
+
+def _mensagem_atividade(atividade):
+    if atividade.tipo in MENSAGENS_ATIVIDADE:
+        nivel, mensagem = MENSAGENS_ATIVIDADE[atividade.tipo]
+        return nivel, mensagem(atividade)
+    nivel = logging.WARNING if atividade.severidade >= 4 else logging.INFO
+    return nivel, (
+        f"⚠️ {atividade.tipo} detectado - CPF: {atividade.cpf[:3]}*** | IP: {atividade.ip} | "
+        f"{atividade.detalhes.get('metrica')}: {atividade.detalhes.get('valor_metrica')}"
+    )
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def reavaliar_maxmind_pos(self, decisao_id):
+    """
+    Reavalia decisão POS provisória com o score real do MaxMind
+    Agendada por AnaliseRiscoService quando MAXMIND_POS_ASSINCRONO está ativo
+    """
+    from .models import DecisaoAntifraude
+    from .services import AnaliseRiscoService
+    
     try:
-        # Agrupar por CPF e contar transações
-        cpfs_suspeitos = TransacaoRisco.objects.filter(
-            data_transacao__gte=janela_tempo
-        ).values('cpf').annotate(
-            total_transacoes=Count('id')
-        ).filter(total_transacoes__gte=10)
-        
-        for item in cpfs_suspeitos:
-            cpf = item['cpf']
-            total = item['total_transacoes']
-            
-            # Buscar IPs usados
-            ips_usados = list(TransacaoRisco.objects.filter(
-                cpf=cpf,
-                data_transacao__gte=janela_tempo
-            ).values_list('ip_address', flat=True).distinct())
-            
-            # Calcular valor total
-            valores = TransacaoRisco.objects.filter(
-                cpf=cpf,
-                data_transacao__gte=janela_tempo
-            ).values_list('valor', flat=True)
-            valor_total = sum(valores)
-            
-            # Verificar se já detectado
-            ja_detectado = AtividadeSuspeita.objects.filter(
-                tipo='velocidade_transacao',
-                cpf=cpf,
-                detectado_em__gte=janela_tempo
-            ).exists()
-            
-            if not ja_detectado:
-                AtividadeSuspeita.objects.create(
-                    tipo='velocidade_transacao',
-                    cpf=cpf,
-                    ip=ips_usados[0] if ips_usados else 'desconhecido',
-                    portal='app',
-                    detalhes={
-                        'total_transacoes': total,
-                        'valor_total': str(valor_total),
-                        'ips_usados': ips_usados,
-                        'janela_tempo_minutos': 5
-                    },
-                    severidade=4,  # Alta severidade
-                    status='pendente'
-                )
-                count += 1
-                logger.warning(f"⚠️ Velocidade anormal - CPF: {cpf[:3]}*** | {total} transações em 5min")
-        
-        return count
-        
+        decisao = DecisaoAntifraude.objects.select_related('transacao').get(id=decisao_id)
+    except DecisaoAntifraude.DoesNotExist:
+        logger.error(f"Reavaliação MaxMind: decisão {decisao_id} não encontrada")
+        return {'success': False, 'error': 'decisao_nao_encontrada'}
+    
+    try:
+        nova_decisao = AnaliseRiscoService.reavaliar_maxmind(decisao)
     except Exception as e:
-        logger.error(f"Erro em detectar_velocidade_transacao: {str(e)}")
-        return 0
+        logger.error(f"Erro na reavaliação MaxMind da decisão {decisao_id}: {str(e)}")
+        raise self.retry(exc=e)
+    
+    if nova_decisao:
+        logger.warning(
+            f"⚠️ Reavaliação MaxMind enviou transação para revisão - "
+            f"{decisao.transacao.transacao_id} | Score: {decisao.score_risco} → {nova_decisao.score_risco}"
+        )
+    
+    return {
+        'success': True,
+        'decisao_id': decisao_id,
+        'nova_decisao_id': nova_decisao.id if nova_decisao else None
+    }
 
 
 @shared_task
+def processar_sessao_3ds(sessao_id):
+    """
+    Faz as chamadas ao gateway 3DS (elegibilidade + início da autenticação)
+    fora do worker gunicorn. Agendada pelo endpoint analyze.
+    Sem retry: o cliente já está esperando e o gateway tem timeout próprio.
+    """
+    from .services_3ds import Auth3DSService
+    
+    sessao = Auth3DSService().processar_sessao(sessao_id)
+    if sessao is None:
+        return {'success': False, 'error': 'sessao_nao_encontrada'}
+    
+    return {'success': True, 'sessao_id': sessao_id, 'status': sessao['status']}
+
+
+@shared_task
+@tarefa_unica()
 def bloquear_automatico_critico():
     """
     Task que bloqueia automaticamente IPs/CPFs com atividades críticas (severidade 5)
@@ -368,53 +541,17 @@ def bloquear_automatico_critico():
     logger.info("🔒 Iniciando bloqueio automático de atividades críticas...")
     
     try:
-        # Buscar atividades pendentes com severidade crítica
-        atividades_criticas = AtividadeSuspeita.objects.filter(
-            status='pendente',
-            severidade=5,
-            detectado_em__gte=datetime.now() - timedelta(minutes=15)
-        )
-        
-        bloqueios_criados = 0
+        from .services_bloqueio import BloqueioService
         
-        for atividade in atividades_criticas:
-            # Verificar se IP já está bloqueado
-            ip_bloqueado = BloqueioSeguranca.objects.filter(
-                tipo='ip',
-                valor=atividade.ip,
-                ativo=True
-            ).exists()
-            
-            if not ip_bloqueado:
-                # Criar bloqueio automático de IP
-                bloqueio = BloqueioSeguranca.objects.create(
-                    tipo='ip',
-                    valor=atividade.ip,
-                    motivo=f"Bloqueio automático - {dict(atividade.TIPO_CHOICES).get(atividade.tipo)}",
-                    bloqueado_por='sistema_auto',
-                    portal=atividade.portal,
-                    detalhes={
-                        'atividade_id': atividade.id,
-                        'severidade': atividade.severidade,
-                        'detalhes_atividade': atividade.detalhes
-                    },
-                    ativo=True
-                )
-                
-                # Atualizar atividade
-                atividade.status = 'bloqueado'
-                atividade.bloqueio_relacionado = bloqueio
-                atividade.acao_tomada = 'bloqueio_automatico_ip'
-                atividade.save()
-                
-                bloqueios_criados += 1
-                logger.warning(f"🚫 Bloqueio automático criado - IP: {atividade.ip} | Atividade: {atividade.id}")
+        resultado = BloqueioService.bloquear_atividades_criticas(minutos=15)
+        bloqueios_criados = resultado['bloqueios_criados'] + resultado['bloqueios_reativados']
         
-        logger.info(f"✅ Bloqueio automático concluído: {bloqueios_criados} bloqueios criados")
+        logger.info(f"✅ Bloqueio automático concluído: {bloqueios_criados} bloqueios criados | {resultado}")
         
         return {
             'success': True,
-            'bloqueios_criados': bloqueios_criados
+            'bloqueios_criados': bloqueios_criados,
+            **resultado
         }
         
     except Exception as e:
@@ -423,3 +560,60 @@ def bloquear_automatico_critico():
             'success': False,
             'error': str(e)
         }
+
+
+@shared_task
+@tarefa_unica()
+def podar_rollups():
+    """
+    Remove rollups antigos (RollupTransacao)
+    Executa a cada hora: por minuto ficam ROLLUP_RETENCAO_MINUTO_HORAS (padrão 48),
+    por hora ficam ROLLUP_RETENCAO_HORA_DIAS (padrão 90)
+    """
+    from .models_config import ConfiguracaoAntifraude
+    from .services_rollup import RollupService
+    
+    try:
+        removidas = RollupService.podar(
+            ConfiguracaoAntifraude.get_config('ROLLUP_RETENCAO_MINUTO_HORAS', 48),
+            ConfiguracaoAntifraude.get_config('ROLLUP_RETENCAO_HORA_DIAS', 90)
+        )
+        logger.info(f"🧹 Rollups podados: {removidas}")
+        return {'success': True, 'removidas': removidas}
+    except Exception as e:
+        logger.error(f"❌ Erro ao podar rollups: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+@tarefa_unica()
+def agregar_decisoes_hora():
+    """
+    Mantém os agregados por hora do dashboard (AgregadoDecisaoHora)
+    Executa a cada 5 minutos: recalcula a hora atual, a anterior e horas
+    faltantes, e renova o cache do dashboard para DASHBOARD_DIAS_AQUECIDOS
+    """
+    from .models_config import ConfiguracaoAntifraude
+    from .services_dashboard import DashboardService
+    
+    try:
+        horas = DashboardService.agregar_pendentes()
+        
+        aquecidos = ConfiguracaoAntifraude.get_config('DASHBOARD_DIAS_AQUECIDOS', [1, 7, 30])
+        for dias in aquecidos:
+            DashboardService.atualizar_cache(dias)
+        
+        logger.info(f"📊 Agregados de decisões atualizados: {len(horas)} horas | dashboard: {aquecidos}")
+        return {'success': True, 'horas': [hora.isoformat() for hora in horas], 'dashboard_dias': aquecidos}
+    except Exception as e:
+        logger.error(f"❌ Erro ao agregar decisões: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def atualizar_dashboard(dias):
+    """Recalcula o cache do dashboard para `dias` (agendada por DashboardService.metricas)"""
+    from .services_dashboard import DashboardService
+    
+    DashboardService.atualizar_cache(dias)
+    return {'success': True, 'dias': dias}
@@ -0,0 +1,173 @@
+"""
+Testes dos detectores declarativos (detectores.py)
+
+Cada definição de DEFINICOES_PADRAO compila e, avaliada sobre um lote,
+reproduz o resultado das consultas dos detectores antigos (uma por tipo,
+janela now - N minutos).
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from unittest import mock
+
+from django.db.models import Count
+from django.test import TestCase
+
+from .detectores import DEFINICOES_PADRAO, DetectorCompilado
+from .models import AtividadeSuspeita, ConfiguracaoAntifraude, BloqueioSeguranca, DecisaoAntifraude, TransacaoRisco
+from .services_bloqueio import BloqueioService
+
+
+class DetectoresPadraoTest(TestCase):
+
+    def setUp(self):
+        # Às 03:10 para o horário suspeito (02h-05h) ter o que detectar
+        self.agora = datetime.now().replace(hour=3, minute=10, second=0, microsecond=0)
+        self.sequencia = 0
+
+        # login_multiplo: 4 IPs em 6 minutos (dispara) e 3 IPs espalhados em 16 minutos (não dispara)
+        for minutos, ip in ((6, '10.0.0.1'), (4, '10.0.0.2'), (2, '10.0.0.3'), (0, '10.0.0.4')):
+            self._transacao('11111111111', ip, minutos)
+        for minutos, ip in ((16, '10.1.0.1'), (8, '10.1.0.2'), (0, '10.1.0.3')):
+            self._transacao('22222222222', ip, minutos)
+
+        # velocidade_transacao: 11 transações em 4 minutos (dispara) e 9 (não dispara)
+        for i in range(11):
+            self._transacao('33333333333', '10.2.0.1', i * 0.4)
+        for i in range(9):
+            self._transacao('44444444444', '10.3.0.1', i * 0.4)
+
+        # tentativas_falhas: 6 reprovadas no mesmo IP (dispara) e 4 em outro (não dispara)
+        for i in range(6):
+            self._transacao(f'5555555555{i}', '10.4.0.1', 1, decisao='REPROVADO')
+        for i in range(4):
+            self._transacao(f'6666666666{i}', '10.5.0.1', 1, decisao='REPROVADO')
+        self._transacao('77777777777', '10.5.0.1', 1, decisao='APROVADO')
+
+        self.ultimo_id = max(
+            TransacaoRisco.objects.order_by('-id').values_list('id', flat=True).first(),
+            DecisaoAntifraude.objects.order_by('-id').values_list('id', flat=True).first()
+        )
+
+    def _transacao(self, cpf, ip, minutos_atras, decisao=None):
+        self.sequencia += 1
+        transacao = TransacaoRisco.objects.create(
+            transacao_id=f'T{self.sequencia}',
+            origem='APP',
+            cpf=cpf,
+            valor=Decimal('10.00'),
+            modalidade='PIX',
+            ip_address=ip,
+            data_transacao=self.agora - timedelta(minutes=minutos_atras)
+        )
+        if decisao:
+            DecisaoAntifraude.objects.create(
+                transacao=transacao, score_risco=90, decisao=decisao,
+                regras_acionadas=[], motivo='teste', tempo_analise_ms=1
+            )
+        return transacao
+
+    def _antigo(self, nome):
+        """{chave: métrica} pela consulta do detector antigo, avaliado em self.agora"""
+        if nome == 'login_multiplo':
+            return dict(TransacaoRisco.objects.filter(
+                data_transacao__gte=self.agora - timedelta(minutes=10), data_transacao__lte=self.agora
+            ).values('cpf').annotate(total=Count('ip_address', distinct=True)).filter(
+                total__gte=3
+            ).order_by().values_list('cpf', 'total'))
+
+        if nome == 'tentativas_falhas':
+            # Decisões gravadas agora: a janela do antigo (created_at) contém todas
+            return dict(DecisaoAntifraude.objects.filter(
+                decisao='REPROVADO', created_at__gte=datetime.now() - timedelta(minutes=5)
+            ).values('transacao__ip_address').annotate(total=Count('id')).filter(
+                total__gte=5
+            ).order_by().values_list('transacao__ip_address', 'total'))
+
+        recentes = TransacaoRisco.objects.filter(
+            data_transacao__gte=self.agora - timedelta(minutes=5), data_transacao__lte=self.agora
+        )
+        if nome == 'horario_suspeito':
+            recentes = recentes.filter(data_transacao__hour__gte=2, data_transacao__hour__lt=5)
+            limite = 1
+        else:
+            limite = 10
+        return dict(recentes.values('cpf').annotate(total=Count('id')).filter(
+            total__gte=limite
+        ).order_by().values_list('cpf', 'total'))
+
+    def test_definicoes_padrao_compilam(self):
+        for definicao in DEFINICOES_PADRAO:
+            with self.subTest(detector=definicao['nome']):
+                detector = DetectorCompilado(definicao)
+                self.assertEqual(detector.nome, definicao['nome'])
+                self.assertEqual(detector.janela_minutos, definicao['janela_minutos'])
+                self.assertEqual(detector.limite, Decimal(str(definicao['limite'])))
+
+    def test_consulta_agrupada_equivale_ao_detector_antigo(self):
+        for definicao in DEFINICOES_PADRAO:
+            with self.subTest(detector=definicao['nome']):
+                detector = DetectorCompilado(definicao)
+                grupos = detector.consulta(0, self.ultimo_id)
+                obtido = {grupo[detector.chave]: grupo['valor_metrica'] for grupo in grupos}
+
+                esperado = self._antigo(definicao['nome'])
+                self.assertTrue(esperado, 'cenário sem detecção esperada')
+                self.assertEqual(obtido, esperado)
+
+    def test_grupos_acima_do_maximo_sao_paginados(self):
+        detector = DetectorCompilado(next(d for d in DEFINICOES_PADRAO if d['nome'] == 'tentativas_falhas'))
+        self._transacao('99999999999', '10.7.0.1', 1, decisao='REPROVADO')
+        for i in range(5):
+            self._transacao(f'9999999999{i}', '10.7.0.2', 1, decisao='REPROVADO')
+        ultimo_id = DecisaoAntifraude.objects.order_by('-id').values_list('id', flat=True).first()
+
+        with mock.patch.object(ConfiguracaoAntifraude, 'get_config', return_value=1):
+            grupos = detector.consulta(0, ultimo_id)
+
+        self.assertEqual({g['transacao__ip_address'] for g in grupos}, {'10.4.0.1', '10.7.0.2'})
+
+    def test_janela_nao_soma_linhas_de_duas_janelas(self):
+        detector = DetectorCompilado(next(d for d in DEFINICOES_PADRAO if d['nome'] == 'login_multiplo'))
+        cpfs = {atividade.cpf for atividade in detector(0, self.ultimo_id)}
+        self.assertIn('11111111111', cpfs)
+        self.assertNotIn('22222222222', cpfs)
+
+    def test_reprovacao_posterior_entra_no_detector(self):
+        detector = DetectorCompilado(next(d for d in DEFINICOES_PADRAO if d['nome'] == 'tentativas_falhas'))
+        desde = datetime.now()
+        decisoes = [
+            DecisaoAntifraude.objects.create(
+                transacao=self._transacao(f'8888888888{i}', '10.6.0.1', 0), score_risco=50,
+                decisao='PENDENTE', regras_acionadas=[], motivo='teste', tempo_analise_ms=1
+            )
+            for i in range(5)
+        ]
+        ultimo_id = decisoes[-1].id
+        self.assertNotIn('10.6.0.1', {a.ip for a in detector(self.ultimo_id, ultimo_id)})
+
+        # Validação 3DS/revisão reprova depois de criada
+        for decisao in decisoes:
+            decisao.decisao = 'REPROVADO'
+            decisao.save()
+        DecisaoAntifraude.objects.filter(id__in=[d.id for d in decisoes]).update(
+            created_at=desde - timedelta(seconds=30)
+        )
+
+        atividades = detector.alteradas(desde - timedelta(seconds=1), datetime.now(), ultimo_id, margem_segundos=5)
+        self.assertIn('10.6.0.1', {a.ip for a in atividades})
+
+
+class BloqueioAutomaticoTest(TestCase):
+
+    def test_motivo_de_detector_declarativo_usa_o_nome(self):
+        AtividadeSuspeita.objects.create(
+            tipo='rajada_bin', cpf='12345678901', ip='10.9.0.1', portal='app',
+            detalhes={'detector': 'rajada_bin'}, severidade=5
+        )
+
+        resultado = BloqueioService.bloquear_atividades_criticas()
+
+        self.assertEqual(resultado['bloqueios_criados'], 1)
+        bloqueio = BloqueioSeguranca.objects.get(tipo='ip', valor='10.9.0.1')
+        self.assertEqual(bloqueio.motivo, 'Bloqueio automático - rajada_bin')
@@ -2,13 +2,14 @@
 URLs do Sistema Antifraude
 """
 from django.urls import path
-from . import views, views_revisao, views_teste, views_api, views_seguranca
+from . import views, views_revisao, views_teste, views_api, views_seguranca, views_exportacao
 
 urlpatterns = [
     # API REST Pública (Semana 13)
     path('analyze/', views_api.analyze, name='antifraude_analyze'),
     path('decision/<str:transacao_id>/', views_api.decision, name='antifraude_decision'),
     path('validate-3ds/', views_api.validate_3ds, name='antifraude_validate_3ds'),
+    path('3ds/sessao/<str:sessao_id>/', views_api.sessao_3ds, name='antifraude_sessao_3ds'),
     path('health/', views_api.health, name='antifraude_health'),
 
     # Análise automática (legado - manter compatibilidade)
@@ -16,6 +17,7 @@ urlpatterns = [
     path('decisao/<str:transacao_id>/', views.consultar_decisao, name='antifraude_decisao'),
     path('historico/<int:cliente_id>/', views.historico_cliente, name='antifraude_historico'),
     path('dashboard/', views.dashboard_metricas, name='antifraude_dashboard'),
+    path('exportar/decisoes/', views_exportacao.exportar_decisoes, name='antifraude_exportar_decisoes'),
     
     # Revisão manual
     path('revisao/pendentes/', views_revisao.listar_pendentes, name='revisao_pendentes'),
@@ -34,4 +36,5 @@ urlpatterns = [
     path('block/', views_seguranca.create_block, name='seguranca_create_block'),
     path('investigate/', views_seguranca.investigate_activity, name='seguranca_investigate'),
     path('blocks/', views_seguranca.list_blocks, name='seguranca_list_blocks'),
+    path('auth-event/', views_seguranca.auth_event, name='seguranca_auth_event'),
 ]
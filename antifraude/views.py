@@ -143,33 +143,18 @@ def historico_cliente(request, cliente_id):
     Histórico de transações e decisões de um cliente
     
     GET /api/antifraude/historico/<cliente_id>/?limit=10
-    """
-    limit = int(request.GET.get('limit', 10))
     
-    transacoes = TransacaoRisco.objects.filter(
-        cliente_id=cliente_id
-    ).select_related('decisoes').order_by('-data_transacao')[:limit]
+    Decisão mais recente de cada transação numa única consulta, com cache
+    curto por cliente (ver HistoricoClienteService); limit até 100.
+    """
+    from .services_historico import HistoricoClienteService
     
-    resultado = []
-    for transacao in transacoes:
-        try:
-            decisao = transacao.decisoes.latest('created_at')
-            resultado.append({
-                'transacao_id': transacao.transacao_id,
-                'origem': transacao.origem,
-                'valor': str(transacao.valor),
-                'data_transacao': transacao.data_transacao.isoformat(),
-                'decisao': decisao.decisao,
-                'score_risco': decisao.score_risco
-            })
-        except DecisaoAntifraude.DoesNotExist:
-            continue
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
     
-    return Response({
-        'cliente_id': cliente_id,
-        'total': len(resultado),
-        'transacoes': resultado
-    })
+    return Response(HistoricoClienteService.consultar(cliente_id, limit))
 
 
 @api_view(['GET'])
@@ -217,142 +202,20 @@ def dashboard_metricas(request):
             "automaticas": 30,
             "manuais": 15
         },
-        "regras": [
+        "regras_top": [
             {"nome": "Velocidade Alta", "acionamentos": 25},
             {"nome": "IP Suspeito", "acionamentos": 18}
-        ]
+        ],
+        "gerado_em": "2025-10-16T20:00:00"
     }
-    """
-    from datetime import datetime, timedelta
-    from django.db.models import Avg, Count, Min, Max, Q
-    from .models import BlacklistAntifraude, WhitelistAntifraude
-    import json
-    
-    # Parâmetros
-    dias = int(request.GET.get('dias', 7))
-    data_fim = datetime.now()
-    data_inicio = data_fim - timedelta(days=dias)
-    
-    # Filtro base
-    filtro_periodo = Q(created_at__gte=data_inicio, created_at__lte=data_fim)
-    
-    # 1. Transações
-    transacoes_total = TransacaoRisco.objects.filter(
-        data_transacao__gte=data_inicio,
-        data_transacao__lte=data_fim
-    ).count()
-    
-    transacoes_por_origem = dict(
-        TransacaoRisco.objects.filter(
-            data_transacao__gte=data_inicio,
-            data_transacao__lte=data_fim
-        ).values('origem').annotate(total=Count('id')).values_list('origem', 'total')
-    )
-    
-    # 2. Decisões
-    decisoes = DecisaoAntifraude.objects.filter(filtro_periodo)
-    
-    decisoes_stats = decisoes.values('decisao').annotate(total=Count('id'))
-    decisoes_dict = {item['decisao']: item['total'] for item in decisoes_stats}
-    
-    aprovadas = decisoes_dict.get('APROVADO', 0)
-    reprovadas = decisoes_dict.get('REPROVADO', 0)
-    revisao = decisoes_dict.get('REVISAO', 0)
-    total_decisoes = aprovadas + reprovadas + revisao
-    
-    taxa_aprovacao = (aprovadas / total_decisoes * 100) if total_decisoes > 0 else 0
-    
-    # 3. Scores
-    scores_stats = decisoes.aggregate(
-        medio=Avg('score_risco'),
-        minimo=Min('score_risco'),
-        maximo=Max('score_risco')
-    )
-    
-    # 4. Performance
-    tempo_stats = decisoes.aggregate(
-        medio=Avg('tempo_analise_ms')
-    )
     
-    # P95 (aproximado - pegar o percentil 95)
-    tempos_ordenados = list(decisoes.order_by('tempo_analise_ms').values_list('tempo_analise_ms', flat=True))
-    p95_index = int(len(tempos_ordenados) * 0.95) if tempos_ordenados else 0
-    tempo_p95 = tempos_ordenados[p95_index] if p95_index < len(tempos_ordenados) else 0
-    
-    # 5. Blacklist
-    blacklist_total = BlacklistAntifraude.objects.count()
-    blacklist_ativos = BlacklistAntifraude.objects.filter(is_active=True).count()
-    
-    # Contar bloqueios que aconteceram no período
-    bloqueios_periodo = DecisaoAntifraude.objects.filter(
-        filtro_periodo,
-        decisao='REPROVADO',
-        regras_acionadas__contains='BLACKLIST'
-    ).count()
-    
-    # 6. Whitelist
-    whitelist_total = WhitelistAntifraude.objects.filter(is_active=True).count()
-    whitelist_stats = WhitelistAntifraude.objects.filter(is_active=True).values('origem').annotate(total=Count('id'))
-    whitelist_dict = {item['origem']: item['total'] for item in whitelist_stats}
-    
-    # 7. Top regras acionadas
-    regras_top = []
-    todas_decisoes = decisoes.values_list('regras_acionadas', flat=True)
-    regras_count = {}
-    
-    for regras_json in todas_decisoes:
-        if isinstance(regras_json, str):
-            try:
-                regras_json = json.loads(regras_json)
-            except:
-                continue
-        
-        if isinstance(regras_json, list):
-            for regra in regras_json:
-                if isinstance(regra, dict):
-                    nome = regra.get('nome', 'Desconhecida')
-                    regras_count[nome] = regras_count.get(nome, 0) + 1
+    Servido dos agregados por hora (AgregadoDecisaoHora) e do cache por `dias`;
+    passado DASHBOARD_ATUALIZACAO_SEGUNDOS, o cache é recalculado em background.
+    p95 estimado pelo histograma de latência (erro de até 5%).
+    """
+    from .services_dashboard import DashboardService
     
-    # Top 5 regras
-    regras_top = [{'nome': nome, 'acionamentos': count} 
-                  for nome, count in sorted(regras_count.items(), key=lambda x: x[1], reverse=True)[:5]]
+    # Parâmetros (limitado a um ano: uma entrada de cache por valor)
+    dias = max(1, min(int(request.GET.get('dias', 7)), 365))
     
-    return Response({
-        'periodo': {
-            'dias': dias,
-            'data_inicio': data_inicio.strftime('%Y-%m-%d'),
-            'data_fim': data_fim.strftime('%Y-%m-%d')
-        },
-        'transacoes': {
-            'total': transacoes_total,
-            'por_origem': transacoes_por_origem
-        },
-        'decisoes': {
-            'aprovadas': aprovadas,
-            'reprovadas': reprovadas,
-            'revisao': revisao,
-            'total': total_decisoes,
-            'taxa_aprovacao': round(taxa_aprovacao, 2)
-        },
-        'scores': {
-            'medio': round(scores_stats['medio'] or 0, 2),
-            'minimo': scores_stats['minimo'] or 0,
-            'maximo': scores_stats['maximo'] or 0
-        },
-        'performance': {
-            'tempo_medio_ms': int(tempo_stats['medio'] or 0),
-            'tempo_p95_ms': tempo_p95
-        },
-        'blacklist': {
-            'total': blacklist_total,
-            'ativos': blacklist_ativos,
-            'bloqueios_periodo': bloqueios_periodo
-        },
-        'whitelist': {
-            'total': whitelist_total,
-            'automaticas': whitelist_dict.get('AUTO', 0),
-            'manuais': whitelist_dict.get('MANUAL', 0),
-            'vip': whitelist_dict.get('CLIENTE_VIP', 0)
-        },
-        'regras_top': regras_top
-    })
+    return Response(DashboardService.metricas(dias))
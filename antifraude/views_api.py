@@ -50,6 +50,7 @@ def analyze(request):
         "device_fingerprint": "abc123",  # Opcional
         "user_agent": "Mozilla/5.0...",  # Opcional
         "requer_3ds": false,  # Forçar 3DS (opcional)
+        "callback_url_3ds": "https://...",  # Opcional, recebe resultado da sessão 3DS
         "dados_cliente": {  # Opcional, para 3DS
             "nome": "João Silva",
             "email": "joao@email.com",
@@ -71,10 +72,24 @@ def analyze(request):
         "requer_3ds": false,
         "dados_3ds": null  # Presente se requer_3ds=true
     }
+    
+    Com THREEDS_ASSINCRONO (padrão), dados_3ds vem com a sessão pendente
+    ({"sessao_id", "status": "PENDENTE", "consulta_url", "motivo"}) e o
+    gateway é chamado em background: consultar GET /api/antifraude/3ds/sessao/<id>/
+    ou aguardar POST em callback_url_3ds.
     """
     inicio = time.time()
     dados = request.data
     
+    # Callback 3DS: só https para hosts de THREEDS_CALLBACK_HOSTS com endereço público
+    if dados.get('callback_url_3ds'):
+        erro_callback = Auth3DSService.validar_callback_url(dados.get('callback_url_3ds'))
+        if erro_callback:
+            return Response({
+                'sucesso': False,
+                'mensagem': erro_callback
+            }, status=status.HTTP_400_BAD_REQUEST)
+    
     # Normalizar dados
     origem = dados.get('origem')
     dados_normalizados = ColetaDadosService.normalizar_dados(dados, origem)
@@ -127,42 +142,57 @@ def analyze(request):
                 if deve_usar or requer_3ds:
                     requer_3ds = True
                     
-                    # Verificar elegibilidade
-                    elegibilidade = auth_3ds.verificar_elegibilidade(bin_cartao, transacao.valor)
+                    dados_cliente_3ds = dados.get('dados_cliente', {})
+                    if not dados_cliente_3ds:
+                        dados_cliente_3ds = {
+                            'cpf': transacao.cpf,
+                            'ip_address': transacao.ip_address,
+                            'user_agent': transacao.user_agent
+                        }
                     
-                    if elegibilidade['elegivel']:
-                        # Iniciar autenticação 3DS
-                        dados_cliente_3ds = dados.get('dados_cliente', {})
-                        if not dados_cliente_3ds:
-                            dados_cliente_3ds = {
-                                'cpf': transacao.cpf,
-                                'ip_address': transacao.ip_address,
-                                'user_agent': transacao.user_agent
-                            }
-                        
-                        auth_resultado = auth_3ds.iniciar_autenticacao(
-                            transacao_id=transacao.transacao_id,
-                            bin_cartao=bin_cartao,
-                            valor=transacao.valor,
-                            dados_cliente=dados_cliente_3ds
+                    elegibilidade = auth_3ds.elegibilidade_local(bin_cartao)
+                    
+                    if elegibilidade is not None and not elegibilidade['elegivel']:
+                        # Cartão sabidamente não elegível, continuar sem 3DS
+                        requer_3ds = False
+                    elif auth_3ds.assincrono:
+                        # Gateway fica com o worker Celery; cliente consulta a sessão ou recebe callback
+                        dados_3ds = _iniciar_sessao_3ds(
+                            auth_3ds, decisao, motivo_3ds, dados_cliente_3ds, dados.get('callback_url_3ds')
                         )
+                        if dados_3ds['status'] in ('NAO_ELEGIVEL', 'ERRO'):
+                            # Processada no request (broker fora): decisão original restaurada, sem 3DS
+                            requer_3ds = False
+                            dados_3ds = None
+                    else:
+                        # Verificar elegibilidade
+                        elegibilidade = auth_3ds.verificar_elegibilidade(bin_cartao, transacao.valor)
                         
-                        if auth_resultado['sucesso']:
-                            dados_3ds = {
-                                'auth_id': auth_resultado['auth_id'],
-                                'redirect_url': auth_resultado['redirect_url'],
-                                'metodo': auth_resultado['metodo'],
-                                'expiracao': auth_resultado['expiracao'],
-                                'motivo': motivo_3ds
-                            }
+                        if elegibilidade['elegivel']:
+                            # Iniciar autenticação 3DS
+                            auth_resultado = auth_3ds.iniciar_autenticacao(
+                                transacao_id=transacao.transacao_id,
+                                bin_cartao=bin_cartao,
+                                valor=transacao.valor,
+                                dados_cliente=dados_cliente_3ds
+                            )
                             
-                            # Atualizar decisão para REQUER_3DS
-                            decisao.decisao = 'REQUER_3DS'
-                            decisao.motivo = f"{decisao.motivo} + 3DS obrigatório ({motivo_3ds})"
-                            decisao.save()
-                    else:
-                        # Cartão não elegível, continuar sem 3DS
-                        requer_3ds = False
+                            if auth_resultado['sucesso']:
+                                dados_3ds = {
+                                    'auth_id': auth_resultado['auth_id'],
+                                    'redirect_url': auth_resultado['redirect_url'],
+                                    'metodo': auth_resultado['metodo'],
+                                    'expiracao': auth_resultado['expiracao'],
+                                    'motivo': motivo_3ds
+                                }
+                                
+                                # Atualizar decisão para REQUER_3DS
+                                decisao.decisao = 'REQUER_3DS'
+                                decisao.motivo = f"{decisao.motivo} + 3DS obrigatório ({motivo_3ds})"
+                                decisao.save()
+                        else:
+                            # Cartão não elegível, continuar sem 3DS
+                            requer_3ds = False
     
     tempo_total = int((time.time() - inicio) * 1000)
     
@@ -179,6 +209,90 @@ def analyze(request):
     })
 
 
+def _iniciar_sessao_3ds(auth_3ds, decisao, motivo_3ds, dados_cliente, callback_url):
+    """
+    Marca decisão como REQUER_3DS, cria sessão pendente e agenda o processamento
+    
+    Returns:
+        dict: dados_3ds da resposta do analyze (sessão pendente)
+    """
+    decisao_original = decisao.decisao
+    motivo_original = decisao.motivo
+    
+    decisao.decisao = 'REQUER_3DS'
+    decisao.motivo = f"{decisao.motivo} + 3DS obrigatório ({motivo_3ds})"
+    decisao.save()
+    
+    sessao = Auth3DSService.criar_sessao(
+        decisao,
+        motivo_3ds,
+        decisao_original,
+        motivo_original,
+        dados_cliente=dados_cliente,
+        callback_url=callback_url
+    )
+    
+    try:
+        from .tasks import processar_sessao_3ds
+        processar_sessao_3ds.delay(sessao['sessao_id'])
+    except Exception:
+        # Broker indisponível: processa no próprio request (comportamento anterior)
+        sessao = auth_3ds.processar_sessao(sessao['sessao_id']) or sessao
+        if sessao['status'] != 'PRONTA':
+            decisao.refresh_from_db()
+    
+    return {
+        'sessao_id': sessao['sessao_id'],
+        'status': sessao['status'],
+        'consulta_url': f"/api/antifraude/3ds/sessao/{sessao['sessao_id']}/",
+        'motivo': motivo_3ds,
+        **(sessao['dados_3ds'] or {})
+    }
+
+
+@api_view(['GET'])
+@require_oauth_token
+@handle_api_errors
+def sessao_3ds(request, sessao_id):
+    """
+    Consulta sessão 3DS criada pelo analyze (polling)
+    
+    GET /api/antifraude/3ds/sessao/<sessao_id>/
+    
+    Headers:
+        Authorization: Bearer <oauth_token>
+    
+    Returns:
+    {
+        "sucesso": true,
+        "sessao_id": "3DS-...",
+        "status": "PENDENTE",  # PENDENTE, PRONTA, NAO_ELEGIVEL, ERRO
+        "transacao_id": "TRX-123",
+        "decisao": "REQUER_3DS",  # Decisão original se NAO_ELEGIVEL/ERRO
+        "dados_3ds": {  # Presente quando PRONTA
+            "auth_id": "3DS-AUTH-123",
+            "redirect_url": "https://...",
+            "metodo": "BROWSER",
+            "expiracao": "...",
+            "motivo": "Score de risco alto (75)"
+        },
+        "mensagem": "..."
+    }
+    """
+    sessao = Auth3DSService.obter_sessao(sessao_id)
+    
+    if not sessao:
+        return Response({
+            'sucesso': False,
+            'mensagem': 'Sessão 3DS não encontrada ou expirada'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'sucesso': True,
+        **Auth3DSService.sessao_publica(sessao)
+    })
+
+
 @api_view(['GET'])
 @require_oauth_token
 @handle_api_errors
@@ -338,10 +452,14 @@ def health(request):
             "3ds": true,
             "redis": true
         },
+        "warmup": {"pronto": true, "origem": "gunicorn", "duracao_ms": 840, "etapas": {...}},
+        "tarefas": {"bloquear_automatico_critico": {"executadas": 12, "puladas": 1, ..., "titular": null}},
         "timestamp": "2025-10-16T20:00:00"
     }
     """
     from .services_maxmind import MaxMindService
+    from .warmup import ESTADO as estado_warmup
+    from .lease import metricas as metricas_lease
     from django.core.cache import cache
     
     servicos = {}
@@ -366,5 +484,10 @@ def health(request):
     return Response({
         'status': status_geral,
         'servicos': servicos,
+        'warmup': estado_warmup,
+        'tarefas': {
+            nome: metricas_lease(nome)
+            for nome in ('detectar_atividades_suspeitas', 'bloquear_automatico_critico')
+        },
         'timestamp': datetime.now().isoformat()
     })
@@ -0,0 +1,93 @@
+"""
+Exportação de decisões em streaming (NDJSON/CSV, opcionalmente gzip)
+"""
+from datetime import datetime, timedelta
+import logging
+
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework import status
+from wallclub_core.oauth.decorators import require_oauth_token
+from wallclub_core.decorators.api_decorators import handle_api_errors
+
+from .models_config import ConfiguracaoAntifraude
+from .services_exportacao import ExportacaoService
+
+logger = logging.getLogger('antifraude.exportacao')
+
+# Teto do período via HTTP: o stream ocupa um worker gunicorn síncrono (2 workers,
+# timeout 120s); EXPORTACAO_MAX_DIAS só reduz
+MAX_DIAS_HTTP = 7
+
+
+@api_view(['GET'])
+@require_oauth_token
+@handle_api_errors
+def exportar_decisoes(request):
+    """
+    Decisões com a transação e as regras acionadas (achatadas), em streaming
+
+    GET /api/antifraude/exportar/decisoes/?data_inicio=2025-10-01&data_fim=2025-10-31&formato=csv&gzip=1
+
+    Params:
+        data_inicio: AAAA-MM-DD
+        data_fim: AAAA-MM-DD, inclusivo (padrão: hoje)
+        formato: ndjson (padrão) ou csv
+        gzip: 1 para compactar
+        decisao: APROVADO, REPROVADO, REVISAO ou PENDENTE (opcional)
+        origem: POS, APP ou WEB (opcional)
+
+    Período limitado a EXPORTACAO_MAX_DIAS (padrão e máximo: 7 dias); para
+    mais, usar o comando exportar_decisoes.
+    """
+    formato = request.GET.get('formato', 'ndjson')
+    compactar = request.GET.get('gzip') in ('1', 'true', 'True')
+
+    if not request.GET.get('data_inicio'):
+        return Response({
+            'sucesso': False,
+            'mensagem': 'Parâmetro data_inicio é obrigatório'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        inicio = datetime.strptime(request.GET['data_inicio'], '%Y-%m-%d')
+        data_fim = request.GET.get('data_fim')
+        fim = datetime.strptime(data_fim, '%Y-%m-%d') if data_fim else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return Response({
+            'sucesso': False,
+            'mensagem': 'Datas devem estar no formato AAAA-MM-DD'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    fim += timedelta(days=1)
+
+    max_dias = min(ConfiguracaoAntifraude.get_config('EXPORTACAO_MAX_DIAS', MAX_DIAS_HTTP), MAX_DIAS_HTTP)
+    if fim <= inicio or (fim - inicio).days > max_dias:
+        return Response({
+            'sucesso': False,
+            'mensagem': (
+                f'Período deve ter de 1 a {max_dias} dias; para períodos maiores use '
+                f'"python manage.py exportar_decisoes --inicio AAAA-MM-DD --fim AAAA-MM-DD"'
+            )
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if formato not in ExportacaoService.FORMATOS:
+        return Response({
+            'sucesso': False,
+            'mensagem': f"Formato deve ser {' ou '.join(ExportacaoService.FORMATOS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    decisoes = ExportacaoService.filtrar(
+        inicio, fim,
+        decisao=request.GET.get('decisao'),
+        origem=request.GET.get('origem')
+    )
+    logger.info(f"Exportação de decisões {inicio:%Y-%m-%d} a {fim:%Y-%m-%d} ({formato}, gzip={compactar})")
+
+    resposta = StreamingHttpResponse(
+        ExportacaoService.exportar(decisoes, formato, compactar),
+        content_type=ExportacaoService.tipo_conteudo(formato, compactar)
+    )
+    nome = ExportacaoService.nome_arquivo(inicio, fim - timedelta(days=1), formato, compactar)
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return resposta
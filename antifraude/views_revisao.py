@@ -7,19 +7,32 @@ from django.shortcuts import get_object_or_404
 from datetime import datetime
 from .models import DecisaoAntifraude
 from .notifications import NotificacaoService
+from .paginacao import PaginacaoKeyset
 
 
 @api_view(['GET'])
 def listar_pendentes(request):
     """
-    Lista todas as transações aguardando revisão manual
+    Lista as transações aguardando revisão manual (mais recentes primeiro)
     
-    GET /api/antifraude/revisao/pendentes/
+    GET /api/antifraude/revisao/pendentes/?limit=50&cursor=<proximo_cursor>&total=1
+    
+    Paginação keyset por (created_at, id): repassar proximo_cursor da resposta
+    para a página seguinte (None na última). total=0 omite a contagem.
     """
-    decisoes = DecisaoAntifraude.objects.filter(
+    limite = PaginacaoKeyset.limite(request.GET.get('limit'), 50)
+    
+    query = DecisaoAntifraude.objects.filter(
         decisao='REVISAO',
         revisado_por__isnull=True
-    ).select_related('transacao').order_by('-created_at')
+    )
+    
+    try:
+        decisoes, proximo_cursor = PaginacaoKeyset.paginar(
+            query.select_related('transacao'), 'created_at', request.GET.get('cursor'), limite
+        )
+    except ValueError as e:
+        return Response({'erro': str(e)}, status=400)
     
     resultado = []
     for decisao in decisoes:
@@ -39,8 +52,15 @@ def listar_pendentes(request):
             'created_at': decisao.created_at.isoformat()
         })
     
+    total, total_aproximado = None, False
+    if request.GET.get('total', '1') != '0':
+        total, total_aproximado = PaginacaoKeyset.contar(query)
+    
     return Response({
-        'total': len(resultado),
+        'total': total,
+        'total_aproximado': total_aproximado,
+        'quantidade': len(resultado),
+        'proximo_cursor': proximo_cursor,
         'pendentes': resultado
     })
 
@@ -122,15 +142,25 @@ def reprovar_revisao(request, decisao_id):
 @api_view(['GET'])
 def historico_revisoes(request):
     """
-    Histórico de revisões realizadas
+    Histórico de revisões realizadas (mais recentes primeiro)
     
-    GET /api/antifraude/revisao/historico/?limit=50
+    GET /api/antifraude/revisao/historico/?limit=50&cursor=<proximo_cursor>&total=1
+    
+    Paginação keyset por (revisado_em, id), como em listar_pendentes.
     """
-    limit = int(request.GET.get('limit', 50))
+    limite = PaginacaoKeyset.limite(request.GET.get('limit'), 50)
+    
+    query = DecisaoAntifraude.objects.filter(
+        revisado_por__isnull=False,
+        revisado_em__isnull=False
+    )
     
-    decisoes = DecisaoAntifraude.objects.filter(
-        revisado_por__isnull=False
-    ).select_related('transacao').order_by('-revisado_em')[:limit]
+    try:
+        decisoes, proximo_cursor = PaginacaoKeyset.paginar(
+            query.select_related('transacao'), 'revisado_em', request.GET.get('cursor'), limite
+        )
+    except ValueError as e:
+        return Response({'erro': str(e)}, status=400)
     
     resultado = []
     for decisao in decisoes:
@@ -148,7 +178,14 @@ def historico_revisoes(request):
             'observacao': decisao.observacao_revisao
         })
     
+    total, total_aproximado = None, False
+    if request.GET.get('total', '1') != '0':
+        total, total_aproximado = PaginacaoKeyset.contar(query)
+    
     return Response({
-        'total': len(resultado),
+        'total': total,
+        'total_aproximado': total_aproximado,
+        'quantidade': len(resultado),
+        'proximo_cursor': proximo_cursor,
         'revisoes': resultado
     })
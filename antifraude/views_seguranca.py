@@ -11,6 +11,8 @@ import json
 import logging
 
 from .models import BloqueioSeguranca, AtividadeSuspeita
+from .services_bloqueio import BloqueioService
+from .paginacao import PaginacaoKeyset
 
 logger = logging.getLogger('antifraude.seguranca')
 
@@ -48,34 +50,22 @@ def validate_login(request):
                 'error': 'IP e CPF são obrigatórios'
             }, status=400)
         
-        # Verificar bloqueios ativos
-        bloqueio_ip = BloqueioSeguranca.objects.filter(
-            tipo='ip',
-            valor=ip,
-            ativo=True
-        ).first()
-        
-        bloqueio_cpf = BloqueioSeguranca.objects.filter(
-            tipo='cpf',
-            valor=cpf,
-            ativo=True
-        ).first()
+        # Verificar bloqueios ativos (cache atualizado a cada novo bloqueio)
+        bloqueio = BloqueioService.verificar_login(ip, cpf)
         
         # Se encontrou bloqueio
-        if bloqueio_ip or bloqueio_cpf:
-            bloqueio = bloqueio_ip or bloqueio_cpf
-            
+        if bloqueio:
             logger.warning(
-                f"🚫 Login bloqueado - {bloqueio.tipo.upper()}: {bloqueio.valor} | "
-                f"Portal: {portal} | Motivo: {bloqueio.motivo[:100]}"
+                f"🚫 Login bloqueado - {bloqueio['tipo'].upper()}: {bloqueio['valor']} | "
+                f"Portal: {portal} | Motivo: {bloqueio['motivo'][:100]}"
             )
             
             return JsonResponse({
                 'permitido': False,
                 'bloqueado': True,
-                'tipo': bloqueio.tipo,
-                'motivo': bloqueio.motivo,
-                'bloqueio_id': bloqueio.id,
+                'tipo': bloqueio['tipo'],
+                'motivo': bloqueio['motivo'],
+                'bloqueio_id': bloqueio['id'],
                 'portal': portal
             })
         
@@ -114,7 +104,9 @@ def list_suspicious(request):
     - tipo: login_multiplo, tentativas_falhas, ip_novo, horario_suspeito
     - portal: admin, lojista, vendas, app
     - dias: últimos N dias (padrão: 7)
-    - limit: limite de resultados (padrão: 50)
+    - limit: tamanho da página (padrão: 50, máximo 200)
+    - cursor: proximo_cursor da página anterior (paginação keyset por detectado_em, id)
+    - total: 0 para omitir total/pendentes (contagem limitada a PAGINACAO_CONTAGEM_MAXIMA)
     """
     try:
         # Parâmetros de filtro
@@ -122,7 +114,7 @@ def list_suspicious(request):
         tipo = request.GET.get('tipo')
         portal = request.GET.get('portal')
         dias = int(request.GET.get('dias', 7))
-        limit = int(request.GET.get('limit', 50))
+        limit = PaginacaoKeyset.limite(request.GET.get('limit'), 50)
         
         # Query base
         query = AtividadeSuspeita.objects.all()
@@ -139,8 +131,11 @@ def list_suspicious(request):
         data_limite = datetime.now() - timedelta(days=dias)
         query = query.filter(detectado_em__gte=data_limite)
         
-        # Limitar resultados
-        atividades = query[:limit]
+        # Página (keyset)
+        try:
+            atividades, proximo_cursor = PaginacaoKeyset.paginar(query, 'detectado_em', request.GET.get('cursor'), limit)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
         # Serializar
         resultado = []
@@ -148,7 +143,7 @@ def list_suspicious(request):
             resultado.append({
                 'id': atividade.id,
                 'tipo': atividade.tipo,
-                'tipo_label': dict(atividade.TIPO_CHOICES).get(atividade.tipo),
+                'tipo_label': atividade.tipo_label(),
                 'cpf': atividade.cpf,
                 'cpf_mascarado': f"{atividade.cpf[:3]}***{atividade.cpf[-2:]}",
                 'ip': atividade.ip,
@@ -165,16 +160,21 @@ def list_suspicious(request):
                 'bloqueio_relacionado_id': atividade.bloqueio_relacionado_id
             })
         
-        # Estatísticas
-        total = query.count()
-        pendentes = query.filter(status='pendente').count()
+        # Estatísticas (contagem limitada)
+        total = pendentes = None
+        total_aproximado = False
+        if request.GET.get('total', '1') != '0':
+            total, total_aproximado = PaginacaoKeyset.contar(query)
+            pendentes, _ = PaginacaoKeyset.contar(query.filter(status='pendente'))
         
         logger.info(f"📊 Listagem atividades suspeitas: {total} total, {pendentes} pendentes")
         
         return JsonResponse({
             'success': True,
             'total': total,
+            'total_aproximado': total_aproximado,
             'pendentes': pendentes,
+            'proximo_cursor': proximo_cursor,
             'atividades': resultado,
             'filtros': {
                 'status': status,
@@ -324,7 +324,7 @@ def investigate_activity(request):
             bloqueio = BloqueioSeguranca.objects.create(
                 tipo='ip',
                 valor=atividade.ip,
-                motivo=f"Atividade suspeita detectada: {dict(atividade.TIPO_CHOICES).get(atividade.tipo)}",
+                motivo=f"Atividade suspeita detectada: {atividade.tipo_label()}",
                 bloqueado_por=f"usuario_{usuario_id}" if usuario_id else "sistema",
                 portal=atividade.portal,
                 detalhes={'atividade_id': atividade_id, 'detalhes_atividade': atividade.detalhes}
@@ -340,7 +340,7 @@ def investigate_activity(request):
             bloqueio = BloqueioSeguranca.objects.create(
                 tipo='cpf',
                 valor=atividade.cpf,
-                motivo=f"Atividade suspeita detectada: {dict(atividade.TIPO_CHOICES).get(atividade.tipo)}",
+                motivo=f"Atividade suspeita detectada: {atividade.tipo_label()}",
                 bloqueado_por=f"usuario_{usuario_id}" if usuario_id else "sistema",
                 portal=atividade.portal,
                 detalhes={'atividade_id': atividade_id, 'detalhes_atividade': atividade.detalhes}
@@ -394,11 +394,15 @@ def list_blocks(request):
     - tipo: ip, cpf
     - ativo: true, false
     - dias: últimos N dias
+    - limit: tamanho da página (padrão: 100, máximo 200)
+    - cursor: proximo_cursor da página anterior (paginação keyset por bloqueado_em, id)
+    - total: 0 para omitir o total (contagem limitada a PAGINACAO_CONTAGEM_MAXIMA)
     """
     try:
         tipo = request.GET.get('tipo')
         ativo = request.GET.get('ativo')
         dias = int(request.GET.get('dias', 30))
+        limit = PaginacaoKeyset.limite(request.GET.get('limit'), 100)
         
         query = BloqueioSeguranca.objects.all()
         
@@ -410,7 +414,10 @@ def list_blocks(request):
         data_limite = datetime.now() - timedelta(days=dias)
         query = query.filter(bloqueado_em__gte=data_limite)
         
-        bloqueios = query[:100]
+        try:
+            bloqueios, proximo_cursor = PaginacaoKeyset.paginar(query, 'bloqueado_em', request.GET.get('cursor'), limit)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
         resultado = []
         for bloqueio in bloqueios:
@@ -427,12 +434,66 @@ def list_blocks(request):
                 'desbloqueado_por': bloqueio.desbloqueado_por
             })
         
+        total, total_aproximado = None, False
+        if request.GET.get('total', '1') != '0':
+            total, total_aproximado = PaginacaoKeyset.contar(query)
+        
         return JsonResponse({
             'success': True,
-            'total': query.count(),
+            'total': total,
+            'total_aproximado': total_aproximado,
+            'proximo_cursor': proximo_cursor,
             'bloqueios': resultado
         })
         
     except Exception as e:
         logger.error(f"❌ Erro em list_blocks: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def auth_event(request):
+    """
+    API 6: Recebe eventos de autenticação do app principal
+    
+    Invalida o histórico de autenticação cacheado do CPF para que a próxima
+    análise de risco já considere a falha de login ou o bloqueio.
+    
+    Request:
+    {
+        "cpf": "12345678901",
+        "evento": "login_falha" | "bloqueio" | "desbloqueio"
+    }
+    """
+    try:
+        from .services_cliente_auth import ClienteAutenticacaoService
+        
+        data = json.loads(request.body)
+        cpf = data.get('cpf')
+        evento = data.get('evento')
+        
+        eventos_validos = ['login_falha', 'bloqueio', 'desbloqueio']
+        
+        if not cpf:
+            return JsonResponse({'error': 'CPF é obrigatório'}, status=400)
+        
+        if evento not in eventos_validos:
+            return JsonResponse({'error': f'Evento inválido. Opções: {", ".join(eventos_validos)}'}, status=400)
+        
+        ClienteAutenticacaoService.invalidar_cache(cpf)
+        
+        logger.info(f"🔄 Evento de autenticação recebido - CPF: {cpf[:3]}*** | Evento: {evento}")
+        
+        return JsonResponse({
+            'success': True,
+            'cpf_mascarado': f"{cpf[:3]}***{cpf[-2:]}",
+            'evento': evento,
+            'cache_invalidado': True
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    except Exception as e:
+        logger.error(f"❌ Erro em auth_event: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,130 @@
+"""
+Aquecimento de workers (gunicorn e Celery)
+
+Executado após o fork, antes do worker aceitar requests/tasks:
+- gunicorn: hook post_worker_init (gunicorn.conf.py)
+- Celery: sinal worker_process_init (riskengine/celery.py)
+
+Sem aquecimento, as primeiras análises de cada worker pagam imports tardios,
+abertura de conexões MySQL/Redis, carga de regras/configurações e token OAuth.
+"""
+import importlib
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger('antifraude.warmup')
+
+
+# Módulos importados sob demanda dentro de analisar_transacao
+MODULOS_HOT_PATH = [
+    'antifraude.services',
+    'antifraude.services_maxmind',
+    'antifraude.services_cliente_auth',
+    'antifraude.services_whitelist',
+    'antifraude.services_3ds',
+    'antifraude.notifications',
+    'antifraude.tasks',
+]
+
+# Estado do aquecimento deste processo (exposto no health)
+ESTADO = {
+    'pronto': False,
+    'origem': None,
+    'pid': None,
+    'iniciado_em': None,
+    'duracao_ms': None,
+    'etapas': {},
+    'erros': {},
+}
+
+
+def aquecer(origem: str) -> dict:
+    """
+    Executa todas as etapas de aquecimento (fail-open: erro numa etapa não impede as demais)
+
+    Args:
+        origem: 'gunicorn' ou 'celery'
+
+    Returns:
+        dict: ESTADO atualizado
+    """
+    ESTADO.update({
+        'pronto': False,
+        'origem': origem,
+        'pid': os.getpid(),
+        'iniciado_em': datetime.now().isoformat(),
+        'duracao_ms': None,
+        'etapas': {},
+        'erros': {},
+    })
+
+    inicio = time.perf_counter()
+
+    for nome, etapa in ETAPAS:
+        inicio_etapa = time.perf_counter()
+        try:
+            etapa()
+        except Exception as e:
+            ESTADO['erros'][nome] = str(e)
+            logger.warning(f"⚠️ Warm-up {origem}: etapa '{nome}' falhou: {str(e)}")
+        ESTADO['etapas'][nome] = int((time.perf_counter() - inicio_etapa) * 1000)
+
+    ESTADO['duracao_ms'] = int((time.perf_counter() - inicio) * 1000)
+    ESTADO['pronto'] = True
+
+    logger.info(
+        f"🔥 Warm-up {origem} (pid {ESTADO['pid']}) concluído em {ESTADO['duracao_ms']}ms - "
+        f"{ESTADO['etapas']}"
+    )
+    return ESTADO
+
+
+def _importar_modulos():
+    for modulo in MODULOS_HOT_PATH:
+        importlib.import_module(modulo)
+
+
+def _conectar_banco():
+    from django.db import connection
+
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _conectar_redis():
+    from django.core.cache import cache
+
+    cache.get('warmup:ping')
+
+
+def _carregar_snapshots():
+    from .models import RegraAntifraude
+    from .models_config import ConfiguracaoAntifraude
+
+    RegraAntifraude.regras_ativas()
+    ConfiguracaoAntifraude.carregar_snapshot()
+
+
+def _carregar_tabela_bin():
+    from .services_3ds import TabelaBin
+
+    TabelaBin.garantir_carregada()
+
+
+def _obter_token_oauth():
+    from .services_cliente_auth import ClienteAutenticacaoService
+
+    ClienteAutenticacaoService._obter_token()
+
+
+ETAPAS = [
+    ('imports', _importar_modulos),
+    ('banco', _conectar_banco),
+    ('redis', _conectar_redis),
+    ('snapshots', _carregar_snapshots),
+    ('tabela_bin', _carregar_tabela_bin),
+    ('token_oauth', _obter_token_oauth),
+]
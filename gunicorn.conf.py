@@ -0,0 +1,15 @@
+"""
+Configuração gunicorn do Risk Engine
+Uso: gunicorn riskengine.wsgi:application -c gunicorn.conf.py
+"""
+bind = '0.0.0.0:8004'
+workers = 2
+timeout = 120
+
+
+def post_worker_init(worker):
+    """Aquece o worker antes de aceitar requests (imports, conexões, snapshots, token OAuth)"""
+    from antifraude.warmup import aquecer
+
+    estado = aquecer(origem='gunicorn')
+    worker.log.info(f"Worker {worker.pid} pronto após warm-up de {estado['duracao_ms']}ms")
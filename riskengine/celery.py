@@ -5,6 +5,7 @@ Sistema de Atividades Suspeitas - Semana 23
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riskengine.settings')
 
@@ -13,6 +14,13 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def aquecer_worker(**kwargs):
+    """Aquece cada processo do pool antes de consumir tasks"""
+    from antifraude.warmup import aquecer
+    aquecer(origem='celery')
+
+
 # Configuração de tarefas periódicas
 app.conf.beat_schedule = {
     'detectar-atividades-suspeitas': {
@@ -25,6 +33,16 @@ app.conf.beat_schedule = {
         'schedule': 600.0,  # A cada 10 minutos
         'options': {'expires': 540}
     },
+    'agregar-decisoes-hora': {
+        'task': 'antifraude.tasks.agregar_decisoes_hora',
+        'schedule': 300.0,  # A cada 5 minutos
+        'options': {'expires': 240}
+    },
+    'podar-rollups': {
+        'task': 'antifraude.tasks.podar_rollups',
+        'schedule': 3600.0,  # A cada hora
+        'options': {'expires': 3000}
+    },
 }
 
 app.conf.timezone = 'America/Sao_Paulo'
@@ -78,6 +78,10 @@ if not db_config:
 
 DATABASES = {'default': db_config}
 
+# Conexões persistentes: a conexão aberta no warm-up do worker é reaproveitada pelos requests
+DATABASES['default'].setdefault('CONN_MAX_AGE', int(os.environ.get('DB_CONN_MAX_AGE', '60')))
+DATABASES['default'].setdefault('CONN_HEALTH_CHECKS', True)
+
 # Cache (Redis compartilhado)
 CACHES = {
     'default': {
@@ -132,6 +136,11 @@ SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL', '')
 _maxmind_config = config_manager.get_maxmind_config()
 MAXMIND_ACCOUNT_ID = _maxmind_config.get('account_id')
 MAXMIND_LICENSE_KEY = _maxmind_config.get('license_key')
+# Sobrescrever apenas para apontar para upstream simulado (antifraude/simuladores.py)
+MAXMIND_API_URL = os.environ.get('MAXMIND_API_URL', 'https://minfraud.maxmind.com/minfraud/v2.0/score')
+
+# Histórico de autenticação (wallclub_django)
+CLIENTE_AUTH_BASE_URL = os.environ.get('CLIENTE_AUTH_BASE_URL', 'http://wallclub-prod-release300:8003')
 
 # 3D Secure 2.0 (Semana 13)
 THREEDS_ENABLED = os.environ.get('THREEDS_ENABLED', 'False') == 'True'
@@ -139,6 +148,23 @@ THREEDS_GATEWAY_URL = os.environ.get('THREEDS_GATEWAY_URL', None)
 THREEDS_MERCHANT_ID = os.environ.get('THREEDS_MERCHANT_ID', None)
 THREEDS_MERCHANT_KEY = os.environ.get('THREEDS_MERCHANT_KEY', None)
 THREEDS_TIMEOUT = int(os.environ.get('THREEDS_TIMEOUT', '30'))
+THREEDS_ASSINCRONO = os.environ.get('THREEDS_ASSINCRONO', 'True') == 'True'
+# Hosts aceitos em callback_url_3ds (separados por vírgula; vazio = nenhum callback)
+THREEDS_CALLBACK_HOSTS = [h for h in os.environ.get('THREEDS_CALLBACK_HOSTS', '').split(',') if h.strip()]
+
+# Leitura de novidade de IP/dispositivo via VinculoCpfEntidade (ligar após backfill_vinculos_cpf)
+VINCULOS_LEITURA_ATIVA = os.environ.get('VINCULOS_LEITURA_ATIVA', 'False') == 'True'
+
+# Leitura das regras de velocidade/localização e do dashboard via RollupTransacao (ligar após backfill_rollups)
+ROLLUPS_LEITURA_ATIVA = os.environ.get('ROLLUPS_LEITURA_ATIVA', 'False') == 'True'
+
+# Acionamentos de regras do dashboard via RegraAcionada (ligar após backfill_regras_acionadas)
+REGRAS_ACIONADAS_LEITURA_ATIVA = os.environ.get('REGRAS_ACIONADAS_LEITURA_ATIVA', 'False') == 'True'
+
+# Detecção em tempo real via Redis Streams (antifraude/streaming.py)
+DETECCAO_STREAM_ATIVA = os.environ.get('DETECCAO_STREAM_ATIVA', 'False') == 'True'
+DETECCAO_STREAM_PARTICOES = int(os.environ.get('DETECCAO_STREAM_PARTICOES', '4'))
+DETECCAO_STREAM_MAXLEN = int(os.environ.get('DETECCAO_STREAM_MAXLEN', '100000'))
 
 # Celery Configuration (Containers separados)
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', f"redis://{os.environ.get('REDIS_HOST', 'redis')}:{os.environ.get('REDIS_PORT', '6379')}/0")
@@ -150,3 +176,10 @@ CELERY_TIMEZONE = 'America/Sao_Paulo'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutos
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000  # Restart worker após 1000 tasks
+
+# Detectores de atividades suspeitas em fila própria (worker dedicado no supervisord)
+CELERY_TASK_ROUTES = {
+    'antifraude.tasks.detectar_atividades_suspeitas': {'queue': 'deteccao'},
+    'antifraude.tasks.executar_detector': {'queue': 'deteccao'},
+    'antifraude.tasks.consolidar_deteccoes': {'queue': 'deteccao'},
+}